@@ -0,0 +1,295 @@
+"""
+Round-trip and latency benchmark for the NDVI API against the simulated Earth Engine.
+
+Runs /ndvi-tiles/ (and /ndvi-anomaly/) scenarios in process (FastAPI TestClient) with EE_PROVIDER=simulated,
+so no account or network is needed, and reports for each scenario the Earth Engine
+round trips per request, p50/p99 latency and throughput.
+
+Round trips are deterministic, unlike latency, so they are compared with the
+baseline in benchmark_baseline.json: the script exits with status 1 if any
+scenario makes more round trips per request than its baseline (or a request
+fails), which makes it usable as a build step. test_benchmark.py runs the
+same comparison as part of the pytest suite.
+
+With --max-concurrent the simulated Earth Engine rejects round trips beyond
+that many at once, like the service's concurrency quota, to exercise the
+scheduler's backoff and retries. Retries make round trips timing dependent, so
+they aren't compared with the baseline then, but failed requests still are.
+
+Usage:
+  python benchmark.py [--requests N] [--latency SECONDS] [--scenario NAME] [--max-concurrent N] [--json PATH] [--update-baseline]
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+START_DATE = "2024-01-01"
+END_DATE = "2024-07-01"
+
+# Requests per round in the concurrent and burst scenarios; the baseline was measured with it
+DEFAULT_CONCURRENCY = 8
+
+def field_polygon(index, size=0.01):
+    """
+    A square field of about 1 x 1 km, offset by index so every field is distinct.
+    """
+    west = 5.0 + (index % 40) * 0.05
+    south = 52.0 + (index // 40) * 0.05
+    return {
+        "type": "Polygon",
+        "coordinates": [[[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]]
+    }
+
+def ndvi_request(index, **options):
+    body = {"polygon": field_polygon(index), "start_date": START_DATE, "end_date": END_DATE, "time_series": False}
+    body.update(options)
+    return ("/ndvi-tiles/", body)
+
+FULL_OPTIONS = {"time_series": True, "include_weather": True, "include_topography": True, "include_landcover": True}
+
+def scenario_requests(name, count, concurrency):
+    """
+    Get a scenario's requests: (path, JSON body) tuples, each list being one concurrent round.
+
+    Every scenario uses its own field indices, so results cached by one don't serve another.
+    """
+    offset = {"composite": 1000, "full": 2000, "cached": 3000, "concurrent": 4000, "date_tile": 5000, "batch": 6000, "burst": 7000, "anomaly": 8000}[name]
+    if name == "composite":
+        return [[ndvi_request(offset + i)] for i in range(count)]
+    if name == "full":
+        return [[ndvi_request(offset + i, **FULL_OPTIONS)] for i in range(count)]
+    if name == "cached":
+        return [[ndvi_request(offset, **FULL_OPTIONS)] for _ in range(count)]
+    if name == "concurrent":
+        # Identical requests arriving together share one computation
+        return [[ndvi_request(offset + i, **FULL_OPTIONS)] * concurrency for i in range(count)]
+    if name == "burst":
+        # Distinct requests arriving together all need Earth Engine at once
+        return [[ndvi_request(offset + i * concurrency + j, **FULL_OPTIONS) for j in range(concurrency)] for i in range(count)]
+    if name == "date_tile":
+        return [[("/ndvi-tiles/date/", {"polygon": field_polygon(offset), "date": f"2024-05-{i % 28 + 1:02d}"})] for i in range(count)]
+    if name == "anomaly":
+        # Monthly windows of one field: the first builds the climatology, the others reuse it
+        return [[("/ndvi-anomaly/", {
+            "polygon": field_polygon(offset),
+            "start_date": f"2024-{i % 12 + 1:02d}-01",
+            "end_date": f"2024-{i % 12 + 2:02d}-01" if i % 12 < 11 else "2025-01-01"
+        })] for i in range(count)]
+    if name == "batch":
+        return [[("/ndvi-tiles/batch/", {
+            "fields": {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "properties": {"field_id": f"field-{j}"}, "geometry": field_polygon(offset + i * 10 + j)}
+                    for j in range(10)
+                ]
+            },
+            "start_date": START_DATE,
+            "end_date": END_DATE,
+            "time_series": True
+        })] for i in range(count)]
+    raise KeyError(name)
+
+SCENARIOS = {
+    "composite": "NDVI composite tile only, distinct fields",
+    "full": "All sections (time series, weather, topography, land cover), distinct fields",
+    "cached": "The same full request repeated (result cache)",
+    "concurrent": "Identical full requests arriving together (coalescing)",
+    "date_tile": "Per-date tile URLs for one field",
+    "batch": "10 fields with time series in one batch request",
+    "burst": "Distinct full requests arriving together (scheduler under load)",
+    "anomaly": "Monthly anomaly windows of one field (stored climatology)"
+}
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def run_scenario(client, ee_client, name, count, concurrency):
+    rounds = scenario_requests(name, count, concurrency)
+    if name == "cached":
+        # Fill the cache first; only the repeats are measured
+        path, body = rounds[0][0]
+        client.post(path, json=body)
+
+    latencies = []
+    failures = []
+
+    def send(request):
+        path, body = request
+        started = time.perf_counter()
+        response = client.post(path, json=body)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            failures.append(f"{path} returned {response.status_code}: {response.text[:200]}")
+
+    before = ee_client.round_trips()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for requests in rounds:
+            list(executor.map(send, requests))
+    elapsed = time.perf_counter() - started
+    after = ee_client.round_trips()
+
+    calls = {call: after.get(call, 0) - before.get(call, 0) for call in after}
+    request_count = sum(len(requests) for requests in rounds)
+    return {
+        "requests": request_count,
+        "round_trips": sum(calls.values()),
+        "round_trips_per_request": round(sum(calls.values()) / request_count, 4),
+        "round_trips_by_call": calls,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "requests_per_second": round(request_count / elapsed, 2),
+        "failures": failures
+    }
+
+def configure_environment(work_dir, latency=0.05, jitter=0.2, max_concurrent=None):
+    """
+    Point the app at the simulated Earth Engine, with its stores in work_dir.
+
+    The app reads its configuration at import, so this has to run before main is imported.
+    """
+    os.environ.update({
+        "EE_PROVIDER": "simulated",
+        "SIMULATED_EE_LATENCY_SECONDS": str(latency),
+        "SIMULATED_EE_LATENCY_JITTER": str(jitter),
+        "RESULT_CACHE_BACKEND": "memory",
+        "NDVI_HISTORY_PATH": os.path.join(work_dir, "ndvi_history.sqlite3"),
+        "CLIMATOLOGY_PATH": os.path.join(work_dir, "climatology.sqlite3"),
+        "CATALOG_ENABLED": "false",
+        "TILE_CACHE_DIR": os.path.join(work_dir, "tiles")
+    })
+    if max_concurrent:
+        os.environ["SIMULATED_EE_MAX_CONCURRENT"] = str(max_concurrent)
+        # Retry quickly so a run doesn't take minutes
+        os.environ.setdefault("EE_RETRY_BASE_SECONDS", str(max(latency, 0.01)))
+        os.environ.setdefault("EE_MAX_RETRIES", "8")
+
+def wait_for_earth_engine(api, timeout=30):
+    """
+    Wait for the app's background initialization of the simulated Earth Engine.
+
+    Returns:
+        bool: Whether it initialized in time
+    """
+    deadline = time.time() + timeout
+    while not api.ee_initialized:
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def warm_up(client):
+    # Static layer tile URLs are minted once per process; mint them before measuring
+    path, body = ndvi_request(0, **FULL_OPTIONS)
+    client.post(path, json=body)
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def baseline_regression(name, result, baseline):
+    """
+    Describe how a scenario's round trips exceed its baseline, or return None if they don't.
+    """
+    expected = baseline.get(name, {}).get("round_trips_per_request")
+    if expected is not None and result["round_trips_per_request"] > expected + 1e-9:
+        return f"{name}: {result['round_trips_per_request']} round trips per request, baseline {expected}"
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10, help="Requests (or concurrent rounds) per scenario")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requests per round in the concurrent and burst scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated latency of every round trip in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative random variation of the latency")
+    parser.add_argument("--max-concurrent", type=int, help="Simulated Earth Engine concurrency quota (unlimited by default)")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only this scenario (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline round trips per request")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the measured round trips as the new baseline")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # The app reads its configuration at import, so the environment is set up first
+    work_dir = tempfile.mkdtemp(prefix="ndvi-benchmark-")
+    configure_environment(work_dir, args.latency, args.jitter, args.max_concurrent)
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+
+    from fastapi.testclient import TestClient
+    import main as api
+
+    results = {}
+    with TestClient(api.app) as client:
+        if not wait_for_earth_engine(api):
+            print("Simulated Earth Engine did not initialize", file=sys.stderr)
+            return 1
+        warm_up(client)
+
+        for name in args.scenario or SCENARIOS:
+            results[name] = run_scenario(client, api.ee, name, args.requests, args.concurrency)
+        scheduler = api.ee_scheduler.snapshot()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = load_baseline(args.baseline)
+
+    print(f"{'scenario':<12} {'requests':>8} {'round trips':>11} {'per request':>11} {'baseline':>8} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    problems = []
+    for name, result in results.items():
+        expected = baseline.get(name, {}).get("round_trips_per_request")
+        print(
+            f"{name:<12} {result['requests']:>8} {result['round_trips']:>11} {result['round_trips_per_request']:>11.2f} "
+            f"{expected if expected is not None else '-':>8} {result['p50_ms']:>8} {result['p99_ms']:>8} {result['requests_per_second']:>8}"
+        )
+        problems.extend(f"{name}: {failure}" for failure in result["failures"])
+        regression = baseline_regression(name, result, baseline)
+        if regression is not None and not args.max_concurrent:
+            problems.append(regression)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latency_seconds": args.latency, "max_concurrent": args.max_concurrent, "scenarios": results, "scheduler": scheduler}, f, indent=2)
+
+    print(
+        f"\nEarth Engine scheduler: limit {scheduler['limit']}, {scheduler['calls']} calls, "
+        f"{scheduler['throttled']} throttled, {scheduler['retries']} retries, {scheduler['rejected']} rejected"
+    )
+
+    if args.update_baseline and args.max_concurrent:
+        print("Not updating the baseline: round trips include retries with --max-concurrent", file=sys.stderr)
+        return 1
+    if args.update_baseline:
+        baseline.update({
+            name: {"round_trips_per_request": result["round_trips_per_request"], "description": SCENARIOS[name]}
+            for name, result in results.items()
+        })
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if problems:
+        print("\nRegressions:", file=sys.stderr)
+        for problem in problems:
+            print(f"  {problem}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
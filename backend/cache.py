@@ -0,0 +1,267 @@
+"""
+Result cache for the TensorFarm NDVI API.
+
+Responses are keyed on a canonical hash of the request polygon plus the other
+request parameters, so the same field drawn with a different starting vertex,
+winding order or floating point noise maps to the same entry.
+
+Two backends are available:
+  - MemoryCacheBackend: per-process LRU dictionary
+  - SQLiteCacheBackend: on-disk LRU table that every uvicorn worker on the host shares
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Coordinates are rounded to ~10 cm so re-drawn copies of the same field share a key
+COORDINATE_PRECISION = 6
+
+def normalize_ring(ring):
+    """
+    Normalize a polygon ring so equivalent rings compare equal.
+
+    The ring is rounded, deduplicated, oriented counter-clockwise and rotated to
+    start at its smallest vertex.
+
+    Args:
+        ring (list): List of [lng, lat] positions
+
+    Returns:
+        list: Closed, normalized list of [lng, lat] positions
+    """
+    # Adding 0.0 turns -0.0 (noise just below zero) into 0.0, which serializes differently
+    points = [[round(float(p[0]), COORDINATE_PRECISION) + 0.0, round(float(p[1]), COORDINATE_PRECISION) + 0.0] for p in ring]
+
+    # Drop the closing position and any repeated consecutive vertices
+    deduplicated = []
+    for point in points:
+        if not deduplicated or point != deduplicated[-1]:
+            deduplicated.append(point)
+    if len(deduplicated) > 1 and deduplicated[0] == deduplicated[-1]:
+        deduplicated.pop()
+
+    if not deduplicated:
+        return []
+
+    # Shoelace formula: a negative signed area means the ring is clockwise
+    signed_area = sum(
+        a[0] * b[1] - b[0] * a[1]
+        for a, b in zip(deduplicated, deduplicated[1:] + deduplicated[:1])
+    )
+    if signed_area < 0:
+        deduplicated.reverse()
+
+    # Start from the smallest vertex
+    start = deduplicated.index(min(deduplicated))
+    normalized = deduplicated[start:] + deduplicated[:start]
+    return normalized + [normalized[0]]
+
+def polygon_cache_key(polygon_geojson, params):
+    """
+    Build a canonical cache key for a polygon and request parameters.
+
+    Args:
+        polygon_geojson (dict): GeoJSON polygon object
+        params (dict): The remaining request parameters
+
+    Returns:
+        str: SHA-256 hex digest identifying the request
+
+    Raises:
+        ValueError: If the coordinates are not a list of rings
+    """
+    coordinates = polygon_geojson.get("coordinates", [])
+    if not isinstance(coordinates, list) or not all(isinstance(ring, list) for ring in coordinates):
+        raise ValueError("Polygon coordinates must be a list of rings")
+    rings = [normalize_ring(ring) for ring in coordinates]
+    canonical = json.dumps(
+        {"type": polygon_geojson.get("type"), "coordinates": rings, "params": params},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache with per-entry expiry.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteCacheBackend:
+    """
+    On-disk LRU cache shared by every process that opens the same database file.
+    """
+
+    def __init__(self, path, max_entries=4096):
+        self.path = path
+        self.max_entries = max_entries
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            # WAL lets readers in other workers proceed while one worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the backend safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now)
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+class ResultCache:
+    """
+    TTL cache for API responses with hit/miss counters.
+
+    Args:
+        backend: MemoryCacheBackend or SQLiteCacheBackend
+        ttl (float): Seconds an entry stays valid
+    """
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Result cache read failed: {e}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.backend.set(key, value, self.ttl if ttl is None else ttl)
+        except Exception as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "max_entries": self.backend.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else None
+        }
+
+def create_result_cache(backend_name, ttl, max_entries, path=None):
+    """
+    Create a result cache from configuration values.
+
+    Args:
+        backend_name (str): "memory" or "sqlite"
+        ttl (float): Seconds an entry stays valid
+        max_entries (int): LRU size limit
+        path (str): Database file for the SQLite backend
+
+    Returns:
+        ResultCache: The configured cache
+    """
+    if backend_name.lower() == "sqlite":
+        backend = SQLiteCacheBackend(path or "cache/results.sqlite3", max_entries=max_entries)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries)
+    return ResultCache(backend, ttl)
@@ -0,0 +1,380 @@
+"""
+Precomputed monthly and seasonal NDVI composites for registered fields.
+
+A past period's median composite never changes, so for registered fields the
+catalog computes each monthly and seasonal composite once, and stores its
+summary statistics and tile URL in SQLite. A background scheduler:
+  - backfills periods that haven't been computed yet,
+  - recomputes the current (still open) periods periodically,
+  - renews tile URLs that are about to expire, for recently used periods.
+
+Periods are [start, end) date ranges. Seasons are meteorological: DJF (labelled
+with the year of its December), MAM, JJA and SON.
+
+The catalog doesn't talk to Earth Engine itself; the scheduler is given the
+functions that compute a composite and mint a tile URL.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+PERIOD_TYPES = ("month", "season")
+
+SEASONS = (("DJF", 12), ("MAM", 3), ("JJA", 6), ("SON", 9))
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def period_containing(day, period_type):
+    """
+    Get the period that contains a date.
+
+    Returns:
+        tuple: (period label, start date, end date), dates as ISO strings
+    """
+    if period_type == "month":
+        start = date(day.year, day.month, 1)
+        return start.strftime("%Y-%m"), start.isoformat(), _add_months(start, 1).isoformat()
+
+    if period_type == "season":
+        # Seasons start in December, March, June and September
+        months_since = (day.month - 12) % 3
+        start = _add_months(date(day.year, day.month, 1), -months_since)
+        name = next(name for name, month in SEASONS if month == start.month)
+        return f"{start.year}-{name}", start.isoformat(), _add_months(start, 3).isoformat()
+
+    raise ValueError(f"Unknown period type: {period_type}")
+
+def periods_between(start_date, end_date, period_type):
+    """
+    Get every period overlapping [start_date, end_date).
+
+    Args:
+        start_date (str): ISO date (inclusive)
+        end_date (str): ISO date (exclusive)
+        period_type (str): "month" or "season"
+
+    Returns:
+        list: (period label, start, end) tuples in date order
+    """
+    periods = []
+    day = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    while day < end:
+        period = period_containing(day, period_type)
+        periods.append(period)
+        day = date.fromisoformat(period[2])
+    return periods
+
+class CompositeCatalog:
+    """
+    SQLite store of registered fields and their periodic composites.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fields ("
+                " field_id TEXT PRIMARY KEY,"
+                " name TEXT,"
+                " polygon TEXT NOT NULL,"
+                " satellite_source TEXT NOT NULL,"
+                " history_start TEXT NOT NULL,"
+                " period_types TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS composites ("
+                " field_id TEXT NOT NULL,"
+                " period_type TEXT NOT NULL,"
+                " period TEXT NOT NULL,"
+                " start_date TEXT NOT NULL,"
+                " end_date TEXT NOT NULL,"
+                " stats TEXT,"
+                " tile_url TEXT,"
+                " tile_expires_at REAL NOT NULL DEFAULT 0,"
+                " computed_at REAL NOT NULL,"
+                " final INTEGER NOT NULL,"
+                " last_accessed REAL NOT NULL DEFAULT 0,"
+                " error TEXT,"
+                " PRIMARY KEY (field_id, period_type, period))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS composites_range ON composites (field_id, start_date, end_date)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the catalog safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register_field(self, field_id, polygon, satellite_source, history_start, period_types, name=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fields"
+                " (field_id, name, polygon, satellite_source, history_start, period_types, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, COALESCE((SELECT created_at FROM fields WHERE field_id = ?), ?))",
+                (field_id, name, json.dumps(polygon), satellite_source, history_start,
+                 json.dumps(list(period_types)), field_id, time.time())
+            )
+        return self.get_field(field_id)
+
+    def _field_from_row(self, row):
+        return {
+            "field_id": row["field_id"],
+            "name": row["name"],
+            "polygon": json.loads(row["polygon"]),
+            "satellite_source": row["satellite_source"],
+            "history_start": row["history_start"],
+            "period_types": json.loads(row["period_types"]),
+            "created_at": row["created_at"]
+        }
+
+    def get_field(self, field_id):
+        """
+        Raises:
+            KeyError: If the field isn't registered
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM fields WHERE field_id = ?", (field_id,)).fetchone()
+        if row is None:
+            raise KeyError(field_id)
+        return self._field_from_row(row)
+
+    def list_fields(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM fields ORDER BY created_at").fetchall()
+        return [self._field_from_row(row) for row in rows]
+
+    def delete_field(self, field_id):
+        """
+        Raises:
+            KeyError: If the field isn't registered
+        """
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM fields WHERE field_id = ?", (field_id,)).rowcount
+            conn.execute("DELETE FROM composites WHERE field_id = ?", (field_id,))
+        if not deleted:
+            raise KeyError(field_id)
+
+    def _composite_from_row(self, row):
+        return {
+            "period_type": row["period_type"],
+            "period": row["period"],
+            "start_date": row["start_date"],
+            "end_date": row["end_date"],
+            "stats": json.loads(row["stats"]) if row["stats"] else None,
+            "tile_url": row["tile_url"],
+            "tile_expires_at": row["tile_expires_at"],
+            "computed_at": row["computed_at"],
+            "final": bool(row["final"]),
+            "last_accessed": row["last_accessed"],
+            "error": row["error"]
+        }
+
+    def save_composite(self, field_id, period_type, period, start_date, end_date, stats, tile_url,
+                       tile_expires_at, final, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO composites"
+                " (field_id, period_type, period, start_date, end_date, stats, tile_url, tile_expires_at,"
+                "  computed_at, final, last_accessed, error)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?,"
+                "  COALESCE((SELECT last_accessed FROM composites WHERE field_id = ? AND period_type = ? AND period = ?), 0), ?)",
+                (field_id, period_type, period, start_date, end_date, json.dumps(stats) if stats is not None else None,
+                 tile_url, tile_expires_at, time.time(), int(final), field_id, period_type, period, error)
+            )
+
+    def renew_tile_url(self, field_id, period_type, period, tile_url, tile_expires_at):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE composites SET tile_url = ?, tile_expires_at = ?"
+                " WHERE field_id = ? AND period_type = ? AND period = ?",
+                (tile_url, tile_expires_at, field_id, period_type, period)
+            )
+
+    def composites(self, field_id, period_type=None, start_date=None, end_date=None, touch=True):
+        """
+        Get a field's composites, optionally filtered by period type and overlapping date range.
+        """
+        query = "SELECT * FROM composites WHERE field_id = ?"
+        params = [field_id]
+        if period_type is not None:
+            query += " AND period_type = ?"
+            params.append(period_type)
+        if start_date is not None:
+            query += " AND end_date > ?"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND start_date < ?"
+            params.append(end_date)
+        query += " ORDER BY start_date, period_type"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+            if touch and rows:
+                conn.execute(
+                    f"UPDATE composites SET last_accessed = ? WHERE field_id = ? AND period IN ({','.join('?' * len(rows))})",
+                    [time.time(), field_id] + [row["period"] for row in rows]
+                )
+        return [self._composite_from_row(row) for row in rows]
+
+    def find_composite(self, field_id, start_date, end_date):
+        """
+        Get the final composite covering exactly [start_date, end_date), or None.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM composites WHERE field_id = ? AND start_date = ? AND end_date = ?"
+                " AND final = 1 AND error IS NULL",
+                (field_id, start_date, end_date)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE composites SET last_accessed = ? WHERE field_id = ? AND period_type = ? AND period = ?",
+                    (time.time(), field_id, row["period_type"], row["period"])
+                )
+        return self._composite_from_row(row) if row is not None else None
+
+    def stats(self):
+        with self._connect() as conn:
+            fields = conn.execute("SELECT COUNT(*) FROM fields").fetchone()[0]
+            composites = conn.execute("SELECT COUNT(*) FROM composites").fetchone()[0]
+        return {"fields": fields, "composites": composites}
+
+class CatalogScheduler:
+    """
+    Background thread that keeps the catalog's composites and tile URLs current.
+
+    Args:
+        catalog (CompositeCatalog): The catalog
+        compute (callable): compute(polygon, satellite_source, start, end) -> (stats, tile_url or None if no scenes)
+        mint_tile_url (callable): mint_tile_url(polygon, satellite_source, start, end) -> tile_url
+        tile_url_ttl (float): Seconds a minted tile URL stays usable
+        settle_days (int): Days after a period's end before it is final
+        refresh_interval (float): Seconds between scheduler passes
+        current_refresh_seconds (float): How often open periods are recomputed
+        renew_accessed_within (float): Only renew tile URLs of periods used within this many seconds
+        ready (callable): Optional; passes are skipped while it returns False (e.g. Earth Engine not initialized)
+    """
+
+    def __init__(self, catalog, compute, mint_tile_url, tile_url_ttl, settle_days=5, refresh_interval=3600,
+                 current_refresh_seconds=6 * 3600, renew_accessed_within=7 * 24 * 3600, ready=None):
+        self.catalog = catalog
+        self.compute = compute
+        self.mint_tile_url = mint_tile_url
+        self.tile_url_ttl = tile_url_ttl
+        self.settle_days = settle_days
+        self.refresh_interval = refresh_interval
+        self.current_refresh_seconds = current_refresh_seconds
+        self.renew_accessed_within = renew_accessed_within
+        self.ready = ready
+        self.last_run = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="composite-catalog", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """
+        Run a pass now, e.g. after a field was registered.
+        """
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self.ready is None or self.ready():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"Composite catalog pass failed: {e}")
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def is_final(self, end_date, today=None):
+        today = today or date.today()
+        return (today - date.fromisoformat(end_date)).days >= self.settle_days
+
+    def run_once(self, today=None):
+        """
+        Compute missing and open composites and renew expiring tile URLs for every field.
+
+        Returns:
+            dict: Counts of computed, refreshed and renewed composites
+        """
+        today = today or date.today()
+        now = time.time()
+        counts = {"computed": 0, "refreshed": 0, "renewed": 0, "failed": 0}
+
+        for field in self.catalog.list_fields():
+            if self._stop.is_set():
+                break
+            existing = {
+                (c["period_type"], c["period"]): c
+                for c in self.catalog.composites(field["field_id"], touch=False)
+            }
+            tomorrow = date.fromordinal(today.toordinal() + 1).isoformat()
+
+            for period_type in field["period_types"]:
+                for period, start, end in periods_between(field["history_start"], tomorrow, period_type):
+                    composite = existing.get((period_type, period))
+                    if composite is None or composite["error"]:
+                        action = "computed"
+                    elif not composite["final"] and now - composite["computed_at"] > self.current_refresh_seconds:
+                        action = "refreshed"
+                    elif composite["tile_url"] and composite["tile_expires_at"] <= now + self.refresh_interval and (
+                        not composite["final"] or now - composite["last_accessed"] < self.renew_accessed_within
+                    ):
+                        action = "renewed"
+                    else:
+                        continue
+
+                    try:
+                        if action == "renewed":
+                            tile_url = self.mint_tile_url(field["polygon"], field["satellite_source"], start, end)
+                            self.catalog.renew_tile_url(field["field_id"], period_type, period, tile_url, time.time() + self.tile_url_ttl)
+                        else:
+                            stats, tile_url = self.compute(field["polygon"], field["satellite_source"], start, end)
+                            self.catalog.save_composite(
+                                field["field_id"], period_type, period, start, end, stats, tile_url,
+                                time.time() + self.tile_url_ttl, self.is_final(end, today)
+                            )
+                        counts[action] += 1
+                    except Exception as e:
+                        logger.error(f"Composite {field['field_id']} {period} failed: {e}")
+                        counts["failed"] += 1
+                        if action != "renewed":
+                            self.catalog.save_composite(
+                                field["field_id"], period_type, period, start, end, None, None, 0, False, error=str(e)
+                            )
+
+        self.last_run = {"finished_at": time.time(), **counts}
+        if any(counts.values()):
+            logger.info(f"Composite catalog pass: {counts}")
+        return counts
@@ -0,0 +1,173 @@
+"""
+Per-field NDVI climatology for anomaly detection.
+
+A climatology summarizes several years of a field's NDVI observations by day
+of year: for every day, the mean and standard deviation of the observations
+within window_days of it in any baseline year. Observations are sparse (a clear
+scene every few days at best), so the window pools enough of them for a stable
+estimate, and it wraps around the turn of the year.
+
+Baseline years are in the past and don't change, so a climatology is computed
+once and stored in SQLite per field fingerprint, sensor and baseline. Later
+anomaly requests only fetch the current window's observations and compare
+them with the stored climatology.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Days of year of a non-leap year; February 29 counts as February 28
+DAYS_IN_YEAR = 365
+
+# Days with fewer baseline observations within the window have no climatology
+MIN_BASELINE_OBSERVATIONS = int(os.environ.get("CLIMATOLOGY_MIN_OBSERVATIONS", 3))
+
+# Lower bound of the standard deviation, so z-scores of a very stable baseline don't explode
+MIN_BASELINE_STD = float(os.environ.get("CLIMATOLOGY_MIN_STD", 0.01))
+
+def day_of_year(iso_date):
+    """
+    Get the day of year (1-365) of an ISO date, counted as in a non-leap year.
+    """
+    day = date.fromisoformat(iso_date)
+    # Days after February are shifted back in leap years so the same calendar day always matches
+    return date(2001, day.month, min(day.day, 28) if day.month == 2 else day.day).timetuple().tm_yday
+
+def build_climatology(observations, window_days=15):
+    """
+    Compute the day-of-year mean and standard deviation of baseline observations.
+
+    Args:
+        observations (list): Dicts with "date" and "ndvi"
+        window_days (int): Observations up to this many days before or after a day are pooled for it
+
+    Returns:
+        dict: "window_days", "observation_count" and "mean", "std" and "count" lists
+            indexed by day of year - 1 (mean and std are None for days without enough observations)
+    """
+    # Imported here so loading the API doesn't import NumPy before an anomaly is requested
+    import numpy as np
+
+    days = np.array([day_of_year(o["date"]) for o in observations], dtype=np.int32)
+    values = np.array([o["ndvi"] for o in observations], dtype=np.float64)
+
+    means, stds, counts = [], [], []
+    for day in range(1, DAYS_IN_YEAR + 1):
+        # Circular distance, so late December observations count for early January
+        distance = np.abs(days - day)
+        distance = np.minimum(distance, DAYS_IN_YEAR - distance)
+        pooled = values[distance <= window_days]
+
+        counts.append(int(pooled.size))
+        if pooled.size < MIN_BASELINE_OBSERVATIONS:
+            means.append(None)
+            stds.append(None)
+            continue
+        means.append(float(pooled.mean()))
+        stds.append(max(float(pooled.std(ddof=1)), MIN_BASELINE_STD))
+
+    return {
+        "window_days": window_days,
+        "observation_count": int(values.size),
+        "mean": means,
+        "std": stds,
+        "count": counts
+    }
+
+def climatology_at(climatology, iso_date):
+    """
+    Get the baseline mean, standard deviation and observation count for a date.
+
+    Returns:
+        tuple: (mean, std, count); mean and std are None without enough observations
+    """
+    index = day_of_year(iso_date) - 1
+    return climatology["mean"][index], climatology["std"][index], climatology["count"][index]
+
+def z_score(value, mean, std):
+    if mean is None or std is None:
+        return None
+    return (value - mean) / std
+
+class ClimatologyStore:
+    """
+    SQLite store of computed climatologies, keyed by field fingerprint, sensor and baseline.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS climatologies ("
+                " field_key TEXT NOT NULL,"
+                " sensor TEXT NOT NULL,"
+                " baseline TEXT NOT NULL,"
+                " climatology TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (field_key, sensor, baseline))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, field_key, sensor, baseline):
+        """
+        Get a stored climatology, or None if it wasn't computed yet.
+
+        Args:
+            field_key (str): Field fingerprint
+            sensor (str): Satellite source
+            baseline (str): Baseline identifier (years and window)
+
+        Returns:
+            dict: The climatology, with "created_at"
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT climatology, created_at FROM climatologies WHERE field_key = ? AND sensor = ? AND baseline = ?",
+                (field_key, sensor, baseline)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[0]), "created_at": row[1]}
+
+    def put(self, field_key, sensor, baseline, climatology):
+        """
+        Store a computed climatology, replacing any previous one for the same baseline.
+
+        Returns:
+            dict: The climatology, with "created_at"
+        """
+        created_at = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO climatologies (field_key, sensor, baseline, climatology, created_at) VALUES (?, ?, ?, ?, ?)",
+                (field_key, sensor, baseline, json.dumps(climatology), created_at)
+            )
+        return {**climatology, "created_at": created_at}
+
+    def stats(self):
+        with self._connect() as conn:
+            climatologies = conn.execute("SELECT COUNT(*) FROM climatologies").fetchone()[0]
+        return {"climatologies": climatologies}
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM climatologies")
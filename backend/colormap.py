@@ -0,0 +1,169 @@
+"""
+Lookup-table colormaps for NDVI images.
+
+Raw NDVI images store NDVI in the red channel as 0-255 (mapped from -1..1), so a
+256-entry RGB table per palette colors a whole image with one NumPy indexing
+operation. The tables are built once at import time.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Fast zlib level for encoding; colored NDVI compresses well even at low levels
+PNG_COMPRESS_LEVEL = 1
+
+# ColorBrewer RdYlGn (the same anchors matplotlib interpolates for its 'RdYlGn' colormap)
+RDYLGN_COLORS = [
+    'a50026', 'd73027', 'f46d43', 'fdae61', 'fee08b', 'ffffbf',
+    'd9ef8b', 'a6d96a', '66bd63', '1a9850', '006837'
+]
+
+# Palette used for the Earth Engine NDVI tiles
+EE_NDVI_COLORS = [
+    'FFFFFF', 'CE7E45', 'DF923D', 'F1B555', 'FCD163', '99B718',
+    '74A901', '66A000', '529400', '3E8601', '207401', '056201',
+    '004C00', '023B01', '012E01', '011D01', '011301'
+]
+
+# Sequential greens (ColorBrewer Greens)
+GREENS_COLORS = [
+    'f7fcf5', 'e5f5e0', 'c7e9c0', 'a1d99b', '74c476',
+    '41ab5d', '238b45', '006d2c', '00441b'
+]
+
+def build_lut(hex_colors, size=256):
+    """
+    Build an RGB lookup table by linearly interpolating between evenly spaced colors.
+
+    Args:
+        hex_colors (list): Hex color strings, with or without a leading '#'
+        size (int): Number of table entries
+
+    Returns:
+        np.ndarray: (size, 3) uint8 lookup table
+    """
+    if len(hex_colors) < 2:
+        raise ValueError("A palette needs at least two colors")
+
+    anchors = np.array(
+        [[int(c.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)] for c in hex_colors],
+        dtype=np.float32
+    )
+    anchor_positions = np.linspace(0, 1, len(anchors))
+    positions = np.linspace(0, 1, size)
+
+    lut = np.empty((size, 3), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.round(np.interp(positions, anchor_positions, anchors[:, channel]))
+    return lut
+
+PALETTES = {
+    "RdYlGn": build_lut(RDYLGN_COLORS),
+    "ndvi": build_lut(EE_NDVI_COLORS),
+    "greens": build_lut(GREENS_COLORS)
+}
+
+def get_lut(palette):
+    """
+    Get the lookup table for a named palette or a comma-separated list of hex colors.
+
+    Args:
+        palette (str): Palette name from PALETTES, or e.g. "ff0000,ffff00,00ff00"
+
+    Returns:
+        np.ndarray: (256, 3) uint8 lookup table
+    """
+    if palette in PALETTES:
+        return PALETTES[palette]
+    return build_lut([color.strip() for color in palette.split(',') if color.strip()])
+
+def to_ndvi_bytes(values):
+    """
+    Convert raw NDVI samples to uint8 table indices.
+
+    Integer samples are raw NDVI (0-255) and are clipped to that range. Float
+    samples are NDVI values (-1 to 1) and are scaled with float32 math; NaN
+    (no data) maps to index 0.
+    """
+    if values.dtype == np.uint8:
+        return values
+    if np.issubdtype(values.dtype, np.floating):
+        scaled = (values.astype(np.float32) + 1) * 127.5
+        np.nan_to_num(scaled, copy=False, nan=0)
+        return np.clip(np.rint(scaled), 0, 255).astype(np.uint8)
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+def apply_lut(ndvi_bytes, lut):
+    """
+    Color a 2-D uint8 NDVI array.
+
+    Args:
+        ndvi_bytes (np.ndarray): (H, W) uint8 array of raw NDVI values
+        lut (np.ndarray): (256, 3) uint8 lookup table
+
+    Returns:
+        np.ndarray: (H, W, 3) uint8 RGB array
+    """
+    return lut[ndvi_bytes]
+
+def add_legend(image, lut):
+    """
+    Append a vertical NDVI color bar with -1, 0 and 1 labels to the right of an image.
+
+    Args:
+        image (PIL.Image.Image): Colored RGB image
+        lut (np.ndarray): (256, 3) uint8 lookup table used for the image
+
+    Returns:
+        PIL.Image.Image: New image with the legend strip
+    """
+    width, height = image.size
+    bar_width = max(12, min(width // 40, 48))
+    label_width = 32
+    margin = max(4, height // 50)
+
+    legend = Image.new("RGB", (width + bar_width + label_width + 2 * margin, height), "white")
+    legend.paste(image, (0, 0))
+
+    # Top of the bar is NDVI 1, bottom is -1
+    bar_height = max(1, height - 2 * margin)
+    indices = np.linspace(255, 0, bar_height).round().astype(np.uint8)
+    bar = np.repeat(lut[indices][:, np.newaxis, :], bar_width, axis=1)
+    legend.paste(Image.fromarray(bar), (width + margin, margin))
+
+    draw = ImageDraw.Draw(legend)
+    label_x = width + margin + bar_width + 4
+    for label, fraction in (("1", 0.0), ("0", 0.5), ("-1", 1.0)):
+        y = margin + fraction * (bar_height - 1)
+        draw.text((label_x, max(0, min(height - 10, y - 5))), label, fill="black")
+
+    return legend
+
+def colorize_ndvi_image(contents, lut, legend=False):
+    """
+    Color an uploaded raw NDVI image at its native resolution.
+
+    Args:
+        contents (bytes): Encoded image whose red channel (or only band) holds NDVI as 0-255
+        lut (np.ndarray): (256, 3) uint8 lookup table
+        legend (bool): Whether to append an NDVI color bar
+
+    Returns:
+        io.BytesIO: PNG-encoded colored image, positioned at the start
+    """
+    img = Image.open(io.BytesIO(contents))
+
+    # Extract red channel (NDVI data)
+    img_array = np.asarray(img)
+    ndvi_raw = img_array[:, :, 0] if img_array.ndim == 3 else img_array
+
+    colored = Image.fromarray(apply_lut(to_ndvi_bytes(ndvi_raw), lut))
+    if legend:
+        colored = add_legend(colored, lut)
+
+    buf = io.BytesIO()
+    colored.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    buf.seek(0)
+    return buf
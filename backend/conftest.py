@@ -0,0 +1,28 @@
+import shutil
+import tempfile
+
+import pytest
+
+from benchmark import configure_environment, wait_for_earth_engine
+
+# test_ee.py and test_ee_new.py are manual scripts that need Earth Engine credentials
+collect_ignore = ["test_ee.py", "test_ee_new.py"]
+
+@pytest.fixture(scope="session")
+def api():
+    """
+    The API module, running against the simulated Earth Engine without latency.
+    """
+    work_dir = tempfile.mkdtemp(prefix="ndvi-tests-")
+    configure_environment(work_dir, latency=0, jitter=0)
+    import main
+    yield main
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def client(api):
+    from fastapi.testclient import TestClient
+
+    with TestClient(api.app) as client:
+        assert wait_for_earth_engine(api), "Simulated Earth Engine did not initialize"
+        yield client
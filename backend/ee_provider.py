@@ -0,0 +1,79 @@
+"""
+Earth Engine providers.
+
+The API talks to Earth Engine through an ee-compatible client supplied by a
+provider, selected with EE_PROVIDER:
+
+  - earthengine (default): the real earthengine-api package
+  - simulated: a local client serving synthetic datasets with NumPy
+    (see simulated_ee.py), with a configurable latency per round trip, for
+    benchmarks and development without an account or network access
+
+A provider loads the client (heavy imports happen here, off the startup path)
+and initializes it. The rest of the backend only uses the returned client.
+"""
+
+import os
+
+class EarthEngineProvider:
+    """
+    The real Earth Engine API.
+    """
+
+    name = "earthengine"
+
+    def __init__(self, project=None):
+        self.project = project
+
+    def load(self):
+        import ee
+        return ee
+
+    def initialize(self, client):
+        # Looks for credentials in the standard locations (run 'earthengine authenticate' first)
+        client.Initialize(project=self.project)
+
+class SimulatedProvider:
+    """
+    A local simulated Earth Engine serving synthetic collections.
+
+    Args:
+        latency_seconds (float): Time every round trip takes
+        jitter (float): Relative random variation of the latency
+        seed (int): Seed of the synthetic datasets
+        max_concurrent (int): Concurrency quota; round trips beyond it are rejected as throttled
+    """
+
+    name = "simulated"
+
+    def __init__(self, latency_seconds=0.05, jitter=0.2, seed=0, max_concurrent=None):
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+        self.seed = seed
+        self.max_concurrent = max_concurrent
+
+    def load(self):
+        from simulated_ee import SimulatedEarthEngine
+        return SimulatedEarthEngine(self.latency_seconds, self.jitter, self.seed, self.max_concurrent)
+
+    def initialize(self, client):
+        client.Initialize()
+
+def get_provider(name=None):
+    """
+    Get the provider configured by name, or by the EE_PROVIDER environment variable.
+
+    Returns:
+        EarthEngineProvider or SimulatedProvider
+    """
+    name = (name or os.environ.get("EE_PROVIDER", "earthengine")).lower()
+    if name == "earthengine":
+        return EarthEngineProvider(project=os.environ.get("EE_PROJECT", "tensorfarm"))  # Your GEE project ID
+    if name == "simulated":
+        return SimulatedProvider(
+            latency_seconds=float(os.environ.get("SIMULATED_EE_LATENCY_SECONDS", 0.05)),
+            jitter=float(os.environ.get("SIMULATED_EE_LATENCY_JITTER", 0.2)),
+            seed=int(os.environ.get("SIMULATED_EE_SEED", 0)),
+            max_concurrent=int(os.environ["SIMULATED_EE_MAX_CONCURRENT"]) if os.environ.get("SIMULATED_EE_MAX_CONCURRENT") else None
+        )
+    raise ValueError(f"Unknown EE_PROVIDER '{name}', expected 'earthengine' or 'simulated'")
@@ -0,0 +1,292 @@
+"""
+Shared scheduler for Earth Engine round trips.
+
+Every getInfo() (ee.data.computeValue) and getMapId call goes through one
+EarthEngineScheduler, wherever it is made: request handlers, stage threads,
+jobs and the catalog scheduler. It bounds how many round trips are in flight
+at once and adapts that bound to what Earth Engine accepts (AIMD):
+
+  - every successful call raises the limit by 1/limit, so about one more
+    concurrent call per limit's worth of successes (additive increase)
+  - a throttled call (HTTP 429, quota or rate limit errors) multiplies the
+    limit by DECREASE_FACTOR, at most once per round of calls in flight, so a
+    burst of rejections arriving together only halves it once
+    (multiplicative decrease)
+
+Throttled and unavailable (503) calls are retried with jittered exponential
+backoff. Calls waiting for a slot are queued per client and served round
+robin across clients, so one client's batch doesn't starve everyone else's
+requests. A call that waits longer than the queue timeout, or is still
+throttled after its retries, raises EarthEngineBusyError, which the API turns
+into a 503 with Retry-After instead of a 500.
+
+The client is read from the current_client context variable, set per HTTP
+request; work without a request (catalog refreshes, jobs submitted without a
+context) is queued as "background".
+"""
+
+import contextvars
+import functools
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import ee_queue_wait_seconds, ee_rejections, ee_retries, ee_throttled
+
+logger = logging.getLogger(__name__)
+
+current_client = contextvars.ContextVar("current_client", default="background")
+
+# Fraction of the limit kept after a throttled call
+DECREASE_FACTOR = 0.5
+
+# Error messages of retryable Earth Engine failures (the client raises EEException with the server's message).
+# Status codes only count next to "error", "status" or "code": user errors quote asset IDs,
+# coordinates and pixel counts, and those must not be retried or lower the limit
+THROTTLE_MESSAGES = re.compile(
+    r"too many requests|too many concurrent|rate limit|quota exceeded|resource_exhausted"
+    r"|(?:error|status|code)\W{0,3}429\b"
+)
+UNAVAILABLE_MESSAGES = re.compile(
+    r"service unavailable|backend error"
+    r"|(?:error|status|code)\W{0,3}503\b"
+)
+
+class EarthEngineBusyError(Exception):
+    """
+    Raised when a round trip can't be made because Earth Engine is saturated.
+
+    Attributes:
+        retry_after (int): Suggested seconds before the client tries again
+    """
+
+    def __init__(self, message, retry_after=30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _status_code(error):
+    # googleapiclient's HttpError keeps the response, requests-style errors a status_code
+    response = getattr(error, "resp", None) or getattr(error, "response", None)
+    for value in (getattr(response, "status", None), getattr(response, "status_code", None), getattr(error, "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+def classify_error(error):
+    """
+    Classify an Earth Engine error as "throttled", "unavailable" or None (not retryable).
+    """
+    status = _status_code(error)
+    if status == 429:
+        return "throttled"
+    if status in (502, 503, 504):
+        return "unavailable"
+    message = str(error).lower()
+    if THROTTLE_MESSAGES.search(message):
+        return "throttled"
+    if UNAVAILABLE_MESSAGES.search(message):
+        return "unavailable"
+    return None
+
+class _Waiter:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+class EarthEngineScheduler:
+    """
+    Bounded, adaptive and fair scheduling of Earth Engine round trips.
+
+    Args:
+        initial_limit (int): Concurrent calls allowed at first
+        min_limit (int): Lowest the limit goes after throttling
+        max_limit (int): Highest the limit grows
+        max_retries (int): Retries of a throttled or unavailable call
+        retry_base_seconds (float): Backoff before the first retry, doubled for every retry
+        retry_max_seconds (float): Upper bound of the backoff
+        queue_timeout_seconds (float): Longest a call waits for a slot
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=32, max_retries=4,
+                 retry_base_seconds=1.0, retry_max_seconds=30.0, queue_timeout_seconds=60.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._queues = OrderedDict()  # client -> deque of waiters, in round-robin order
+        self._condition = threading.Condition()
+        self._stats = {"calls": 0, "throttled": 0, "retries": 0, "rejected": 0}
+
+    @property
+    def limit(self):
+        with self._condition:
+            return int(self._limit)
+
+    def in_flight(self):
+        with self._condition:
+            return self._in_flight
+
+    def queue_depth(self):
+        with self._condition:
+            return sum(len(waiters) for waiters in self._queues.values())
+
+    def snapshot(self):
+        """
+        Get the current limit, calls in flight, queued calls per client and totals.
+        """
+        with self._condition:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "queued": sum(len(waiters) for waiters in self._queues.values()),
+                "queued_by_client": {client: len(waiters) for client, waiters in self._queues.items()},
+                **self._stats
+            }
+
+    def _dispatch(self):
+        # Hand free slots to waiting clients in turn; called with the condition held
+        granted = False
+        while self._queues and self._in_flight < int(self._limit):
+            client, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            # The client goes to the back of the rotation, or leaves it if nothing else is queued
+            del self._queues[client]
+            if waiters:
+                self._queues[client] = waiters
+            waiter.granted = True
+            self._in_flight += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _acquire(self, client):
+        started = time.monotonic()
+        with self._condition:
+            if not self._queues and self._in_flight < int(self._limit):
+                self._in_flight += 1
+                ee_queue_wait_seconds.observe(0)
+                return
+
+            waiter = _Waiter()
+            self._queues.setdefault(client, deque()).append(waiter)
+            deadline = started + self.queue_timeout_seconds
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    waiters = self._queues.get(client)
+                    if waiters is not None:
+                        waiters.remove(waiter)
+                        if not waiters:
+                            del self._queues[client]
+                    break
+                self._condition.wait(remaining)
+
+        waited = time.monotonic() - started
+        ee_queue_wait_seconds.observe(waited)
+        if not waiter.granted:
+            self._count("rejected")
+            ee_rejections.inc(reason="queue_timeout")
+            raise EarthEngineBusyError(
+                f"Earth Engine is busy: no request slot within {self.queue_timeout_seconds:g} seconds",
+                retry_after=max(1, int(self.queue_timeout_seconds / 2))
+            )
+
+    def _count(self, name):
+        with self._condition:
+            self._stats[name] += 1
+
+    def _release(self, started, outcome):
+        with self._condition:
+            self._in_flight -= 1
+            self._stats["calls"] += 1
+            if outcome == "throttled":
+                self._stats["throttled"] += 1
+            if outcome == "ok":
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            elif outcome == "throttled" and started >= self._last_decrease:
+                # Calls that started before the last decrease were sent under the old limit
+                self._limit = max(self.min_limit, self._limit * DECREASE_FACTOR)
+                self._last_decrease = time.monotonic()
+                logger.warning(f"Earth Engine throttled requests, concurrency limit lowered to {int(self._limit)}")
+            self._dispatch()
+
+    def backoff_seconds(self, attempt):
+        """
+        Get the delay before retry number attempt (0-based), with full jitter.
+        """
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+
+    def call(self, call, fn, *args, **kwargs):
+        """
+        Make a round trip through the scheduler, retrying throttled and unavailable calls.
+
+        Args:
+            call (str): Metric label for the call, e.g. "getInfo"
+            fn (callable): The function making the round trip
+
+        Returns:
+            The function's result
+        """
+        client = current_client.get()
+        attempt = 0
+        while True:
+            self._acquire(client)
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            except Exception as e:
+                outcome = classify_error(e) or "error"
+                if outcome == "error":
+                    raise
+                if outcome == "throttled":
+                    ee_throttled.inc(call=call)
+                if attempt >= self.max_retries:
+                    self._count("rejected")
+                    ee_rejections.inc(reason="retries_exhausted")
+                    raise EarthEngineBusyError(
+                        f"Earth Engine is busy: {e}",
+                        retry_after=max(1, int(self.retry_max_seconds))
+                    ) from e
+                delay = self.backoff_seconds(attempt)
+                attempt += 1
+            finally:
+                self._release(started, outcome)
+
+            # Back off without holding a slot, then queue again behind the other clients
+            self._count("retries")
+            ee_retries.inc(call=call, reason=outcome)
+            logger.info(f"Earth Engine {call} {outcome}, retry {attempt} of {self.max_retries} in {delay:.1f} seconds")
+            time.sleep(delay)
+
+    def wrap(self, call, fn):
+        """
+        Wrap an Earth Engine API function so its calls go through the scheduler.
+        """
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.call(call, fn, *args, **kwargs)
+
+        wrapper.scheduled = True
+        return wrapper
+
+    def install(self, ee_module):
+        """
+        Route getInfo() and getMapId round trips of the ee package through the scheduler (idempotent).
+        """
+        for attribute, call in (("computeValue", "getInfo"), ("getMapId", "getMapId")):
+            fn = getattr(ee_module.data, attribute)
+            if not getattr(fn, "scheduled", False):
+                setattr(ee_module.data, attribute, self.wrap(call, fn))
@@ -0,0 +1,191 @@
+"""
+Persistent per-field NDVI history.
+
+Observations (one mean NDVI per image) are stored in SQLite per field
+fingerprint and sensor, along with the date range that has already been
+fetched from Earth Engine. A time series request only fetches the parts of its
+window outside that range, so a daily "last 12 months" request costs a few new
+scenes instead of the whole year.
+
+The covered range is kept contiguous: a request that starts after the covered
+range, or ends before it, fetches the gap too. Because Earth Engine ingests
+scenes with a delay, the most recent HISTORY_SETTLE_DAYS are never marked as
+covered and are fetched again on every request.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Recent days that are re-fetched because late-arriving scenes may still be ingested
+HISTORY_SETTLE_DAYS = int(os.environ.get("HISTORY_SETTLE_DAYS", 5))
+
+def iso_date(value):
+    """
+    Get the zero-padded ISO form of a date string.
+
+    Dates are compared as strings, so "2024-3-5" (which Earth Engine accepts) has to
+    be stored as "2024-03-05" to sort after "2024-11-01".
+
+    Raises:
+        ValueError: If the value is not a YYYY-MM-DD date
+    """
+    return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+
+class NdviHistoryStore:
+    """
+    SQLite store of NDVI observations and fetched date ranges per field and sensor.
+
+    Dates are ISO strings (YYYY-MM-DD), normalized on the way in; ranges are [start, end)
+    like Earth Engine's filterDate.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                " field_key TEXT NOT NULL,"
+                " sensor TEXT NOT NULL,"
+                " image_id TEXT NOT NULL,"
+                " date TEXT NOT NULL,"
+                " ndvi REAL NOT NULL,"
+                " PRIMARY KEY (field_key, sensor, image_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS observations_date ON observations (field_key, sensor, date)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS coverage ("
+                " field_key TEXT NOT NULL,"
+                " sensor TEXT NOT NULL,"
+                " start_date TEXT NOT NULL,"
+                " end_date TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (field_key, sensor))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def coverage(self, field_key, sensor):
+        """
+        Get the fetched date range of a field, or None if nothing was fetched yet.
+
+        Returns:
+            tuple: (start_date, end_date)
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT start_date, end_date FROM coverage WHERE field_key = ? AND sensor = ?",
+                (field_key, sensor)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def missing_ranges(self, field_key, sensor, start_date, end_date):
+        """
+        Get the date ranges of a request that have to be fetched from Earth Engine.
+
+        Args:
+            field_key (str): Field fingerprint
+            sensor (str): Satellite source
+            start_date (str): Request start (inclusive)
+            end_date (str): Request end (exclusive)
+
+        Returns:
+            list: (start, end) ranges, at most two
+
+        Raises:
+            ValueError: If a date is not an ISO date
+        """
+        start_date, end_date = iso_date(start_date), iso_date(end_date)
+        covered = self.coverage(field_key, sensor)
+        if covered is None:
+            return [(start_date, end_date)]
+
+        covered_start, covered_end = covered
+        ranges = []
+        # Fetching up to the covered range, even across a gap outside the request, keeps it contiguous
+        if start_date < covered_start:
+            ranges.append((start_date, covered_start))
+        if end_date > covered_end:
+            ranges.append((covered_end, end_date))
+        return ranges
+
+    def add(self, field_key, sensor, observations, fetched_ranges):
+        """
+        Store fetched observations and extend the covered range.
+
+        Args:
+            field_key (str): Field fingerprint
+            sensor (str): Satellite source
+            observations (list): Dicts with "image_id", "date" and "ndvi"
+            fetched_ranges (list): (start, end) ranges the observations were fetched for
+        """
+        if not fetched_ranges:
+            return
+        fetched_ranges = [(iso_date(start), iso_date(end)) for start, end in fetched_ranges]
+
+        # Recent days stay uncovered so late-arriving scenes are picked up next time
+        settled_end = (date.today() - timedelta(days=HISTORY_SETTLE_DAYS)).isoformat()
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO observations (field_key, sensor, image_id, date, ndvi) VALUES (?, ?, ?, ?, ?)",
+                [(field_key, sensor, o["image_id"], iso_date(o["date"]), o["ndvi"]) for o in observations]
+            )
+
+            row = conn.execute(
+                "SELECT start_date, end_date FROM coverage WHERE field_key = ? AND sensor = ?",
+                (field_key, sensor)
+            ).fetchone()
+            starts = [start for start, _ in fetched_ranges] + ([row[0]] if row else [])
+            ends = [min(end, settled_end) for _, end in fetched_ranges] + ([row[1]] if row else [])
+            new_start, new_end = min(starts), max(ends)
+
+            if new_start < new_end:
+                conn.execute(
+                    "INSERT OR REPLACE INTO coverage (field_key, sensor, start_date, end_date, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (field_key, sensor, new_start, new_end, time.time())
+                )
+
+    def observations(self, field_key, sensor, start_date, end_date):
+        """
+        Get the stored observations of a field within [start_date, end_date).
+
+        Returns:
+            list: Dicts with "date" and "ndvi", sorted by date
+        """
+        start_date, end_date = iso_date(start_date), iso_date(end_date)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date, ndvi FROM observations"
+                " WHERE field_key = ? AND sensor = ? AND date >= ? AND date < ?"
+                " ORDER BY date, image_id",
+                (field_key, sensor, start_date, end_date)
+            ).fetchall()
+        return [{"date": row[0], "ndvi": row[1]} for row in rows]
+
+    def stats(self):
+        with self._connect() as conn:
+            fields = conn.execute("SELECT COUNT(*) FROM coverage").fetchone()[0]
+            observations = conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+        return {"fields": fields, "observations": observations}
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM observations")
+            conn.execute("DELETE FROM coverage")
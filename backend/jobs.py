@@ -0,0 +1,272 @@
+"""
+Background jobs for long-running NDVI analyses.
+
+A job is submitted to a bounded queue and run by a fixed pool of worker
+threads, so the HTTP request returns immediately with a job ID. While a job
+runs it records progress events (one per finished stage, with that stage's
+result) that clients can poll or follow as Server-Sent Events.
+
+Finished jobs are kept for a retention period and then evicted; the number of
+retained jobs is also capped so memory stays bounded.
+
+LocalJobQueue runs jobs in-process and needs no external services. Anything
+with the same submit(fn) interface (raising QueueFullError when saturated) can
+replace it.
+"""
+
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+class QueueFullError(Exception):
+    """
+    Raised when a job can't be accepted because the queue is at capacity.
+    """
+
+class Job:
+    """
+    State and progress events of one background job.
+
+    Attributes:
+        id (str): Job ID
+        kind (str): What the job computes, e.g. "ndvi-tiles"
+        status (str): queued, running, succeeded or failed
+        stages (list): Names of the stages the job will run
+        partial (dict): Results of the stages finished so far
+        result: Final result once succeeded
+        error (dict): {"status_code": ..., "detail": ...} once failed
+    """
+
+    def __init__(self, kind, stages=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.stages = list(stages or [])
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []  # (event_id, event_name, data)
+        self._lock = threading.Lock()
+        self._publish("status", {"status": QUEUED})
+
+    def _publish(self, event, data):
+        self.events.append((len(self.events) + 1, event, data))
+
+    def start(self):
+        with self._lock:
+            self.status = RUNNING
+            self.started_at = time.time()
+            self._publish("status", {"status": RUNNING})
+
+    def stage_finished(self, name, result):
+        with self._lock:
+            self.partial[name] = result
+            self._publish("stage", {
+                "stage": name,
+                "completed": len(self.partial),
+                "total": len(self.stages),
+                "result": result
+            })
+
+    def succeed(self, result):
+        with self._lock:
+            self.status = SUCCEEDED
+            self.result = result
+            self.finished_at = time.time()
+            self._publish("done", {"status": SUCCEEDED, "result": result})
+
+    def fail(self, status_code, detail):
+        with self._lock:
+            self.status = FAILED
+            self.error = {"status_code": status_code, "detail": detail}
+            self.finished_at = time.time()
+            self._publish("done", {"status": FAILED, "error": self.error})
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def events_after(self, event_id):
+        """
+        Get the events published after an event ID (0 for all of them).
+        """
+        with self._lock:
+            return self.events[event_id:]
+
+    def snapshot(self, include_partial=True):
+        """
+        Get the job state as a JSON-serializable dict.
+        """
+        with self._lock:
+            state = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stages": self.stages,
+                "completed_stages": list(self.partial),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at
+            }
+            if self.status == SUCCEEDED:
+                state["result"] = self.result
+            elif self.status == FAILED:
+                state["error"] = self.error
+            elif include_partial:
+                state["partial"] = dict(self.partial)
+            return state
+
+class LocalJobQueue:
+    """
+    In-process job queue served by a fixed number of daemon worker threads.
+
+    Args:
+        workers (int): Jobs run concurrently
+        max_queued (int): Jobs waiting beyond the running ones before submit() refuses
+    """
+
+    def __init__(self, workers=4, max_queued=100):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._work, name=f"ndvi-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn):
+        try:
+            self._queue.put_nowait(fn)
+        except queue.Full:
+            raise QueueFullError("Job queue is full")
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            fn = self._queue.get()
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+class JobManager:
+    """
+    Tracks jobs, hands them to a queue and evicts old ones.
+
+    Args:
+        job_queue: LocalJobQueue or another backend with submit(fn)
+        retention_seconds (float): How long a finished job stays available
+        max_jobs (int): Jobs tracked at once; the oldest finished ones are evicted first
+    """
+
+    def __init__(self, job_queue, retention_seconds=3600, max_jobs=1000):
+        self.queue = job_queue
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, run, stages=None):
+        """
+        Create a job and queue it.
+
+        Args:
+            kind (str): What the job computes
+            run (callable): run(job) computing the result; it may call job.stage_finished
+            stages (list): Names of the stages the job will run
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: If the queue or the job table is full
+        """
+        job = Job(kind, stages)
+
+        with self._lock:
+            self._evict()
+            if len(self._jobs) >= self.max_jobs:
+                raise QueueFullError("Too many jobs are pending")
+            self._jobs[job.id] = job
+
+        try:
+            self.queue.submit(lambda: self._run(job, run))
+        except QueueFullError:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def _run(self, job, run):
+        job.start()
+        try:
+            job.succeed(run(job))
+        except Exception as e:
+            # Exceptions carrying an HTTP status (e.g. HTTPException) keep it
+            status_code = getattr(e, "status_code", 500)
+            detail = getattr(e, "detail", str(e))
+            logger.error(f"Job {job.id} failed: {detail}")
+            job.fail(status_code, detail)
+
+    def get(self, job_id):
+        """
+        Get a job by ID.
+
+        Raises:
+            KeyError: If the job doesn't exist or was evicted
+        """
+        with self._lock:
+            self._evict()
+            return self._jobs[job_id]
+
+    def _evict(self):
+        # Called with the lock held
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        # Over capacity: drop the oldest finished jobs (unfinished ones are never dropped)
+        if len(self._jobs) >= self.max_jobs:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+                if len(self._jobs) < self.max_jobs:
+                    break
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            self._evict()
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "jobs": counts,
+            "queue_depth": self.queue.depth() if hasattr(self.queue, "depth") else None,
+            "workers": getattr(self.queue, "workers", None),
+            "retention_seconds": self.retention_seconds,
+            "max_jobs": self.max_jobs
+        }
@@ -1,308 +1,2278 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File  
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List
-import ee
+from typing import Dict, Any, List, Optional
+import asyncio
+import contextvars
 import json
 import logging
+import math
 import os
+import queue
+import random
+import threading
 import time
-from datetime import datetime
-import numpy as np
-from PIL import Image
-import io
-import matplotlib.pyplot as plt
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from cache import create_result_cache, polygon_cache_key
+from catalog import PERIOD_TYPES, CatalogScheduler, CompositeCatalog
+from climatology import ClimatologyStore, build_climatology, climatology_at, z_score
+from ee_provider import get_provider
+from ee_scheduler import EarthEngineBusyError, EarthEngineScheduler, current_client
+from history import HISTORY_SETTLE_DAYS, NdviHistoryStore
+from jobs import JobManager, LocalJobQueue, QueueFullError
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE, RequestTimings, Gauge, cache_lookups, current_stage, current_timings,
+    http_request_seconds, http_requests, http_response_bytes, instrument_earth_engine, record_timing,
+    registry, stage_payload_bytes, stage_seconds
+)
+from scale_planner import SERIES_PIXEL_BUDGET, plan_reduction, polygon_area_m2, reduce_region_args
+from singleflight import SingleFlight
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Earth Engine is imported and initialized in the background once the app starts
+# (see lifespan), so startup doesn't wait on the import or on authentication.
+# EE_PROVIDER=simulated swaps in a local simulated Earth Engine (see ee_provider.py)
+ee_provider = get_provider()
+ee = None
+ee_initialized = False
+
+# Delay between initialization attempts, doubled after every failure
+EE_INIT_RETRY_SECONDS = float(os.environ.get("EE_INIT_RETRY_SECONDS", 5))
+EE_INIT_MAX_RETRY_SECONDS = float(os.environ.get("EE_INIT_MAX_RETRY_SECONDS", 300))
+
+# Every Earth Engine round trip goes through one scheduler that bounds concurrency,
+# adapts it to throttling (AIMD), retries quota errors and queues callers fairly per client
+ee_scheduler = EarthEngineScheduler(
+    initial_limit=int(os.environ.get("EE_INITIAL_CONCURRENCY", 8)),
+    min_limit=int(os.environ.get("EE_MIN_CONCURRENCY", 1)),
+    max_limit=int(os.environ.get("EE_MAX_CONCURRENCY", 32)),
+    max_retries=int(os.environ.get("EE_MAX_RETRIES", 4)),
+    retry_base_seconds=float(os.environ.get("EE_RETRY_BASE_SECONDS", 1)),
+    retry_max_seconds=float(os.environ.get("EE_RETRY_MAX_SECONDS", 30)),
+    queue_timeout_seconds=float(os.environ.get("EE_QUEUE_TIMEOUT_SECONDS", 60))
+)
+registry.register(Gauge("tensorfarm_ee_concurrency_limit", "Earth Engine round trips currently allowed in flight", lambda: ee_scheduler.limit))
+registry.register(Gauge("tensorfarm_ee_in_flight", "Earth Engine round trips in flight", ee_scheduler.in_flight))
+registry.register(Gauge("tensorfarm_ee_queue_depth", "Earth Engine round trips waiting for a scheduler slot", ee_scheduler.queue_depth))
+
+ee_status = {
+    "provider": ee_provider.name,
+    "state": "starting",  # starting, initializing, ready or failed
+    "attempts": 0,
+    "last_error": None,
+    "last_attempt_at": None,
+    "next_attempt_at": None,
+    "initialized_at": None
+}
+ee_status_lock = threading.Lock()
+ee_retry_event = threading.Event()
+ee_init_stop = threading.Event()
+
+def import_earth_engine():
+    """
+    Load the provider's Earth Engine client on first use and instrument its round trips.
+    """
+    global ee
+    if ee is None:
+        client = ee_provider.load()
+        
+        # Count and time every getInfo()/getMapId round trip (each retry is a round trip),
+        # and schedule them through the shared limiter
+        instrument_earth_engine(client)
+        ee_scheduler.install(client)
+        ee = client
+    return ee
+
+def initialize_earth_engine():
+    """
+    Make one attempt to initialize Earth Engine.
+    
+    Returns:
+        bool: Whether Earth Engine is initialized
+    """
+    global ee_initialized
+    with ee_status_lock:
+        ee_status["state"] = "initializing"
+        ee_status["attempts"] += 1
+        ee_status["last_attempt_at"] = time.time()
+    try:
+        import_earth_engine()
+        
+        ee_provider.initialize(ee)
+        logger.info(f"Earth Engine initialized successfully ({ee_provider.name})")
+        ee_initialized = True
+        with ee_status_lock:
+            ee_status.update(state="ready", last_error=None, next_attempt_at=None, initialized_at=time.time())
+        return True
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Failed to initialize Earth Engine: {error_msg}")
+        if "no project found" in error_msg or "PERMISSION_DENIED" in error_msg:
+            logger.warning("Authentication issue detected with Google Earth Engine")
+            logger.info("Please follow these steps:")
+            logger.info("1. Run 'earthengine authenticate' in your terminal")
+            logger.info("2. Create a Google Cloud project if you don't have one")
+            logger.info("3. Enable the Earth Engine API in your Google Cloud project")
+            logger.info("4. Set up proper permissions for your account")
+            logger.info("For detailed instructions, visit: https://developers.google.com/earth-engine/guides/python_install")
+        ee_initialized = False
+        with ee_status_lock:
+            ee_status.update(state="failed", last_error=error_msg)
+        return False
+
+def earth_engine_init_loop():
+    """
+    Retry Earth Engine initialization with jittered exponential backoff until it succeeds.
+    
+    A retry can be requested early through ee_retry_event (e.g. after authenticating).
+    """
+    delay = EE_INIT_RETRY_SECONDS
+    while not ee_init_stop.is_set():
+        if initialize_earth_engine():
+            return
+        
+        wait_seconds = delay * random.uniform(0.8, 1.2)
+        with ee_status_lock:
+            ee_status["next_attempt_at"] = time.time() + wait_seconds
+        logger.info(f"Retrying Earth Engine initialization in {wait_seconds:.0f} seconds")
+        
+        ee_retry_event.wait(wait_seconds)
+        if ee_retry_event.is_set():
+            ee_retry_event.clear()
+            delay = EE_INIT_RETRY_SECONDS
+        else:
+            delay = min(delay * 2, EE_INIT_MAX_RETRY_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start serving immediately; Earth Engine requests return 503 until initialization succeeds
+    ee_init_stop.clear()
+    threading.Thread(target=earth_engine_init_loop, name="ee-init", daemon=True).start()
+    if catalog_scheduler is not None:
+        catalog_scheduler.start()
+    yield
+    ee_init_stop.set()
+    ee_retry_event.set()
+    if catalog_scheduler is not None:
+        catalog_scheduler.stop()
+
+app = FastAPI(title="TensorFarm NDVI API", 
+              description="API to get NDVI tiles from Earth Engine for a given polygon",
+              lifespan=lifespan)
+
+# Configure CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, replace with specific origins
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+
+# Send a Server-Timing header (stage and Earth Engine call durations) with every response
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Request header identifying the client for fair Earth Engine scheduling (the client address if absent)
+EE_CLIENT_HEADER = os.environ.get("EE_CLIENT_HEADER", "X-Client-Id")
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    client = request.headers.get(EE_CLIENT_HEADER) or (request.client.host if request.client else "unknown")
+    client_token = current_client.set(client)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_client.reset(client_token)
+        current_timings.reset(token)
+    elapsed = time.perf_counter() - started
+    
+    # Label by route template so IDs in paths don't create a series per request
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    http_requests.inc(method=request.method, route=route_path, status=response.status_code)
+    http_request_seconds.observe(elapsed, method=request.method, route=route_path)
+    content_length = response.headers.get("content-length")
+    if content_length is not None:
+        http_response_bytes.observe(int(content_length), method=request.method, route=route_path)
+    
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timings.header(total_seconds=elapsed)
+    return response
+
+class PolygonData(BaseModel):
+    polygon: Dict[str, Any]
+    satellite_source: str = "sentinel-2"  # Options: "sentinel-2", "landsat-8", "landsat-9", "harmonized" (all three merged)
+    start_date: str = "2024-11-01"  # Default start date for time series
+    end_date: str = "2025-05-01"  # Default end date for time series
+    time_series: bool = False  # Whether to return time series data
+    aggregation: str = "per-scene"  # Time series points. Options: "per-scene" (one per acquisition day), "weekly", "monthly"
+    include_weather: bool = False  # Whether to include weather data (temperature, precipitation)
+    weather_resolution: str = "weekly"  # Weather bin size. Options: "daily", "weekly", "monthly"
+    include_topography: bool = False  # Whether to include topographical data (elevation, slope)
+    include_landcover: bool = False  # Whether to include land cover data (land cover classes, vegetation stats)
+
+class DateTileRequest(BaseModel):
+    polygon: Dict[str, Any]
+    satellite_source: str = "sentinel-2"  # Options: "sentinel-2", "landsat-8", "landsat-9", "harmonized" (all three merged)
+    date: str  # Date (YYYY-MM-DD) to render, usually one of the time series dates
+    end_date: Optional[str] = None  # Optional exclusive end date to render a median over a date range instead
+
+class BatchFieldsData(BaseModel):
+    fields: Dict[str, Any]  # GeoJSON FeatureCollection of field polygons, or a MultiPolygon
+    id_property: str = "id"  # Feature property holding the field ID (falls back to the feature id, then its index)
+    satellite_source: str = "sentinel-2"  # Options: "sentinel-2", "landsat-8", "landsat-9", "harmonized" (all three merged)
+    start_date: str = "2024-11-01"  # Default start date for time series
+    end_date: str = "2025-05-01"  # Default end date for time series
+    time_series: bool = True  # Whether to return a time series per field
+    aggregation: str = "per-scene"  # Time series points. Options: "per-scene" (one per acquisition day), "weekly", "monthly"
+
+class CatalogFieldData(BaseModel):
+    polygon: Dict[str, Any]
+    satellite_source: str = "sentinel-2"  # Options: "sentinel-2", "landsat-8", "landsat-9", "harmonized" (all three merged)
+    name: Optional[str] = None
+    period_types: List[str] = ["month", "season"]
+    history_start: Optional[str] = None  # First date to precompute (YYYY-MM-DD); defaults to CATALOG_HISTORY_MONTHS ago
+
+class AnomalyRequest(BaseModel):
+    polygon: Dict[str, Any]
+    satellite_source: str = "sentinel-2"  # Options: "sentinel-2", "landsat-8", "landsat-9", "harmonized" (all three merged)
+    start_date: str = "2024-11-01"  # Start of the window compared with the baseline
+    end_date: str = "2025-05-01"  # End of the window (exclusive)
+    baseline_years: int = 5  # Calendar years before start_date's year that the climatology is computed from
+    window_days: int = 15  # Baseline observations up to this many days from a day of year are pooled for it
+
+@app.get("/")
+def read_root():
+    return {"message": "Welcome to TensorFarm NDVI API"}
+
+def earth_engine_status():
+    with ee_status_lock:
+        status = dict(ee_status)
+    status["scheduler"] = ee_scheduler.snapshot()
+    return status
+
+@app.get("/auth-status/")
+def check_auth_status(retry: bool = False):
+    """
+    Report whether Earth Engine is authenticated, without blocking on an initialization attempt.
+    
+    With ?retry=true a failed initialization is retried now instead of at the next backoff step.
+    """
+    if retry and not ee_initialized:
+        ee_retry_event.set()
+    
+    return {
+        "authenticated": ee_initialized,
+        "status": earth_engine_status(),
+        "message": "Earth Engine authenticated successfully" if ee_initialized else "Earth Engine authentication required",
+        "instructions": None if ee_initialized else [
+            "Run 'earthengine authenticate' in your terminal",
+            "Create a Google Cloud project and enable Earth Engine API",
+            "Set up proper permissions for your account",
+            "Call /auth-status/?retry=true after authenticating (or wait for the next automatic retry)"
+        ]
+    }
+
+@app.get("/health/live")
+def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def readiness():
+    """
+    Readiness probe: Earth Engine is initialized, so NDVI requests can be served.
+    """
+    status = earth_engine_status()
+    if not ee_initialized:
+        return Response(
+            content=json.dumps({"status": "not_ready", "earth_engine": status}),
+            status_code=503,
+            media_type="application/json"
+        )
+    return {"status": "ready", "earth_engine": status}
+
+# Define visualization parameters shared by the composite and per-date NDVI tiles
+NDVI_VIS_PARAMS = {
+    'min': 0, 
+    'max': 1, 
+    'palette': [
+        'FFFFFF', 'CE7E45', 'DF923D', 'F1B555', 'FCD163', '99B718',
+        '74A901', '66A000', '529400', '3E8601', '207401', '056201',
+        '004C00', '023B01', '012E01', '011D01', '011301'
+    ]
+}
+
+# Earth Engine map IDs expire after a few hours, so cached tile URLs are only reused within this window.
+# The margin leaves clients time to load tiles from a URL that was served from cache
+MAP_ID_TTL_SECONDS = 3 * 60 * 60
+MAP_ID_EXPIRY_MARGIN_SECONDS = 30 * 60
+TILE_URL_CACHE_TTL_SECONDS = MAP_ID_TTL_SECONDS - MAP_ID_EXPIRY_MARGIN_SECONDS
+MAX_CACHED_DATE_TILES = 1024
+
+# Result cache for /ndvi-tiles/ responses. Use RESULT_CACHE_BACKEND=sqlite to share it across uvicorn workers.
+# Responses contain tile URLs, so entries never outlive the map IDs in them
+result_cache = create_result_cache(
+    os.environ.get("RESULT_CACHE_BACKEND", "memory"),
+    ttl=min(float(os.environ.get("RESULT_CACHE_TTL_SECONDS", TILE_URL_CACHE_TTL_SECONDS)), TILE_URL_CACHE_TTL_SECONDS),
+    max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 256)),
+    path=os.environ.get("RESULT_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results.sqlite3"))
+)
+
+# Cache of per-date (and anomaly) tile URLs: key -> (tile URL, expiry timestamp)
+date_tile_cache = {}
+date_tile_cache_lock = threading.Lock()
+
+# Visualization parameters for layers that don't depend on the request polygon
+ELEVATION_VIS_PARAMS = {
+    'min': 0,
+    'max': 3000,
+    'palette': ['006633', 'E5FFCC', '662A00', 'D8D8D8', 'F5F5F5']
+}
+
+SLOPE_VIS_PARAMS = {
+    'min': 0,
+    'max': 60,
+    'palette': ['f7fcb9', 'addd8e', '31a354']
+}
+
+WORLDCOVER_VIS_PARAMS = {
+    'min': 0,
+    'max': 100,
+    'palette': [
+        '006400', '29C012', '77A112', 'FFFF4C', 'FFCCCC',
+        'FF0000', '800000', '0000FF', '0067A5', '00A580', 'A5E194'
+    ]
+}
+
+# Cache of tile URLs for static layers: name -> (tile URL, expiry timestamp)
+static_tile_cache = {}
+static_tile_cache_lock = threading.Lock()
+
+def get_static_tile_url(name, build_image, vis_params):
+    """
+    Get the tile URL for a layer that is the same for every request, minting it
+    once per process and again only when the map ID is about to expire.
+    
+    Args:
+        name (str): Cache name of the layer
+        build_image (callable): Returns the ee.Image to render
+        vis_params (dict): Visualization parameters
+        
+    Returns:
+        tuple: (tile URL template for Leaflet, time the URL is renewed at)
+    """
+    now = time.time()
+    with static_tile_cache_lock:
+        cached = static_tile_cache.get(name)
+        if cached is not None and cached[1] > now:
+            cache_lookups.inc(cache="static_tiles", result="hit")
+            return cached
+    cache_lookups.inc(cache="static_tiles", result="miss")
+    
+    map_id = build_image().getMapId(vis_params)
+    cached = (map_id['tile_fetcher'].url_format, now + TILE_URL_CACHE_TTL_SECONDS)
+    
+    with static_tile_cache_lock:
+        static_tile_cache[name] = cached
+    
+    return cached
+
+def earliest_tile_expiry(response):
+    """
+    Get the earliest "tile_expires_at" in a response's sections, or None if none of them has one.
+    
+    Tile URLs shared across requests (static layers, catalog composites) were minted
+    earlier, so a response holding them mustn't be cached past their expiry.
+    """
+    expiries = []
+    pending = [response]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            if isinstance(value.get("tile_expires_at"), (int, float)):
+                expiries.append(value["tile_expires_at"])
+            pending.extend(value.values())
+    return min(expiries, default=None)
+
+# Bounded thread pool shared by all requests for the independent Earth Engine stages of /ndvi-tiles/
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", 16))
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="ndvi-stage")
+
+# Per-stage timeouts in seconds, measured from when the stage is submitted
+STAGE_TIMEOUTS = {
+    "ndvi_tiles": 60,
+    "time_series": 120,
+    "weather": 90,
+    "topography": 60,
+    "landcover": 90
+}
+DEFAULT_STAGE_TIMEOUT = 120
+
+def run_stages(stages, on_stage=None):
+    """
+    Run independent stages concurrently on the shared stage pool.
+    
+    A stage that raises or runs past its timeout is reported as {"error": ...}
+    without cancelling the others.
+    
+    Args:
+        stages (dict): Stage name -> zero-argument callable
+        on_stage (callable): Optional callback(name, result), called as each stage finishes
+        
+    Returns:
+        dict: Stage name -> stage result (or error dict), in the order given
+    """
+    def timed(name, stage):
+        # Runs in the stage's own copy of the request context, so Earth Engine
+        # calls are attributed to the stage and recorded in the request's timings
+        current_stage.set(name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = stage()
+            outcome = "error" if isinstance(result, dict) and "error" in result else "ok"
+            stage_payload_bytes.observe(len(json.dumps(result, default=str)), stage=name)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            stage_seconds.observe(elapsed, stage=name, outcome=outcome)
+            record_timing(f"stage_{name}", elapsed)
+    
+    submitted_at = time.monotonic()
+    futures = {
+        stage_executor.submit(contextvars.copy_context().run, timed, name, stage): name
+        for name, stage in stages.items()
+    }
+    deadlines = {name: submitted_at + STAGE_TIMEOUTS.get(name, DEFAULT_STAGE_TIMEOUT) for name in stages}
+    
+    results = {}
+    
+    def finish(name, result):
+        results[name] = result
+        if on_stage is not None:
+            on_stage(name, result)
+    
+    pending = set(futures)
+    while pending:
+        next_deadline = min(deadlines[futures[future]] for future in pending)
+        done, pending = wait(pending, timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        
+        for future in done:
+            name = futures[future]
+            try:
+                finish(name, future.result())
+            except Exception as e:
+                logger.error(f"Stage '{name}' failed: {e}")
+                finish(name, stage_error(e))
+        
+        now = time.monotonic()
+        for future in [future for future in pending if deadlines[futures[future]] <= now]:
+            # The worker thread can't be interrupted mid-call, but the request no longer waits on it
+            name = futures[future]
+            future.cancel()
+            pending.discard(future)
+            timeout = STAGE_TIMEOUTS.get(name, DEFAULT_STAGE_TIMEOUT)
+            logger.error(f"Stage '{name}' timed out after {timeout} seconds")
+            stage_seconds.observe(timeout, stage=name, outcome="timeout")
+            finish(name, {"error": f"{name} timed out after {timeout} seconds"})
+    
+    return {name: results[name] for name in stages}
+
+def require_earth_engine():
+    """
+    Make sure Earth Engine is initialized, raising a 503 if it isn't yet.
+    
+    Initialization is retried in the background, so this never blocks the request.
+    """
+    if not ee_initialized:
+        status = earth_engine_status()
+        if status["state"] in ("starting", "initializing") and not status["last_error"]:
+            detail = "Earth Engine is still initializing. Try again shortly."
+        else:
+            detail = "Earth Engine not authenticated. Run 'earthengine authenticate' in your terminal; the server retries automatically."
+        retry_after = max(1, int((status["next_attempt_at"] or time.time() + 5) - time.time()))
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+def earth_engine_busy(detail, retry_after):
+    """
+    Build the 503 returned when Earth Engine is saturated, so clients back off instead of seeing a 500.
+    """
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+def stage_error(e):
+    """
+    Build the error result of a failed stage, keeping the retry hint if Earth Engine was saturated.
+    """
+    error = {"error": str(e)}
+    if isinstance(e, EarthEngineBusyError):
+        error["retry_after"] = e.retry_after
+    return error
+
+def raise_stage_error(result):
+    """
+    Fail the request for the error result of a stage it can't do without.
+    """
+    if "retry_after" in result:
+        raise earth_engine_busy(result["error"], result["retry_after"])
+    raise Exception(result["error"])
+
+def polygon_to_ee_geometry(polygon_geojson):
+    """
+    Convert a GeoJSON polygon from a request into an Earth Engine geometry.
+    
+    Args:
+        polygon_geojson (dict): GeoJSON polygon object
+        
+    Returns:
+        ee.Geometry: The polygon as an Earth Engine geometry
+    """
+    if polygon_geojson.get("type") != "Polygon":
+        raise HTTPException(status_code=400, detail="Only Polygon geometry types are supported")
+    
+    # Convert the GeoJSON polygon to an Earth Engine geometry
+    coordinates = polygon_geojson["coordinates"][0]  # Get the outer ring coordinates
+    return ee.Geometry.Polygon(coordinates)
+
+# Sensors merged by the "harmonized" satellite source
+HARMONIZED_SENSORS = ("sentinel-2", "landsat-8", "landsat-9")
+
+def get_satellite_config(satellite_source):
+    """
+    Get the collection, bands and scaling for a satellite source.
+    
+    Args:
+        satellite_source (str): "sentinel-2", "landsat-8", "landsat-9" or "harmonized"
+        
+    Returns:
+        dict: Collection name, NIR/red bands, cloud cover property, scale factor, offset and native resolution;
+            for "harmonized", the merged sensors and the resolution all of them are reduced at
+    """
+    # Select satellite collection and bands based on source
+    if satellite_source.lower() == "harmonized":
+        return {
+            "sensors": HARMONIZED_SENSORS,
+            "native_scale": 30  # Reduced at the coarsest sensor's resolution so observations are comparable
+        }
+    elif satellite_source.lower() == "landsat-8":
+        return {
+            "sensor": "landsat-8",
+            "collection_name": "LANDSAT/LC08/C02/T1_L2",  # Landsat 8 Collection 2 Tier 1 Level 2
+            "nir_band": 'SR_B5',  # Near-infrared band
+            "red_band": 'SR_B4',  # Red band
+            "cloud_cover": 'CLOUD_COVER',
+            "scale_factor": 0.0000275,  # Landsat 8 Collection 2 scale factor
+            "add_offset": -0.2,  # Landsat 8 Collection 2 offset
+            "native_scale": 30,
+            "is_landsat": True
+        }
+    elif satellite_source.lower() == "landsat-9":
+        return {
+            "sensor": "landsat-9",
+            "collection_name": "LANDSAT/LC09/C02/T1_L2",  # Landsat 9 Collection 2 Tier 1 Level 2
+            "nir_band": 'SR_B5',  # Near-infrared band
+            "red_band": 'SR_B4',  # Red band
+            "cloud_cover": 'CLOUD_COVER',
+            "scale_factor": 0.0000275,  # Landsat 9 Collection 2 scale factor
+            "add_offset": -0.2,  # Landsat 9 Collection 2 offset
+            "native_scale": 30,
+            "is_landsat": True
+        }
+    else:
+        # Default to Sentinel-2
+        return {
+            "sensor": "sentinel-2",
+            "collection_name": "COPERNICUS/S2_SR",  # Sentinel-2 Surface Reflectance
+            # Scenes processed since 2022 shifted back to the older baseline's range, for merging with Landsat
+            "harmonized_collection_name": "COPERNICUS/S2_SR_HARMONIZED",
+            "nir_band": 'B8',  # Near-infrared band
+            "red_band": 'B4',  # Red band
+            "cloud_cover": 'CLOUDY_PIXEL_PERCENTAGE',
+            "scale_factor": 0.0001,  # Sentinel-2 scale factor
+            "add_offset": 0,  # No offset for Sentinel-2
+            "native_scale": 10,  # Red and NIR bands are 10 m
+            "is_landsat": False
+        }
+
+def build_ndvi_collection(region, satellite_source, start_date, end_date):
+    """
+    Build the cloud-filtered image collection with an added NDVI band.
+    
+    Args:
+        region (ee.Geometry): The region of interest
+        satellite_source (str): Satellite data source
+        start_date (ee.Date): Start date (inclusive)
+        end_date (ee.Date): End date (exclusive)
+        
+    Returns:
+        ee.ImageCollection: Images with an 'NDVI' band and a 'sensor' property
+    """
+    config = get_satellite_config(satellite_source)
+    if "sensors" not in config:
+        return build_sensor_ndvi_collection(region, config, start_date, end_date)
+    
+    # Every sensor's NDVI is computed with its own scaling, then the collections are
+    # merged so the whole series is reduced in one pass
+    collection = None
+    for sensor in config["sensors"]:
+        sensor_collection = build_sensor_ndvi_collection(region, get_satellite_config(sensor), start_date, end_date, harmonized=True)
+        collection = sensor_collection if collection is None else collection.merge(sensor_collection)
+    return collection
+
+def build_sensor_ndvi_collection(region, config, start_date, end_date, harmonized=False):
+    """
+    Build one sensor's cloud-filtered image collection with an added NDVI band.
+    
+    Args:
+        region (ee.Geometry): The region of interest
+        config (dict): Sensor configuration from get_satellite_config
+        start_date (ee.Date): Start date (inclusive)
+        end_date (ee.Date): End date (exclusive)
+        harmonized (bool): Use the sensor's collection harmonized with the other sensors, if it has one
+        
+    Returns:
+        ee.ImageCollection: Images with an 'NDVI' band and a 'sensor' property
+    """
+    collection_name = config.get("harmonized_collection_name", config["collection_name"]) if harmonized else config["collection_name"]
+    
+    # Load the selected satellite data
+    image_collection = ee.ImageCollection(collection_name) \
+        .filterDate(start_date, end_date) \
+        .filterBounds(region) \
+        .filter(ee.Filter.lt(config["cloud_cover"], 20))
+    
+    # Function to calculate NDVI for the selected satellite
+    def add_ndvi(image):
+        # Apply scale factor if needed for Landsat
+        if config["is_landsat"]:
+            red = image.select(config["red_band"]).multiply(config["scale_factor"]).add(config["add_offset"])
+            nir = image.select(config["nir_band"]).multiply(config["scale_factor"]).add(config["add_offset"])
+            ndvi = nir.subtract(red).divide(nir.add(red)).rename('NDVI')
+        else:
+            ndvi = image.normalizedDifference([config["nir_band"], config["red_band"]]).rename('NDVI')
+        
+        # Add date and sensor as properties for time series analysis
+        return image.addBands(ndvi) \
+            .set('system:time_start', image.get('system:time_start')) \
+            .set('sensor', config["sensor"])
+    
+    # Map the NDVI function over the image collection
+    return image_collection.map(add_ndvi)
+
+# Temporal aggregation of the NDVI time series: name -> (ee.Date unit, bin length),
+# or None for one point per acquisition day
+TIME_SERIES_AGGREGATIONS = {
+    "per-scene": None,
+    "weekly": ("week", 1),
+    "monthly": ("month", 1)
+}
+
+def mosaic_same_day(ndvi_collection, sensors=None):
+    """
+    Mosaic the images of each acquisition day into one image.
+    
+    A field crossing a tile boundary is covered by several images of the same
+    overpass (e.g. Sentinel-2 granules), each seeing part of it. Mosaicking them
+    gives one observation per day over the whole field instead of several
+    partial ones with the same date.
+    
+    Args:
+        ndvi_collection (ee.ImageCollection): Images with an 'NDVI' band and a 'sensor' property
+        sensors (list): Sensors in the collection; with more than one, each sensor's days are mosaicked separately
+        
+    Returns:
+        ee.ImageCollection: One image per day and sensor, with the day as 'system:index',
+            its 'sensor' and the number of images mosaicked as 'image_count'
+    """
+    if sensors and len(sensors) > 1:
+        # Different sensors seeing the field on the same day stay separate observations
+        collection = None
+        for sensor in sensors:
+            sensor_days = mosaic_same_day(ndvi_collection.filter(ee.Filter.eq('sensor', sensor)))
+            collection = sensor_days if collection is None else collection.merge(sensor_days)
+        return collection
+    
+    days = ndvi_collection.aggregate_array('system:time_start') \
+        .map(lambda time_start: ee.Date(time_start).format('YYYY-MM-dd')) \
+        .distinct()
+    
+    def mosaic_day(day):
+        day_start = ee.Date(day)
+        images = ndvi_collection.filterDate(day_start, day_start.advance(1, 'day'))
+        return images.mosaic() \
+            .set('system:time_start', day_start.millis()) \
+            .set('system:index', day) \
+            .set('sensor', images.first().get('sensor')) \
+            .set('image_count', images.size())
+    
+    return ee.ImageCollection.fromImages(days.map(mosaic_day))
+
+def calendar_bin_start(iso_date, unit):
+    """
+    Get the start of the calendar month, or ISO week (Monday), containing a date.
+    
+    Bins start on calendar boundaries rather than at the request's start_date, so the
+    same week or month is the same bin whatever window it was requested in.
+    """
+    day = datetime.strptime(iso_date, "%Y-%m-%d").date()
+    if unit == "month":
+        return day.replace(day=1).isoformat()
+    if unit == "week":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    raise ValueError(f"Unsupported bin unit: {unit}")
+
+def aggregate_ndvi_collection(daily_collection, start_date, end_date, unit, step):
+    """
+    Composite daily NDVI images into one median image per week or month, server side.
+    
+    Args:
+        daily_collection (ee.ImageCollection): One image per day with an 'NDVI' band (see mosaic_same_day)
+        start_date (ee.Date): Start of the first bin, on a calendar boundary (see calendar_bin_start)
+        end_date (ee.Date): End date (exclusive)
+        unit (str): ee.Date unit of the bins, e.g. "week"
+        step (int): Bin length in units
+        
+    Returns:
+        ee.ImageCollection: One image per bin, with its start as 'system:time_start', its
+            end as 'end_date' and the number of days composited as 'image_count'
+    """
+    # A fully masked placeholder keeps the band present in bins without any images,
+    # so their reduction yields null instead of failing
+    placeholder = ee.ImageCollection([ee.Image.constant(0).rename('NDVI').toFloat().updateMask(0)])
+    
+    bin_count = end_date.difference(start_date, unit).divide(step).ceil()
+    bin_starts = ee.List.sequence(0, bin_count.subtract(1)).map(
+        lambda i: start_date.advance(ee.Number(i).multiply(step), unit)
+    )
+    
+    def composite_bin(bin_start):
+        bin_start = ee.Date(bin_start)
+        bin_end = bin_start.advance(step, unit)
+        images = daily_collection.filterDate(bin_start, bin_end).select('NDVI')
+        return images.merge(placeholder).median() \
+            .set('system:time_start', bin_start.millis()) \
+            .set('system:index', bin_start.format('YYYY-MM-dd')) \
+            .set('end_date', bin_end.format('YYYY-MM-dd')) \
+            .set('image_count', images.size())
+    
+    return ee.ImageCollection.fromImages(bin_starts.map(composite_bin))
+
+def result_cache_params(data, exclude=("polygon",)):
+    """
+    Get the request parameters that identify a cached response (everything but the geometry).
+    """
+    params = data.model_dump(exclude=set(exclude))
+    params["satellite_source"] = params["satellite_source"].lower()
+    return params
+
+def response_has_errors(response):
+    """
+    Check whether any section of a /ndvi-tiles/ response failed, so partial results aren't cached.
+    """
+    return any(
+        isinstance(section, dict) and "error" in section
+        for section in response.values()
+    )
+
+@app.get("/cache-stats/")
+def get_cache_stats():
+    stats = result_cache.stats()
+    if ndvi_history is not None:
+        stats["ndvi_history"] = ndvi_history.stats()
+    if climatology_store is not None:
+        stats["climatology"] = climatology_store.stats()
+    return stats
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Expose request, stage, Earth Engine and cache metrics in the Prometheus text format.
+    """
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Identical concurrent requests share one computation, and concurrent requests
+# for the same field share the stages they have in common
+request_flights = SingleFlight("request")
+stage_flights = SingleFlight("stage")
+
+def shared_stage(polygon_geojson, name, key_params, stage):
+    """
+    Wrap a stage so concurrent requests needing the same stage for the same polygon run it once.
+    
+    Args:
+        polygon_geojson (dict): GeoJSON polygon object
+        name (str): Stage name
+        key_params (dict): The request parameters the stage's result depends on
+        stage (callable): The stage function
+        
+    Returns:
+        callable: Zero-argument stage function
+    """
+    key = polygon_cache_key(polygon_geojson, {"stage": name, **key_params})
+    return lambda: stage_flights.do(key, lambda publish: stage())
+
+def ndvi_stage_names(data):
+    """
+    Get the names of the stages a /ndvi-tiles/ request runs, in response order.
+    """
+    names = ["ndvi_tiles"]
+    if data.time_series:
+        names.append("time_series")
+    if data.include_weather:
+        names.append("weather")
+    if data.include_topography:
+        names.append("topography")
+    if data.include_landcover:
+        names.append("landcover")
+    return names
+
+def is_lng_lat(position):
+    # bool is an int subclass, but true/false are no coordinates
+    return (
+        isinstance(position, list) and len(position) >= 2
+        and all(isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) for value in position[:2])
+    )
+
+def validate_rings(rings, name):
+    # GeoJSON linear rings are closed, so even a triangle has four positions
+    if not isinstance(rings, list) or not rings:
+        raise HTTPException(status_code=400, detail=f"{name} has no rings")
+    for ring in rings:
+        if not isinstance(ring, list) or not all(is_lng_lat(position) for position in ring):
+            raise HTTPException(status_code=400, detail=f"{name} rings must be lists of finite [lng, lat] positions")
+        if len(ring) < 4:
+            raise HTTPException(status_code=400, detail=f"{name} rings need at least 4 positions")
+
+def validate_polygon(polygon_geojson, name="Polygon", allow_multipolygon=False):
+    """
+    Reject anything but a well-formed GeoJSON Polygon (or MultiPolygon) with a 400, before it
+    is hashed into a cache key or sent to Earth Engine.
+    """
+    geometry_type = polygon_geojson.get("type") if isinstance(polygon_geojson, dict) else None
+    if geometry_type == "Polygon":
+        validate_rings(polygon_geojson.get("coordinates"), name)
+    elif geometry_type == "MultiPolygon" and allow_multipolygon:
+        polygons = polygon_geojson.get("coordinates")
+        if not isinstance(polygons, list) or not polygons:
+            raise HTTPException(status_code=400, detail=f"{name} has no polygons")
+        for rings in polygons:
+            validate_rings(rings, name)
+    elif allow_multipolygon:
+        raise HTTPException(status_code=400, detail=f"{name} must be a GeoJSON Polygon or MultiPolygon")
+    else:
+        raise HTTPException(status_code=400, detail="Only GeoJSON Polygon geometries are supported")
+
+def normalize_request_date(value, name="date"):
+    """
+    Parse a YYYY-MM-DD request date into its zero-padded ISO form, or reject it with a 400.
+    
+    Earth Engine also accepts unpadded dates like "2024-3-5", so they are accepted here too,
+    but dates are only compared and used in keys in their ISO form.
+    """
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{name} must use the YYYY-MM-DD format")
+
+def validate_ndvi_request(data):
+    """
+    Reject invalid /ndvi-tiles/ options with a 400 before any work is done.
+    
+    Dates are rewritten in their ISO form, which the cache keys and the NDVI history compare.
+    """
+    validate_polygon(data.polygon)
+    data.start_date = normalize_request_date(data.start_date, "start_date")
+    data.end_date = normalize_request_date(data.end_date, "end_date")
+    if data.end_date <= data.start_date:
+        raise HTTPException(status_code=400, detail="end_date must be after start_date")
+    if data.weather_resolution not in WEATHER_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"weather_resolution must be one of: {', '.join(WEATHER_RESOLUTIONS)}")
+    if data.aggregation not in TIME_SERIES_AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"aggregation must be one of: {', '.join(TIME_SERIES_AGGREGATIONS)}")
+
+def compute_ndvi_response(data, on_stage=None):
+    """
+    Run the /ndvi-tiles/ pipeline for a request, using and filling the result cache.
+    
+    Args:
+        data (PolygonData): The request
+        on_stage (callable): Optional callback(name, result), called as each stage finishes
+        
+    Returns:
+        dict: The response
+    """
+    validate_ndvi_request(data)
+    
+    # Serve repeated requests for the same field and parameters from the cache
+    cache_key = polygon_cache_key(data.polygon, result_cache_params(data))
+    cached_response = result_cache.get(cache_key)
+    cache_lookups.inc(cache="result", result="miss" if cached_response is None else "hit")
+    if cached_response is not None:
+        logger.info("Serving NDVI response from cache")
+        if on_stage is not None:
+            for name, result in cached_response.items():
+                on_stage(name, result)
+        return cached_response
+    
+    # Check if Earth Engine is initialized
+    require_earth_engine()
+    
+    return request_flights.do(
+        ("ndvi-tiles", cache_key),
+        lambda publish: run_ndvi_pipeline(data, cache_key, publish),
+        on_progress=on_stage
+    )
+
+def run_ndvi_pipeline(data, cache_key, on_stage=None):
+    """
+    Compute a /ndvi-tiles/ response with Earth Engine and cache it if every section succeeded.
+    """
+    try:
+        # Extract the polygon from the request
+        ee_polygon = polygon_to_ee_geometry(data.polygon)
+        
+        # Get dates from request parameters or use defaults
+        start_date = ee.Date(data.start_date)
+        end_date = ee.Date(data.end_date)
+        
+        # Log the parameters being used
+        logger.info(f"Processing request with: satellite={data.satellite_source}, start_date={data.start_date}, end_date={data.end_date}, time_series={data.time_series}")
+        logger.info(f"Additional data requested: weather={data.include_weather}, topography={data.include_topography}, landcover={data.include_landcover}")
+        
+        ndvi_collection = build_ndvi_collection(ee_polygon, data.satellite_source, start_date, end_date)
+        
+        def ndvi_tiles_stage():
+            # A registered field's past months and seasons are served from the catalog
+            composite = catalog_composite_tile(data.polygon, data.satellite_source, data.start_date, data.end_date)
+            if composite is not None:
+                return {
+                    "url": composite["tile_url"],
+                    "attribution": f"Google Earth Engine | {data.satellite_source}",
+                    "min": 0,
+                    "max": 1,
+                    "satellite": data.satellite_source,
+                    "start_date": data.start_date,
+                    "end_date": data.end_date,
+                    "catalog": {
+                        "period": composite["period"],
+                        "stats": composite["stats"],
+                        "tile_expires_at": composite["tile_expires_at"]
+                    }
+                }
+            
+            # Get the median NDVI value
+            median_ndvi = ndvi_collection.select('NDVI').median()
+            
+            # Create a tile URL template for Leaflet
+            map_id = median_ndvi.getMapId(NDVI_VIS_PARAMS)
+            
+            return {
+                "url": map_id['tile_fetcher'].url_format,
+                "attribution": f"Google Earth Engine | {data.satellite_source}",
+                "min": 0,
+                "max": 1,
+                "satellite": data.satellite_source,
+                "start_date": data.start_date,
+                "end_date": data.end_date
+            }
+        
+        # Reduction scales are planned from the field's area, computed locally without a round trip
+        area_m2 = polygon_area_m2(data.polygon)
+        native_scale = get_satellite_config(data.satellite_source)["native_scale"]
+        
+        # Land cover data, using the most recent complete year
+        landcover_year = datetime.now().year - 1
+        dates = {"start_date": data.start_date, "end_date": data.end_date}
+        
+        def time_series_stage():
+            # Daily observations are kept in the history; weekly and monthly composites are computed whole
+            if ndvi_history is not None and data.aggregation == "per-scene":
+                return get_incremental_time_series(
+                    data.polygon, ee_polygon, data.satellite_source, data.start_date, data.end_date, area_m2, native_scale
+                )
+            return get_time_series_data(
+                ndvi_collection, ee_polygon, area_m2, native_scale, data.start_date, data.end_date, data.aggregation,
+                get_satellite_config(data.satellite_source).get("sensors")
+            )
+        
+        # Each stage is keyed only on the parameters its result depends on
+        stage_functions = {
+            "ndvi_tiles": (ndvi_tiles_stage, {"satellite_source": data.satellite_source, **dates}),
+            "time_series": (time_series_stage, {"satellite_source": data.satellite_source, "aggregation": data.aggregation, **dates}),
+            "weather": (lambda: get_weather_data(ee_polygon, start_date, end_date, data.weather_resolution), {"weather_resolution": data.weather_resolution, **dates}),
+            "topography": (lambda: get_topography_data(ee_polygon, area_m2), {}),
+            "landcover": (lambda: get_landcover_data(ee_polygon, area_m2, year=landcover_year), {"year": landcover_year})
+        }
+        
+        # The stages are independent, so run them concurrently and let the slowest one set the latency
+        response = run_stages({
+            name: shared_stage(data.polygon, name, stage_functions[name][1], stage_functions[name][0])
+            for name in ndvi_stage_names(data)
+        }, on_stage)
+        
+        # Without the composite there is nothing to show, so fail the request
+        if "error" in response["ndvi_tiles"]:
+            raise_stage_error(response["ndvi_tiles"])
+        
+        if not response_has_errors(response):
+            # Catalog and static layer tile URLs may have been minted earlier, so don't cache past their expiry
+            tile_expires_at = earliest_tile_expiry(response)
+            ttl = min(result_cache.ttl, tile_expires_at - time.time()) if tile_expires_at is not None else None
+            if ttl is None or ttl > 0:
+                result_cache.set(cache_key, response, ttl=ttl)
+        
+        return response
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing request: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing NDVI data: {str(e)}")
+
+# Time series points sent per NDJSON line in streaming mode
+TIME_SERIES_STREAM_BATCH = int(os.environ.get("TIME_SERIES_STREAM_BATCH", 25))
+
+def ndjson_line(record):
+    return json.dumps(record) + "\n"
+
+def stream_ndvi_response(data):
+    """
+    Run the /ndvi-tiles/ pipeline and yield its sections as NDJSON lines as they finish.
+    
+    The composite comes first; sections that finish before it are held back
+    until it is sent. The time series is sent as batches of points followed by
+    its summary. The last line is "done", or "error" if the request failed.
+    
+    Args:
+        data (PolygonData): The request
+        
+    Yields:
+        str: One JSON record per line
+    """
+    sections = queue.Queue()
+    
+    def run():
+        try:
+            compute_ndvi_response(data, on_stage=lambda name, result: sections.put((name, result)))
+            sections.put(("done", None))
+        except HTTPException as e:
+            sections.put(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            sections.put(("error", {"status_code": 500, "detail": str(e)}))
+    
+    # A dedicated thread, so a busy stage pool can't block the stream's own producer
+    threading.Thread(target=run, name="ndvi-stream", daemon=True).start()
+    
+    held_back = []
+    composite_sent = False
+    failed_sections = []
+    
+    def section_lines(name, result):
+        if isinstance(result, dict) and "error" in result:
+            failed_sections.append(name)
+        if name == "time_series" and isinstance(result, dict) and "data" in result:
+            points = result["data"]
+            for start in range(0, len(points), TIME_SERIES_STREAM_BATCH):
+                yield ndjson_line({"type": "time_series_points", "data": points[start:start + TIME_SERIES_STREAM_BATCH]})
+            summary = {key: value for key, value in result.items() if key != "data"}
+            yield ndjson_line({"type": "time_series", "data": summary})
+        else:
+            yield ndjson_line({"type": name, "data": result})
+    
+    while True:
+        name, result = sections.get()
+        
+        if name == "error":
+            yield ndjson_line({"type": "error", **result})
+            return
+        
+        if name == "done":
+            for held_name, held_result in held_back:
+                yield from section_lines(held_name, held_result)
+            yield ndjson_line({"type": "done", "errors": failed_sections})
+            return
+        
+        if not composite_sent and name != "ndvi_tiles":
+            held_back.append((name, result))
+            continue
+        
+        yield from section_lines(name, result)
+        if name == "ndvi_tiles":
+            composite_sent = True
+            for held_name, held_result in held_back:
+                yield from section_lines(held_name, held_result)
+            held_back = []
+
+@app.post("/ndvi-tiles/")
+def get_ndvi_tiles(data: PolygonData, stream: bool = False):
+    """
+    Get the NDVI composite and the requested enrichments for a polygon.
+    
+    With ?stream=true the response is NDJSON (one section per line, sent as
+    each stage finishes) instead of one JSON object.
+    """
+    if not stream:
+        return compute_ndvi_response(data)
+    
+    # Fail fast with a proper status code for input errors
+    validate_ndvi_request(data)
+    
+    return StreamingResponse(
+        stream_ndvi_response(data),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Background jobs for analyses that outlast the load balancer's request timeout
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", 60 * 60))
+MAX_JOBS = int(os.environ.get("MAX_JOBS", 1000))
+
+job_manager = JobManager(
+    LocalJobQueue(workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE),
+    retention_seconds=JOB_RETENTION_SECONDS,
+    max_jobs=MAX_JOBS
+)
+
+registry.register(Gauge("tensorfarm_result_cache_entries", "Responses in the result cache", lambda: len(result_cache.backend)))
+registry.register(Gauge("tensorfarm_job_queue_depth", "Jobs waiting for a worker", job_manager.queue.depth))
+
+# How often the event stream checks for new job events, and how often it sends a keepalive
+JOB_EVENT_POLL_SECONDS = 0.5
+JOB_EVENT_KEEPALIVE_SECONDS = 15
+
+def get_job_or_404(job_id):
+    try:
+        return job_manager.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+@app.post("/jobs/ndvi-tiles/", status_code=202)
+def submit_ndvi_tiles_job(data: PolygonData):
+    """
+    Queue a /ndvi-tiles/ analysis and return its job ID immediately.
+    
+    Args:
+        data (PolygonData): Same body as /ndvi-tiles/
+        
+    Returns:
+        dict: job_id, status and the URLs for polling and for the event stream
+    """
+    # Reject bad input now rather than in a failed job
+    validate_ndvi_request(data)
+    
+    try:
+        # The job runs in the submitting request's context, so its Earth Engine
+        # calls are scheduled as that client's
+        context = contextvars.copy_context()
+        job = job_manager.submit(
+            "ndvi-tiles",
+            lambda job: context.run(compute_ndvi_response, data, on_stage=job.stage_finished),
+            stages=ndvi_stage_names(data)
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stages": job.stages,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }
+
+@app.get("/jobs/")
+def get_job_stats():
+    return job_manager.stats()
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """
+    Get a job's status, the stage results finished so far, and the result or error once done.
+    """
+    return get_job_or_404(job_id).snapshot()
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Follow a job as Server-Sent Events.
+    
+    Events are "status" (queued/running), "stage" (one per finished stage, with
+    its result) and a final "done" (with the result or error), after which the
+    stream ends. Reconnecting clients resume after the Last-Event-ID header.
+    """
+    job = get_job_or_404(job_id)
+    
+    try:
+        last_event_id = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        last_event_id = 0
+    
+    async def event_stream():
+        sent = last_event_id
+        idle_seconds = 0
+        while True:
+            events = job.events_after(sent)
+            for event_id, event, payload in events:
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
+                sent = event_id
+                if event == "done":
+                    return
+            
+            if await request.is_disconnected():
+                return
+            
+            idle_seconds = 0 if events else idle_seconds + JOB_EVENT_POLL_SECONDS
+            if idle_seconds >= JOB_EVENT_KEEPALIVE_SECONDS:
+                # A comment line keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                idle_seconds = 0
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def get_date_tile_url(polygon_geojson, satellite_source, start, end):
+    """
+    Get the NDVI tile URL for a single date or date range, minting a map ID only on a cache miss.
+    
+    Args:
+        polygon_geojson (dict): GeoJSON polygon object
+        satellite_source (str): Satellite data source
+        start (str): Start date (YYYY-MM-DD, inclusive)
+        end (str): End date (YYYY-MM-DD, exclusive)
+        
+    Returns:
+        str: Tile URL template for Leaflet
+    """
+    def mint():
+        ee_polygon = polygon_to_ee_geometry(polygon_geojson)
+        ndvi_collection = build_ndvi_collection(ee_polygon, satellite_source, ee.Date(start), ee.Date(end))
+        
+        # Several scenes can share a date, so render their median
+        map_id = ndvi_collection.select('NDVI').median().getMapId(NDVI_VIS_PARAMS)
+        return map_id['tile_fetcher'].url_format
+    
+    # The same field drawn with another starting vertex or winding order shares the tile URL
+    field_key = polygon_cache_key(polygon_geojson, {})
+    tile_url, _ = cached_tile_url("date_tiles", [field_key, satellite_source.lower(), start, end], mint)
+    return tile_url
+
+def cached_tile_url(cache_name, key, mint):
+    """
+    Get a tile URL from the date tile cache, minting it only on a miss or after it expired.
+    
+    Args:
+        cache_name (str): Cache label for the lookup metrics
+        key (list): JSON-serializable parameters identifying the tile layer
+        mint (callable): Zero-argument function minting the tile URL
+        
+    Returns:
+        tuple: (tile URL template for Leaflet, time the URL is renewed at)
+    """
+    cache_key = json.dumps([cache_name, key], sort_keys=True)
+    now = time.time()
+    
+    with date_tile_cache_lock:
+        cached = date_tile_cache.get(cache_key)
+        if cached is not None and cached[1] > now:
+            cache_lookups.inc(cache=cache_name, result="hit")
+            return cached
+    cache_lookups.inc(cache=cache_name, result="miss")
+    
+    cached = (mint(), now + TILE_URL_CACHE_TTL_SECONDS)
+    
+    with date_tile_cache_lock:
+        # Drop expired entries, then the oldest ones if the cache is still full
+        for expired in [cached_key for cached_key, value in date_tile_cache.items() if value[1] <= now]:
+            del date_tile_cache[expired]
+        while len(date_tile_cache) >= MAX_CACHED_DATE_TILES:
+            del date_tile_cache[next(iter(date_tile_cache))]
+        date_tile_cache[cache_key] = cached
+    
+    return cached
+
+@app.post("/ndvi-tiles/date/")
+def get_ndvi_date_tile(data: DateTileRequest):
+    """
+    Get the NDVI tile URL for one time series date (or a date range) on demand.
+    """
+    validate_polygon(data.polygon)
+    start = normalize_request_date(data.date)
+    if data.end_date:
+        end = normalize_request_date(data.end_date, "end_date")
+    else:
+        end = (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end_date must be after date")
+    
+    require_earth_engine()
+    
+    try:
+        tile_url = get_date_tile_url(data.polygon, data.satellite_source, start, end)
+        
+        return {
+            "url": tile_url,
+            "attribution": f"Google Earth Engine | {data.satellite_source}",
+            "min": 0,
+            "max": 1,
+            "satellite": data.satellite_source,
+            "date": start,
+            "end_date": end
+        }
+    
+    except HTTPException:
+        raise
+    except EarthEngineBusyError as e:
+        raise earth_engine_busy(str(e), e.retry_after)
+    except Exception as e:
+        logger.error(f"Error generating NDVI tile for {data.date}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generating NDVI tile: {str(e)}")
+
+# Precomputed monthly/seasonal composites for registered fields
+CATALOG_ENABLED = os.environ.get("CATALOG_ENABLED", "true").lower() in ("1", "true", "yes")
+CATALOG_PATH = os.environ.get(
+    "CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "catalog.sqlite3")
+)
+CATALOG_HISTORY_MONTHS = int(os.environ.get("CATALOG_HISTORY_MONTHS", 24))
+CATALOG_REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", 60 * 60))
+CATALOG_CURRENT_REFRESH_SECONDS = float(os.environ.get("CATALOG_CURRENT_REFRESH_SECONDS", 6 * 60 * 60))
+
+def catalog_field_id(polygon_geojson, satellite_source):
+    # Same field and sensor, however the polygon was drawn, gives the same ID
+    return polygon_cache_key(polygon_geojson, {"catalog": satellite_source.lower()})[:24]
+
+def build_median_ndvi(polygon_geojson, satellite_source, start, end):
+    region = polygon_to_ee_geometry(polygon_geojson)
+    collection = build_ndvi_collection(region, satellite_source, ee.Date(start), ee.Date(end))
+    return region, collection, collection.select('NDVI').median()
+
+def compute_catalog_composite(polygon_geojson, satellite_source, start, end):
+    """
+    Compute the median NDVI composite of one period: summary statistics and a tile URL.
+    
+    Returns:
+        tuple: (stats dict, tile URL or None if the period has no scenes)
+    """
+    region, collection, median_ndvi = build_median_ndvi(polygon_geojson, satellite_source, start, end)
+    reduction = plan_reduction(polygon_area_m2(polygon_geojson), get_satellite_config(satellite_source)["native_scale"])
+    
+    # Scene count and statistics come back in one round trip
+    result = ee.Dictionary({
+        "image_count": collection.size(),
+        "ndvi": median_ndvi.reduceRegion(
+            reducer=ee.Reducer.mean().combine(ee.Reducer.minMax(), sharedInputs=True),
+            geometry=region,
+            **reduce_region_args(reduction)
+        )
+    }).getInfo()
+    
+    ndvi_stats = result.get("ndvi") or {}
+    stats = {
+        "image_count": result.get("image_count", 0),
+        "mean_ndvi": ndvi_stats.get("NDVI_mean"),
+        "min_ndvi": ndvi_stats.get("NDVI_min"),
+        "max_ndvi": ndvi_stats.get("NDVI_max"),
+        "scale": reduction["scale"]
+    }
+    
+    # A period without scenes has nothing to render
+    if not stats["image_count"]:
+        return stats, None
+    return stats, median_ndvi.getMapId(NDVI_VIS_PARAMS)['tile_fetcher'].url_format
+
+def mint_catalog_tile_url(polygon_geojson, satellite_source, start, end):
+    _, _, median_ndvi = build_median_ndvi(polygon_geojson, satellite_source, start, end)
+    return median_ndvi.getMapId(NDVI_VIS_PARAMS)['tile_fetcher'].url_format
+
+composite_catalog = CompositeCatalog(CATALOG_PATH) if CATALOG_ENABLED else None
+catalog_scheduler = CatalogScheduler(
+    composite_catalog,
+    compute_catalog_composite,
+    mint_catalog_tile_url,
+    tile_url_ttl=TILE_URL_CACHE_TTL_SECONDS,
+    settle_days=HISTORY_SETTLE_DAYS,
+    refresh_interval=CATALOG_REFRESH_SECONDS,
+    current_refresh_seconds=CATALOG_CURRENT_REFRESH_SECONDS,
+    ready=lambda: ee_initialized
+) if CATALOG_ENABLED else None
+
+def catalog_composite_tile(polygon_geojson, satellite_source, start, end):
+    """
+    Get the catalog's final composite for exactly [start, end), renewing its tile URL if it expired.
+    
+    Returns:
+        dict: The composite, or None if the catalog doesn't have it
+    """
+    if composite_catalog is None:
+        return None
+    
+    field_id = catalog_field_id(polygon_geojson, satellite_source)
+    composite = composite_catalog.find_composite(field_id, start, end)
+    if composite is None or not composite["tile_url"]:
+        return None
+    
+    if composite["tile_expires_at"] <= time.time():
+        composite["tile_url"] = mint_catalog_tile_url(polygon_geojson, satellite_source, start, end)
+        composite["tile_expires_at"] = time.time() + TILE_URL_CACHE_TTL_SECONDS
+        composite_catalog.renew_tile_url(field_id, composite["period_type"], composite["period"], composite["tile_url"], composite["tile_expires_at"])
+    
+    return composite
+
+def require_catalog():
+    if composite_catalog is None:
+        raise HTTPException(status_code=404, detail="The composite catalog is disabled")
+
+@app.post("/catalog/fields/", status_code=201)
+def register_catalog_field(data: CatalogFieldData):
+    """
+    Register a field so its monthly and seasonal composites are precomputed in the background.
+    """
+    require_catalog()
+    
+    validate_polygon(data.polygon)
+    
+    unknown = [period_type for period_type in data.period_types if period_type not in PERIOD_TYPES]
+    if unknown or not data.period_types:
+        raise HTTPException(status_code=400, detail=f"period_types must be a non-empty list of: {', '.join(PERIOD_TYPES)}")
+    
+    if data.history_start is not None:
+        history_start = normalize_request_date(data.history_start, "history_start")
+    else:
+        today = datetime.now()
+        months_ago = today.year * 12 + today.month - 1 - CATALOG_HISTORY_MONTHS
+        history_start = f"{months_ago // 12:04d}-{months_ago % 12 + 1:02d}-01"
+    
+    field = composite_catalog.register_field(
+        catalog_field_id(data.polygon, data.satellite_source),
+        data.polygon,
+        data.satellite_source,
+        history_start,
+        data.period_types,
+        name=data.name
+    )
+    
+    # Start computing the new field's composites now rather than at the next pass
+    catalog_scheduler.wake()
+    return field
+
+@app.get("/catalog/fields/")
+def list_catalog_fields():
+    require_catalog()
+    return {"fields": composite_catalog.list_fields()}
+
+@app.get("/catalog/")
+def get_catalog_status():
+    require_catalog()
+    return {**composite_catalog.stats(), "last_run": catalog_scheduler.last_run}
+
+@app.delete("/catalog/fields/{field_id}")
+def delete_catalog_field(field_id: str):
+    require_catalog()
+    try:
+        composite_catalog.delete_field(field_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Field not found")
+    return {"deleted": field_id}
+
+@app.get("/catalog/fields/{field_id}/composites")
+def get_catalog_composites(field_id: str, period_type: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    Get a registered field's precomputed composites, optionally filtered by period type and date range.
+    
+    Tile URLs that have expired are renewed before they are returned.
+    """
+    require_catalog()
+    try:
+        field = composite_catalog.get_field(field_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Field not found")
+    
+    if period_type is not None and period_type not in PERIOD_TYPES:
+        raise HTTPException(status_code=400, detail=f"period_type must be one of: {', '.join(PERIOD_TYPES)}")
+    
+    composites = composite_catalog.composites(field_id, period_type, start_date, end_date)
+    
+    now = time.time()
+    for composite in composites:
+        if composite["tile_url"] and composite["tile_expires_at"] <= now and ee_initialized:
+            try:
+                composite["tile_url"] = mint_catalog_tile_url(field["polygon"], field["satellite_source"], composite["start_date"], composite["end_date"])
+                composite["tile_expires_at"] = time.time() + TILE_URL_CACHE_TTL_SECONDS
+                composite_catalog.renew_tile_url(field_id, composite["period_type"], composite["period"], composite["tile_url"], composite["tile_expires_at"])
+            except Exception as e:
+                logger.error(f"Could not renew tile URL for {field_id} {composite['period']}: {e}")
+                composite["tile_url"] = None
+    
+    return {"field": field, "composites": composites, "count": len(composites)}
+
+# Upper limit on fields per batch request
+MAX_BATCH_FIELDS = int(os.environ.get("MAX_BATCH_FIELDS", 1000))
+
+def parse_batch_fields(fields_geojson, id_property):
+    """
+    Split a FeatureCollection or MultiPolygon of fields into individual field geometries.
+    
+    Args:
+        fields_geojson (dict): GeoJSON FeatureCollection (Polygon/MultiPolygon features) or MultiPolygon
+        id_property (str): Feature property holding the field ID (falls back to the feature id, then its index)
+        
+    Returns:
+        list: (field ID, GeoJSON geometry) tuples
+    """
+    geojson_type = fields_geojson.get("type")
+    
+    if geojson_type == "MultiPolygon":
+        polygons = fields_geojson.get("coordinates")
+        if not isinstance(polygons, list):
+            raise HTTPException(status_code=400, detail="MultiPolygon coordinates must be a list of polygons")
+        fields = [(str(i), {"type": "Polygon", "coordinates": polygon}) for i, polygon in enumerate(polygons)]
+    elif geojson_type == "FeatureCollection":
+        features = fields_geojson.get("features", [])
+        if not isinstance(features, list):
+            raise HTTPException(status_code=400, detail="FeatureCollection features must be a list")
+        fields = []
+        for i, feature in enumerate(features):
+            if not isinstance(feature, dict):
+                raise HTTPException(status_code=400, detail=f"Feature {i} must be a GeoJSON Feature object")
+            properties = feature.get("properties") or {}
+            if not isinstance(properties, dict):
+                raise HTTPException(status_code=400, detail=f"Feature {i} properties must be an object")
+            field_id = properties.get(id_property, feature.get("id", i))
+            fields.append((str(field_id), feature.get("geometry") or {}))
+    else:
+        raise HTTPException(status_code=400, detail="fields must be a GeoJSON FeatureCollection or MultiPolygon")
+    
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields provided")
+    if len(fields) > MAX_BATCH_FIELDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FIELDS} fields are allowed per request")
+    if len(set(field_id for field_id, _ in fields)) != len(fields):
+        raise HTTPException(status_code=400, detail="Field IDs must be unique")
+    for field_id, geometry in fields:
+        validate_polygon(geometry, name=f"Field {field_id}", allow_multipolygon=True)
+    
+    return fields
+
+def get_batch_field_stats(ndvi_collection, fields_fc, series_collection, reduction, end_date=None, tag_sensor=False):
+    """
+    Compute per-field composite NDVI (and optionally time series) for many fields in one getInfo() call.
+    
+    Args:
+        ndvi_collection (ee.ImageCollection): Images with an 'NDVI' band, already filtered to the fields
+        fields_fc (ee.FeatureCollection): Field features with a 'field_id' property
+        series_collection (ee.ImageCollection): Images to compute the time series over (see
+            time_series_collection), or None for no time series
+        reduction (dict): Reduction plan from plan_reduction
+        end_date (str): Request end date, which aggregated points' end dates are clipped to
+        tag_sensor (bool): Whether to tag daily points with their sensor (harmonized series)
+        
+    Returns:
+        dict: Field ID -> field results
+    """
+    include_series = series_collection is not None
+    
+    # Drop geometries from the results so the payload only carries the values
+    def to_value_feature(image=None):
+        def convert(feature):
+            properties = {"field_id": feature.get("field_id"), "ndvi": feature.get("mean")}
+            if image is not None:
+                properties["date"] = ee.Date(image.get('system:time_start')).format('YYYY-MM-dd')
+                properties["end_date"] = image.get('end_date')
+                properties["image_count"] = image.get('image_count')
+                properties["sensor"] = image.get('sensor')
+            return ee.Feature(None, properties)
+        return convert
+    
+    median_ndvi = ndvi_collection.select('NDVI').median()
+    results = {
+        "composite": median_ndvi.reduceRegions(
+            collection=fields_fc,
+            reducer=ee.Reducer.mean(),
+            scale=reduction["scale"],
+            tileScale=reduction["tile_scale"]
+        ).map(to_value_feature())
+    }
+    
+    if include_series:
+        # One reduceRegions pass per image covers every field
+        def field_means(image):
+            return image.select('NDVI').reduceRegions(
+                collection=fields_fc,
+                reducer=ee.Reducer.mean(),
+                scale=reduction["scale"],
+                tileScale=reduction["tile_scale"]
+            ).map(to_value_feature(image))
+        
+        results["series"] = series_collection.map(field_means).flatten().filter(ee.Filter.notNull(['ndvi']))
+    
+    results = ee.Dictionary(results).getInfo()
+    
+    fields = {}
+    for feature in results["composite"]["features"]:
+        properties = feature["properties"]
+        fields[properties["field_id"]] = {"composite_ndvi": properties.get("ndvi")}
+    
+    if include_series:
+        points_by_field = {field_id: [] for field_id in fields}
+        for feature in results["series"]["features"]:
+            properties = feature["properties"]
+            point = {key: value for key, value in properties.items() if key != "field_id" and value is not None}
+            points_by_field.setdefault(properties["field_id"], []).append(time_series_point(point, end_date, tag_sensor))
+        for field_id, points in points_by_field.items():
+            fields.setdefault(field_id, {"composite_ndvi": None})["time_series"] = summarize_time_series(points)
+    
+    return fields
+
+@app.post("/ndvi-tiles/batch/")
+def get_batch_ndvi(data: BatchFieldsData):
+    """
+    Get NDVI statistics for many fields at once, keyed by field ID.
+    
+    The satellite collection is filtered once over the union of all fields and every
+    field is reduced in the same reduceRegions pass, so cost grows slowly with field count.
+    """
+    if data.aggregation not in TIME_SERIES_AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"aggregation must be one of: {', '.join(TIME_SERIES_AGGREGATIONS)}")
+    data.start_date = normalize_request_date(data.start_date, "start_date")
+    data.end_date = normalize_request_date(data.end_date, "end_date")
+    if data.end_date <= data.start_date:
+        raise HTTPException(status_code=400, detail="end_date must be after start_date")
+    fields = parse_batch_fields(data.fields, data.id_property)
+    
+    # Serve repeated batches from the cache, keyed on every field's normalized outer ring
+    outer_rings = [ring for _, geometry in fields for ring in (
+        [geometry["coordinates"][0]] if geometry["type"] == "Polygon" else [polygon[0] for polygon in geometry["coordinates"]]
+    )]
+    params = result_cache_params(data, exclude={"fields"})
+    params["field_ids"] = [field_id for field_id, _ in fields]
+    cache_key = polygon_cache_key({"type": "FieldBatch", "coordinates": outer_rings}, params)
+    cached_response = result_cache.get(cache_key)
+    cache_lookups.inc(cache="result", result="miss" if cached_response is None else "hit")
+    if cached_response is not None:
+        logger.info("Serving batch NDVI response from cache")
+        return cached_response
+    
+    require_earth_engine()
+    
+    return request_flights.do(("batch", cache_key), lambda publish: run_batch_pipeline(data, fields, cache_key))
+
+def run_batch_pipeline(data, fields, cache_key):
+    """
+    Compute a batch response with Earth Engine and cache it.
+    """
+    try:
+        fields_fc = ee.FeatureCollection([
+            ee.Feature(ee.Geometry(geometry), {"field_id": field_id})
+            for field_id, geometry in fields
+        ])
+        
+        logger.info(f"Processing batch request with {len(fields)} fields: satellite={data.satellite_source}, start_date={data.start_date}, end_date={data.end_date}")
+        
+        # Filter the collection once over the union of all fields
+        ndvi_collection = build_ndvi_collection(
+            fields_fc.geometry(), data.satellite_source, ee.Date(data.start_date), ee.Date(data.end_date)
+        )
+        
+        def ndvi_tiles_stage():
+            map_id = ndvi_collection.select('NDVI').median().getMapId(NDVI_VIS_PARAMS)
+            return {
+                "url": map_id['tile_fetcher'].url_format,
+                "attribution": f"Google Earth Engine | {data.satellite_source}",
+                "min": 0,
+                "max": 1,
+                "satellite": data.satellite_source,
+                "start_date": data.start_date,
+                "end_date": data.end_date
+            }
+        
+        sensors = get_satellite_config(data.satellite_source).get("sensors")
+        
+        # One reduceRegions pass touches the pixels of every field, so plan on their total area
+        reduction = plan_reduction(
+            sum(polygon_area_m2(geometry) for _, geometry in fields),
+            get_satellite_config(data.satellite_source)["native_scale"],
+            pixel_budget=SERIES_PIXEL_BUDGET if data.time_series else None
+        )
+        
+        response = run_stages({
+            "ndvi_tiles": ndvi_tiles_stage,
+            "fields": lambda: get_batch_field_stats(
+                ndvi_collection,
+                fields_fc,
+                time_series_collection(
+                    ndvi_collection, data.start_date, data.end_date, data.aggregation, sensors
+                ) if data.time_series else None,
+                reduction,
+                data.end_date,
+                tag_sensor=bool(sensors)
+            )
+        })
+        
+        for stage in ("ndvi_tiles", "fields"):
+            if "error" in response[stage]:
+                raise_stage_error(response[stage])
+        
+        response["count"] = len(response["fields"])
+        response["reduction"] = reduction
+        result_cache.set(cache_key, response)
+        
+        return response
+    
+    except HTTPException:
+        raise
+    except EarthEngineBusyError as e:
+        raise earth_engine_busy(str(e), e.retry_after)
+    except Exception as e:
+        logger.error(f"Error processing batch request: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing batch NDVI data: {str(e)}")
+
+def summarize_time_series(time_series_data):
+    """
+    Build the time series response structure from date/NDVI points.
+    
+    Args:
+        time_series_data (list): Dicts with "date" and "ndvi" keys
+        
+    Returns:
+        dict: Sorted data, count, unique timestamps and min/max/mean summary
+    """
+    # Sort by date
+    time_series_data.sort(key=lambda x: x['date'])
+    
+    # Prepare the time series response structure. Tile URLs are not minted here;
+    # clients request them per date from /ndvi-tiles/date/ when a date is shown
+    return {
+        "data": time_series_data,  # Date and NDVI value for each image
+        "count": len(time_series_data),
+        "timestamps": sorted(list(set([item["date"] for item in time_series_data]))),  # Sorted unique dates
+        "summary": {
+            "min_ndvi": min([item["ndvi"] for item in time_series_data]) if time_series_data else None,
+            "max_ndvi": max([item["ndvi"] for item in time_series_data]) if time_series_data else None,
+            "mean_ndvi": sum([item["ndvi"] for item in time_series_data]) / len(time_series_data) if time_series_data else None
+        }
+    }
+
+def fetch_time_series_points(ndvi_collection, region, reduction):
+    """
+    Compute the mean NDVI of every image in a collection over a region in one round trip.
+    
+    Args:
+        ndvi_collection (ee.ImageCollection): Images with an 'NDVI' band
+        region (ee.Geometry): The region of interest
+        reduction (dict): Reduction plan from plan_reduction
+        
+    Returns:
+        list: Dicts with "image_id", "date", "ndvi", and "end_date", "image_count" and
+            "sensor" when the images carry them (images without valid pixels are skipped)
+    """
+    # Reduce every image server side into one feature per image so the
+    # whole date/NDVI series comes back in a single getInfo() call
+    def to_ndvi_feature(image):
+        mean_ndvi = image.select('NDVI').reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=region,
+            **reduce_region_args(reduction)
+        ).get('NDVI')
+        return ee.Feature(None, {
+            "image_id": image.get('system:index'),
+            "date": ee.Date(image.get('system:time_start')).format('YYYY-MM-dd'),
+            "end_date": image.get('end_date'),
+            "image_count": image.get('image_count'),
+            "sensor": image.get('sensor'),
+            "ndvi": mean_ndvi
+        })
+    
+    series_features = ee.FeatureCollection(ndvi_collection.map(to_ndvi_feature)).getInfo()["features"]
+    
+    # Get the image collection with dates and NDVI values
+    points = []
+    for feature in series_features:
+        properties = feature["properties"]
+        if properties.get("ndvi") is None:
+            continue
+        point = {"image_id": properties["image_id"], "date": properties["date"], "ndvi": properties["ndvi"]}
+        for key in ("end_date", "image_count", "sensor"):
+            if properties.get(key) is not None:
+                point[key] = properties[key]
+        points.append(point)
+    return points
+
+def time_series_collection(ndvi_collection, start_date, end_date, aggregation="per-scene", sensors=None):
+    """
+    Get the images a time series is reduced over: one mosaic per acquisition day, or one composite per bin.
+    
+    Args:
+        ndvi_collection (ee.ImageCollection): Images with an 'NDVI' band
+        start_date (str): Start date (YYYY-MM-DD, inclusive)
+        end_date (str): End date (YYYY-MM-DD, exclusive)
+        aggregation (str): One of TIME_SERIES_AGGREGATIONS
+        sensors (list): Sensors in the collection (see mosaic_same_day)
+        
+    Returns:
+        ee.ImageCollection: Images with an 'NDVI' band
+    """
+    # Composites mix the sensors of a harmonized series; daily observations keep theirs
+    daily_collection = mosaic_same_day(ndvi_collection, sensors)
+    if TIME_SERIES_AGGREGATIONS[aggregation] is None:
+        return daily_collection
+    unit, step = TIME_SERIES_AGGREGATIONS[aggregation]
+    # The collection only holds the request window, so partial first and last bins only composite that
+    bin_start = calendar_bin_start(start_date, unit)
+    return aggregate_ndvi_collection(daily_collection, ee.Date(bin_start), ee.Date(end_date), unit, step)
+
+def time_series_point(point, end_date=None, tag_sensor=False):
+    """
+    Get the response fields of a time series point, clipping an aggregated point's end to the request's.
+    
+    Daily points of a multi-sensor series are tagged with their sensor when tag_sensor is set.
+    """
+    if "end_date" not in point:
+        if tag_sensor and point.get("sensor"):
+            return {"date": point["date"], "ndvi": point["ndvi"], "sensor": point["sensor"]}
+        return {"date": point["date"], "ndvi": point["ndvi"]}
+    return {
+        "date": point["date"],
+        "end_date": min(point["end_date"], end_date) if end_date else point["end_date"],
+        "ndvi": point["ndvi"],
+        "image_count": point.get("image_count")
+    }
+
+def get_time_series_data(ndvi_collection, region, area_m2, native_scale=30, start_date=None, end_date=None, aggregation="per-scene", sensors=None):
+    """
+    Compute the mean NDVI over a region of every acquisition day, or of every week or month.
+    
+    Args:
+        ndvi_collection (ee.ImageCollection): Images with an 'NDVI' band
+        region (ee.Geometry): The region of interest
+        area_m2 (float): Area of the region, used to plan the reduction scale
+        native_scale (float): Resolution of the sensor's red and NIR bands in meters
+        start_date (str): Start date (YYYY-MM-DD); aggregation bins start on the week or month containing it
+        end_date (str): End date (YYYY-MM-DD, exclusive)
+        aggregation (str): "per-scene" (one point per acquisition day), "weekly" or "monthly"
+        sensors (list): Sensors merged in the collection, for a harmonized series
+        
+    Returns:
+        dict: Dictionary containing the NDVI time series, its summary and the reduction plan
+    """
+    try:
+        # The reduction runs once per image, so it gets the smaller per-image budget
+        reduction = plan_reduction(area_m2, native_scale, pixel_budget=SERIES_PIXEL_BUDGET)
+        
+        series_collection = time_series_collection(ndvi_collection, start_date, end_date, aggregation, sensors)
+        time_series_data = [
+            time_series_point(point, end_date, tag_sensor=bool(sensors))
+            for point in fetch_time_series_points(series_collection, region, reduction)
+        ]
+        
+        result = summarize_time_series(time_series_data)
+        result["aggregation"] = aggregation
+        result["reduction"] = reduction
+        return result
+    
+    except Exception as e:
+        logger.error(f"Error generating time series data: {e}")
+        return stage_error(e)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Persistent per-field NDVI history, so time series requests only fetch scenes they haven't seen
+NDVI_HISTORY_ENABLED = os.environ.get("NDVI_HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+NDVI_HISTORY_PATH = os.environ.get(
+    "NDVI_HISTORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "ndvi_history.sqlite3")
+)
 
-# Initialize Earth Engine
-ee_initialized = False
+# Part of every field fingerprint; bump it when the way observations are computed changes
+# (2: one observation per acquisition day, mosaicked from that day's images)
+NDVI_HISTORY_VERSION = 2
 
-def initialize_earth_engine():
-    global ee_initialized
+ndvi_history = NdviHistoryStore(NDVI_HISTORY_PATH) if NDVI_HISTORY_ENABLED else None
+
+def get_incremental_time_series(polygon_geojson, region, satellite_source, start_date, end_date, area_m2, native_scale=30):
+    """
+    Get the NDVI time series of a field from the history store, fetching only dates it doesn't have yet.
+    
+    Args:
+        polygon_geojson (dict): GeoJSON polygon object, used for the field fingerprint
+        region (ee.Geometry): The region of interest
+        satellite_source (str): Satellite data source
+        start_date (str): Start date (YYYY-MM-DD, inclusive)
+        end_date (str): End date (YYYY-MM-DD, exclusive)
+        area_m2 (float): Area of the region, used to plan the reduction scale
+        native_scale (float): Resolution of the sensor's red and NIR bands in meters
+        
+    Returns:
+        dict: Same structure as get_time_series_data, plus what was fetched
+    """
     try:
-        # Try to initialize with private key if available
-        # Look for credentials in standard locations
-        ee.Initialize(project='tensorfarm')  # Specify your GEE project ID here or pass None
-        logger.info("Earth Engine initialized successfully")
-        ee_initialized = True
-        return True
+        reduction = plan_reduction(area_m2, native_scale, pixel_budget=SERIES_PIXEL_BUDGET)
+        
+        # Observations depend on the field and the reduction scale as well as the sensor
+        field_key = polygon_cache_key(polygon_geojson, {"version": NDVI_HISTORY_VERSION, "scale": reduction["scale"]})
+        config = get_satellite_config(satellite_source)
+        harmonized = "sensors" in config
+        sensors = config["sensors"] if harmonized else (config["sensor"],)
+        
+        # Each sensor's observations are stored separately. Harmonized series read the
+        # harmonized collections, so they don't share the single-sensor histories
+        history_sensors = {sensor: f"harmonized/{sensor}" if harmonized else sensor for sensor in sensors}
+        missing = {
+            sensor: ndvi_history.missing_ranges(field_key, history_sensors[sensor], start_date, end_date)
+            for sensor in sensors
+        }
+        
+        new_points = []
+        if any(missing.values()):
+            # All missing ranges of every sensor are fetched in the same round trip
+            collection = None
+            for sensor, ranges in missing.items():
+                for range_start, range_end in ranges:
+                    range_collection = build_sensor_ndvi_collection(
+                        region, get_satellite_config(sensor), ee.Date(range_start), ee.Date(range_end), harmonized
+                    )
+                    collection = range_collection if collection is None else collection.merge(range_collection)
+            new_points = fetch_time_series_points(mosaic_same_day(collection, sensors), region, reduction)
+            for sensor, ranges in missing.items():
+                sensor_points = [point for point in new_points if point.get("sensor") == sensor]
+                ndvi_history.add(field_key, history_sensors[sensor], sensor_points, ranges)
+        
+        fetched_ranges = sorted({date_range for ranges in missing.values() for date_range in ranges})
+        logger.info(f"NDVI history: fetched {len(new_points)} new observations for {fetched_ranges or 'no'} ranges")
+        
+        observations = []
+        for sensor in sensors:
+            for observation in ndvi_history.observations(field_key, history_sensors[sensor], start_date, end_date):
+                observations.append({**observation, "sensor": sensor} if harmonized else observation)
+        
+        result = summarize_time_series(observations)
+        result["aggregation"] = "per-scene"
+        result["reduction"] = reduction
+        result["history"] = {
+            "fetched_ranges": [list(date_range) for date_range in fetched_ranges],
+            "fetched_observations": len(new_points)
+        }
+        return result
+    
     except Exception as e:
-        error_msg = str(e)
-        logger.error(f"Failed to initialize Earth Engine: {error_msg}")
-        if "no project found" in error_msg or "PERMISSION_DENIED" in error_msg:
-            logger.warning("Authentication issue detected with Google Earth Engine")
-            logger.info("Please follow these steps:")
-            logger.info("1. Run 'earthengine authenticate' in your terminal")
-            logger.info("2. Create a Google Cloud project if you don't have one")
-            logger.info("3. Enable the Earth Engine API in your Google Cloud project")
-            logger.info("4. Set up proper permissions for your account")
-            logger.info("For detailed instructions, visit: https://developers.google.com/earth-engine/guides/python_install")
-        ee_initialized = False
-        return False
+        logger.error(f"Error generating incremental time series data: {e}")
+        return stage_error(e)
 
-# Try to initialize at startup
-initialize_earth_engine()
+# NDVI anomalies against a per-field day-of-year climatology. The climatology is computed
+# once from the years before the window and stored, so later requests only fetch the window
+CLIMATOLOGY_ENABLED = os.environ.get("CLIMATOLOGY_ENABLED", "true").lower() in ("1", "true", "yes")
+CLIMATOLOGY_PATH = os.environ.get(
+    "CLIMATOLOGY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "climatology.sqlite3")
+)
+MAX_BASELINE_YEARS = int(os.environ.get("MAX_BASELINE_YEARS", 10))
+MAX_CLIMATOLOGY_WINDOW_DAYS = 90
 
-app = FastAPI(title="TensorFarm NDVI API", 
-              description="API to get NDVI tiles from Earth Engine for a given polygon")
+# Points at least this many standard deviations from the baseline are counted as anomalous
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", 2.0))
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Part of every stored climatology's baseline identifier; bump it when climatologies are computed differently
+CLIMATOLOGY_VERSION = 1
 
-class PolygonData(BaseModel):
-    polygon: Dict[str, Any]
-    satellite_source: str = "sentinel-2"  # Options: "sentinel-2", "landsat-8", "landsat-9"
-    start_date: str = "2024-11-01"  # Default start date for time series
-    end_date: str = "2025-05-01"  # Default end date for time series
-    time_series: bool = False  # Whether to return time series data
-    include_weather: bool = False  # Whether to include weather data (temperature, precipitation)
-    include_topography: bool = False  # Whether to include topographical data (elevation, slope)
-    include_landcover: bool = False  # Whether to include land cover data (land cover classes, vegetation stats)
+# Diverging palette for z-scores: browner below the baseline, greener above it
+ANOMALY_VIS_PARAMS = {
+    'min': -3,
+    'max': 3,
+    'palette': ['8C510A', 'D8B365', 'F6E8C3', 'F5F5F5', 'C7EAE5', '5AB4AC', '01665E']
+}
 
-@app.get("/")
-def read_root():
-    return {"message": "Welcome to TensorFarm NDVI API"}
+climatology_store = ClimatologyStore(CLIMATOLOGY_PATH) if CLIMATOLOGY_ENABLED else None
 
-@app.get("/auth-status/")
-def check_auth_status():
-    global ee_initialized
+def validate_anomaly_request(data):
+    """
+    Reject invalid /ndvi-anomaly/ options with a 400 before any work is done.
     
-    # Try to initialize if not already initialized
-    if not ee_initialized:
-        initialize_earth_engine()
+    Dates are rewritten in their ISO form, like /ndvi-tiles/ dates.
+    """
+    validate_polygon(data.polygon)
+    data.start_date = normalize_request_date(data.start_date, "start_date")
+    data.end_date = normalize_request_date(data.end_date, "end_date")
+    if data.end_date <= data.start_date:
+        raise HTTPException(status_code=400, detail="end_date must be after start_date")
+    if not 1 <= data.baseline_years <= MAX_BASELINE_YEARS:
+        raise HTTPException(status_code=400, detail=f"baseline_years must be between 1 and {MAX_BASELINE_YEARS}")
+    if not 1 <= data.window_days <= MAX_CLIMATOLOGY_WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"window_days must be between 1 and {MAX_CLIMATOLOGY_WINDOW_DAYS}")
+
+def anomaly_baseline_range(start_date, baseline_years):
+    """
+    Get the baseline of a window: the whole calendar years before the year it starts in.
+    
+    Whole years keep the baseline, and so its stored climatology, the same for every window starting in that year.
+    
+    Returns:
+        tuple: (start_date, end_date), end exclusive
+    """
+    year = int(start_date[:4])
+    return f"{year - baseline_years}-01-01", f"{year}-01-01"
+
+def get_daily_ndvi_series(polygon_geojson, region, satellite_source, start_date, end_date, area_m2, native_scale):
+    """
+    Get the per-scene NDVI series of a field, through the NDVI history when it's enabled.
+    
+    Returns:
+        dict: Same structure as get_time_series_data, or an error result
+    """
+    if ndvi_history is not None:
+        return get_incremental_time_series(polygon_geojson, region, satellite_source, start_date, end_date, area_m2, native_scale)
+    ndvi_collection = build_ndvi_collection(region, satellite_source, ee.Date(start_date), ee.Date(end_date))
+    return get_time_series_data(
+        ndvi_collection, region, area_m2, native_scale, start_date, end_date, "per-scene",
+        get_satellite_config(satellite_source).get("sensors")
+    )
+
+def window_climatology(climatology, dates):
+    """
+    Get the baseline of a window's observations: the mean of their days' climatology means and the pooled standard deviation.
+    
+    Averaged over the observation dates rather than the whole window, so an NDVI mean over the
+    same observations minus this mean is their average deviation from the baseline.
     
+    Returns:
+        tuple: (mean, std), both None if no observation has enough baseline observations for its day
+    """
+    means, variances = [], []
+    for date in dates:
+        mean, std, _ = climatology_at(climatology, date)
+        if mean is not None:
+            means.append(mean)
+            variances.append(std ** 2)
+    
+    if not means:
+        return None, None
+    return sum(means) / len(means), (sum(variances) / len(variances)) ** 0.5
+
+def score_time_series(series, climatology):
+    """
+    Add every point's baseline and z-score to a per-scene time series, and z-score statistics to its summary.
+    
+    Args:
+        series (dict): Time series from get_daily_ndvi_series
+        climatology (dict): Climatology from build_climatology
+        
+    Returns:
+        dict: The time series with "baseline_mean", "baseline_std" and "z_score" per point
+            (None for days without enough baseline observations)
+    """
+    points = []
+    for point in series["data"]:
+        mean, std, _ = climatology_at(climatology, point["date"])
+        points.append({**point, "baseline_mean": mean, "baseline_std": std, "z_score": z_score(point["ndvi"], mean, std)})
+    
+    scores = [point["z_score"] for point in points if point["z_score"] is not None]
     return {
-        "authenticated": ee_initialized,
-        "message": "Earth Engine authenticated successfully" if ee_initialized else "Earth Engine authentication required",
-        "instructions": None if ee_initialized else [
-            "Run 'earthengine authenticate' in your terminal",
-            "Create a Google Cloud project and enable Earth Engine API",
-            "Set up proper permissions for your account",
-            "Restart the API server after authentication"
-        ]
+        **series,
+        "data": points,
+        "summary": {
+            **series["summary"],
+            "mean_z_score": sum(scores) / len(scores) if scores else None,
+            "min_z_score": min(scores) if scores else None,
+            "max_z_score": max(scores) if scores else None,
+            "anomalous_count": sum(1 for score in scores if abs(score) >= ANOMALY_Z_THRESHOLD),
+            "z_threshold": ANOMALY_Z_THRESHOLD
+        }
     }
 
-@app.post("/ndvi-tiles/")
-def get_ndvi_tiles(data: PolygonData):
-    global ee_initialized
+def get_anomaly_tiles(data, region, mean, std):
+    """
+    Get the anomaly tile layer of a window: its mean NDVI as z-scores against the field's baseline.
     
-    # Check if Earth Engine is initialized
-    if not ee_initialized:
-        # Try to initialize again
-        if not initialize_earth_engine():
-            raise HTTPException(
-                status_code=503, 
-                detail="Earth Engine not authenticated. Run 'earthengine authenticate' in your terminal and restart the server."
-            )
+    Every pixel is compared with the field-wide climatology of the window's observation dates,
+    so no baseline imagery is processed again; the layer shows where in the field this
+    window deviates most.
     
+    Returns:
+        dict: Tile URL (None without enough baseline observations) and its value range
+    """
     try:
-        # Extract the polygon from the request
-        polygon_geojson = data.polygon
+        tiles = {
+            "url": None,
+            "attribution": f"Google Earth Engine | {data.satellite_source}",
+            "min": ANOMALY_VIS_PARAMS["min"],
+            "max": ANOMALY_VIS_PARAMS["max"],
+            "satellite": data.satellite_source,
+            "start_date": data.start_date,
+            "end_date": data.end_date,
+            "baseline_mean": mean,
+            "baseline_std": std
+        }
+        if mean is None:
+            return tiles
+        
+        def mint():
+            # The same daily mosaics as the time series, so the layer averages the scored observations
+            ndvi_collection = build_ndvi_collection(region, data.satellite_source, ee.Date(data.start_date), ee.Date(data.end_date))
+            mean_ndvi = mosaic_same_day(ndvi_collection, get_satellite_config(data.satellite_source).get("sensors")) \
+                .select('NDVI') \
+                .mean()
+            anomaly = mean_ndvi.subtract(mean).divide(std).rename('z_score').clip(region)
+            return anomaly.getMapId(ANOMALY_VIS_PARAMS)['tile_fetcher'].url_format
         
-        if polygon_geojson["type"] != "Polygon":
-            raise HTTPException(status_code=400, detail="Only Polygon geometry types are supported")
+        # The same field however it was drawn shares the layer, and the baseline is part of
+        # the key, so a recomputed climatology gets a new layer
+        field_key = polygon_cache_key(data.polygon, {})
+        tiles["url"], tiles["tile_expires_at"] = cached_tile_url(
+            "anomaly_tiles",
+            [field_key, data.satellite_source.lower(), data.start_date, data.end_date, round(mean, 6), round(std, 6)],
+            mint
+        )
+        return tiles
+    
+    except Exception as e:
+        logger.error(f"Error generating anomaly tiles: {e}")
+        return stage_error(e)
+
+@app.post("/ndvi-anomaly/")
+def get_ndvi_anomaly(data: AnomalyRequest):
+    """
+    Compare a window's NDVI with the field's multi-year baseline: z-scores per observation and an anomaly tile layer.
+    """
+    validate_anomaly_request(data)
+    
+    cache_key = polygon_cache_key(data.polygon, {"anomaly": result_cache_params(data)})
+    cached_response = result_cache.get(cache_key)
+    cache_lookups.inc(cache="result", result="miss" if cached_response is None else "hit")
+    if cached_response is not None:
+        logger.info("Serving NDVI anomaly response from cache")
+        return cached_response
+    
+    require_earth_engine()
+    
+    return request_flights.do(("anomaly", cache_key), lambda publish: run_anomaly_pipeline(data, cache_key))
+
+def run_anomaly_pipeline(data, cache_key):
+    """
+    Compute a /ndvi-anomaly/ response, building and storing the field's climatology if it isn't stored yet.
+    """
+    try:
+        ee_polygon = polygon_to_ee_geometry(data.polygon)
+        area_m2 = polygon_area_m2(data.polygon)
+        native_scale = get_satellite_config(data.satellite_source)["native_scale"]
+        baseline_start, baseline_end = anomaly_baseline_range(data.start_date, data.baseline_years)
         
-        # Convert the GeoJSON polygon to an Earth Engine geometry
-        coordinates = polygon_geojson["coordinates"][0]  # Get the outer ring coordinates
-        ee_polygon = ee.Geometry.Polygon(coordinates)
+        # Climatologies are stored per field fingerprint and reduction scale, like the NDVI history
+        reduction = plan_reduction(area_m2, native_scale, pixel_budget=SERIES_PIXEL_BUDGET)
+        field_key = polygon_cache_key(data.polygon, {"version": NDVI_HISTORY_VERSION, "scale": reduction["scale"]})
+        sensor = data.satellite_source.lower()
+        baseline_id = f"v{CLIMATOLOGY_VERSION}:{baseline_start}:{baseline_end}:{data.window_days}"
         
-        # Get dates from request parameters or use defaults
-        start_date = ee.Date(data.start_date)
-        end_date = ee.Date(data.end_date)        # Log the parameters being used
-        logger.info(f"Processing request with: satellite={data.satellite_source}, start_date={data.start_date}, end_date={data.end_date}, time_series={data.time_series}")
-        logger.info(f"Additional data requested: weather={data.include_weather}, topography={data.include_topography}, landcover={data.include_landcover}")
+        climatology = None
+        if climatology_store is not None:
+            climatology = climatology_store.get(field_key, sensor, baseline_id)
+            cache_lookups.inc(cache="climatology", result="miss" if climatology is None else "hit")
+        baseline_cached = climatology is not None
         
-        # Select satellite collection and bands based on source
-        if data.satellite_source.lower() == "landsat-8":
-            collection_name = "LANDSAT/LC08/C02/T1_L2"  # Landsat 8 Collection 2 Tier 1 Level 2
-            nir_band = 'SR_B5'  # Near-infrared band
-            red_band = 'SR_B4'  # Red band
-            cloud_cover = 'CLOUD_COVER'
-            scale_factor = 0.0000275  # Landsat 8 Collection 2 scale factor
-            add_offset = -0.2  # Landsat 8 Collection 2 offset
-        elif data.satellite_source.lower() == "landsat-9":
-            collection_name = "LANDSAT/LC09/C02/T1_L2"  # Landsat 9 Collection 2 Tier 1 Level 2
-            nir_band = 'SR_B5'  # Near-infrared band
-            red_band = 'SR_B4'  # Red band
-            cloud_cover = 'CLOUD_COVER'
-            scale_factor = 0.0000275  # Landsat 9 Collection 2 scale factor
-            add_offset = -0.2  # Landsat 9 Collection 2 offset
-        else:
-            # Default to Sentinel-2
-            collection_name = "COPERNICUS/S2_SR"  # Sentinel-2 Surface Reflectance
-            nir_band = 'B8'  # Near-infrared band
-            red_band = 'B4'  # Red band
-            cloud_cover = 'CLOUDY_PIXEL_PERCENTAGE'
-            scale_factor = 0.0001  # Sentinel-2 scale factor
-            add_offset = 0  # No offset for Sentinel-2
-
-        # Load the selected satellite data
-        image_collection = ee.ImageCollection(collection_name) \
-            .filterDate(start_date, end_date) \
-            .filterBounds(ee_polygon) \
-            .filter(ee.Filter.lt(cloud_cover, 20))
-        
-        # Function to calculate NDVI for the selected satellite
-        def add_ndvi(image):
-            # Apply scale factor if needed for Landsat
-            if data.satellite_source.lower() in ["landsat-8", "landsat-9"]:
-                red = image.select(red_band).multiply(scale_factor).add(add_offset)
-                nir = image.select(nir_band).multiply(scale_factor).add(add_offset)
-                ndvi = nir.subtract(red).divide(nir.add(red)).rename('NDVI')
+        series = None
+        if climatology is None:
+            # The baseline years and the window are fetched together in one round trip
+            logger.info(f"Building NDVI climatology for {baseline_start} to {baseline_end}")
+            combined = get_daily_ndvi_series(
+                data.polygon, ee_polygon, data.satellite_source, baseline_start, data.end_date, area_m2, native_scale
+            )
+            if "error" in combined:
+                raise_stage_error(combined)
+            
+            climatology = build_climatology([point for point in combined["data"] if point["date"] < baseline_end], data.window_days)
+            if climatology_store is not None:
+                climatology = climatology_store.put(field_key, sensor, baseline_id, climatology)
             else:
-                ndvi = image.normalizedDifference([nir_band, red_band]).rename('NDVI')
+                climatology["created_at"] = time.time()
             
-            # Add date as a property for time series analysis
-            return image.addBands(ndvi).set('system:time_start', image.get('system:time_start'))
-        
-        # Map the NDVI function over the image collection
-        ndvi_collection = image_collection.map(add_ndvi)
-        
-        # Get the median NDVI value
-        median_ndvi = ndvi_collection.select('NDVI').median()
-        
-        # Define visualization parameters
-        vis_params = {
-            'min': 0, 
-            'max': 1, 
-            'palette': [
-                'FFFFFF', 'CE7E45', 'DF923D', 'F1B555', 'FCD163', '99B718',
-                '74A901', '66A000', '529400', '3E8601', '207401', '056201',
-                '004C00', '023B01', '012E01', '011D01', '011301'
-            ]
-        }
-          # Create a tile URL template for Leaflet
-        map_id = median_ndvi.getMapId(vis_params)
-        tile_url_template = map_id['tile_fetcher'].url_format
+            window_points = [point for point in combined["data"] if data.start_date <= point["date"] < data.end_date]
+            series = {**combined, **summarize_time_series(window_points)}
+        
+        else:
+            # Only the window is fetched, and through the NDVI history only its new scenes
+            series = get_daily_ndvi_series(
+                data.polygon, ee_polygon, data.satellite_source, data.start_date, data.end_date, area_m2, native_scale
+            )
+            if "error" in series:
+                raise_stage_error(series)
+        
+        # The tiles are scaled with the baseline of the observations the series found
+        mean, std = window_climatology(climatology, [point["date"] for point in series["data"]])
         
         response = {
-            "ndvi_tiles": {
-                "url": tile_url_template,
-                "attribution": f"Google Earth Engine | {data.satellite_source}",
-                "min": 0,
-                "max": 1,
-                "satellite": data.satellite_source,
-                "start_date": data.start_date,
-                "end_date": data.end_date
+            "anomaly_tiles": get_anomaly_tiles(data, ee_polygon, mean, std),
+            "time_series": score_time_series(series, climatology),
+            "baseline": {
+                "start_date": baseline_start,
+                "end_date": baseline_end,
+                "years": data.baseline_years,
+                "window_days": data.window_days,
+                "observation_count": climatology["observation_count"],
+                "computed_at": climatology["created_at"],
+                "cached": baseline_cached
             }
         }
         
-        # Add time series data if requested
-        if data.time_series:
-            try:
-                # Get the image collection with dates and NDVI values
-                time_series_data = []
-                
-                # Create a list of available dates with NDVI values
-                images_list = ndvi_collection.toList(ndvi_collection.size())
-                size = images_list.size().getInfo()
-                
-                for i in range(size):
-                    image = ee.Image(images_list.get(i))
-                    date = ee.Date(image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
-                    
-                    # Calculate mean NDVI for this date
-                    mean_ndvi = image.select('NDVI').reduceRegion(
-                        reducer=ee.Reducer.mean(),
-                        geometry=ee_polygon,
-                        scale=30,  # 30 meters for Landsat, 10 meters for Sentinel-2
-                        maxPixels=1e9
-                    ).get('NDVI').getInfo()
-                    
-                    if mean_ndvi is not None:
-                        time_series_data.append({
-                            "date": date,
-                            "ndvi": mean_ndvi
-                        })
-                
-                # Sort by date
-                time_series_data.sort(key=lambda x: x['date'])                # Prepare the time series response structure with synchronized data
-                response["time_series"] = {
-                    "data": [],  # Will contain integrated data for each date (NDVI value and tile URL)
-                    "count": len(time_series_data),
-                    "timestamps": sorted(list(set([item["date"] for item in time_series_data]))),  # Sorted unique dates
-                    "summary": {
-                        "min_ndvi": min([item["ndvi"] for item in time_series_data]) if time_series_data else None,
-                        "max_ndvi": max([item["ndvi"] for item in time_series_data]) if time_series_data else None,
-                        "mean_ndvi": sum([item["ndvi"] for item in time_series_data]) / len(time_series_data) if time_series_data else None
-                    }
-                }
-                
-                # Generate tile URLs for each date in the time series and integrate with NDVI data
-                for i in range(size):
-                    try:
-                        image = ee.Image(images_list.get(i))
-                        date = ee.Date(image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
-                        
-                        # Get NDVI band and create a tile URL for this specific date
-                        ndvi_image = image.select('NDVI')
-                        date_map_id = ndvi_image.getMapId(vis_params)
-                        
-                        # Find the corresponding NDVI value for this date
-                        ndvi_value = next((item["ndvi"] for item in time_series_data if item["date"] == date), None)
-                        
-                        if ndvi_value is not None:
-                            # Add integrated data (both NDVI value and tile URL) for this date
-                            response["time_series"]["data"].append({
-                                "date": date,
-                                "ndvi": ndvi_value,
-                                "url": date_map_id['tile_fetcher'].url_format
-                            })
-                    except Exception as e:
-                        logger.warning(f"Could not generate tiles for date {i}: {e}")
-                
-                # Add additional data if requested
-                # Weather data
-                if data.include_weather:
-                    logger.info("Fetching weather data...")
-                    weather_data = get_weather_data(ee_polygon, start_date, end_date)
-                    response["weather"] = weather_data
-                
-                # Topographical data
-                if data.include_topography:
-                    logger.info("Fetching topographical data...")
-                    topo_data = get_topography_data(ee_polygon)
-                    response["topography"] = topo_data
-                  # Climate data
-                if data.include_landcover:
-                    logger.info("Fetching land cover data...")
-                    # Use the most recent complete year for land cover data
-                    current_year = datetime.now().year - 1  # Previous year to ensure complete data
-                    landcover_data = get_landcover_data(ee_polygon, year=current_year)
-                    response["landcover"] = landcover_data
-            except Exception as e:
-                logger.error(f"Error generating time series data: {e}")
-                response["time_series"] = {"error": str(e)}
+        if not response_has_errors(response):
+            # The anomaly tile URL may have been minted for an earlier request, so don't cache past its expiry
+            tile_expires_at = earliest_tile_expiry(response)
+            ttl = min(result_cache.ttl, tile_expires_at - time.time()) if tile_expires_at is not None else None
+            if ttl is None or ttl > 0:
+                result_cache.set(cache_key, response, ttl=ttl)
         
         return response
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing request: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing NDVI data: {str(e)}")
+        logger.error(f"Error computing NDVI anomalies: {e}")
+        raise HTTPException(status_code=500, detail=f"Error computing NDVI anomalies: {str(e)}")
+
+# Temporal resolutions for weather data: name -> (ee.Date unit, bin length)
+WEATHER_RESOLUTIONS = {
+    "daily": ("day", 1),
+    "weekly": ("week", 1),
+    "monthly": ("month", 1)
+}
 
-def get_weather_data(region, start_date, end_date):
+def get_weather_data(region, start_date, end_date, resolution="weekly"):
     """
     Fetch weather data (temperature and precipitation) for a region over a time period.
     
+    Daily values are binned server side: temperature is the mean over each bin and
+    precipitation the total, and both datasets come back in one getInfo() call.
+    
     Args:
         region (ee.Geometry): The region of interest
         start_date (ee.Date): Start date for data collection
         end_date (ee.Date): End date for data collection
+        resolution (str): Bin size, one of "daily", "weekly" or "monthly"
         
     Returns:
         dict: Dictionary containing weather time series data
     """
     try:
+        unit, step = WEATHER_RESOLUTIONS[resolution]
+        
+        # A fully masked placeholder keeps the band present in bins without any images,
+        # so their reduction yields null instead of failing
+        def with_placeholder(collection, band):
+            placeholder = ee.Image.constant(0).rename(band).toFloat().updateMask(0)
+            return collection.merge(ee.ImageCollection([placeholder]))
+        
         # ERA5 reanalysis dataset for temperature (2m air temperature)
         era5_temperature = ee.ImageCollection("ECMWF/ERA5/DAILY") \
             .filterDate(start_date, end_date) \
@@ -313,111 +2283,75 @@ def get_weather_data(region, start_date, end_date):
             .filterDate(start_date, end_date) \
             .select('precipitation')  # mm/day
         
-        # Get the dates in the collection
-        temperature_dates = era5_temperature.aggregate_array('system:time_start')
-        precipitation_dates = chirps_precipitation.aggregate_array('system:time_start')
-        
-        # Function to extract temperature for a date
-        def get_temperature_for_date(date):
-            date_ee = ee.Date(date)
-            image = era5_temperature.filterDate(date_ee, date_ee.advance(1, 'day')).first()
-            if image is None:
-                return None
-                
-            # Convert Kelvin to Celsius
-            temperature_image = image.subtract(273.15)
+        # Start dates of every bin in the requested window
+        bin_count = end_date.difference(start_date, unit).divide(step).ceil()
+        bin_starts = ee.List.sequence(0, bin_count.subtract(1)).map(
+            lambda i: start_date.advance(ee.Number(i).multiply(step), unit)
+        )
+        
+        def weather_for_bin(bin_start):
+            bin_start = ee.Date(bin_start)
+            bin_end = bin_start.advance(step, unit)
             
-            # Get mean temperature for the region
-            mean_temp = temperature_image.reduceRegion(
+            # Mean temperature over the bin, converted from Kelvin to Celsius
+            temperature = with_placeholder(era5_temperature.filterDate(bin_start, bin_end), 'mean_2m_air_temperature') \
+                .mean().subtract(273.15)
+            mean_temp = temperature.reduceRegion(
                 reducer=ee.Reducer.mean(),
                 geometry=region,
                 scale=27830,  # ERA5 resolution
                 maxPixels=1e9
             ).get('mean_2m_air_temperature')
             
-            # Format date
-            formatted_date = date_ee.format('YYYY-MM-dd').getInfo()
-            
-            return {
-                "date": formatted_date,
-                "temperature_celsius": mean_temp.getInfo()
-            }
-        
-        # Function to extract precipitation for a date
-        def get_precipitation_for_date(date):
-            date_ee = ee.Date(date)
-            image = chirps_precipitation.filterDate(date_ee, date_ee.advance(1, 'day')).first()
-            if image is None:
-                return None
-                
-            # Get mean precipitation for the region (mm/day)
-            mean_precip = image.reduceRegion(
+            # Total precipitation over the bin (mm)
+            precipitation = with_placeholder(chirps_precipitation.filterDate(bin_start, bin_end), 'precipitation').sum()
+            total_precip = precipitation.reduceRegion(
                 reducer=ee.Reducer.mean(),
                 geometry=region,
                 scale=5566,  # CHIRPS resolution ~5km
                 maxPixels=1e9
             ).get('precipitation')
             
-            # Format date
-            formatted_date = date_ee.format('YYYY-MM-dd').getInfo()
-            
-            return {
-                "date": formatted_date,
-                "precipitation_mm": mean_precip.getInfo()
-            }
+            return ee.Feature(None, {
+                "date": bin_start.format('YYYY-MM-dd'),
+                "temperature_celsius": mean_temp,
+                "precipitation_mm": total_precip
+            })
+        
+        features = ee.FeatureCollection(bin_starts.map(weather_for_bin)).getInfo()["features"]
         
-        # Get temperature for each date (sample every 5 days to reduce computation)
-        temp_dates_list = temperature_dates.getInfo()
-        temp_dates_sampled = [temp_dates_list[i] for i in range(0, len(temp_dates_list), 5)]
-        temperature_data = [get_temperature_for_date(date) for date in temp_dates_sampled]
-        temperature_data = [item for item in temperature_data if item is not None]
-        
-        # Get precipitation for each date (sample every 5 days to reduce computation)
-        precip_dates_list = precipitation_dates.getInfo()
-        precip_dates_sampled = [precip_dates_list[i] for i in range(0, len(precip_dates_list), 5)]
-        precipitation_data = [get_precipitation_for_date(date) for date in precip_dates_sampled]
-        precipitation_data = [item for item in precipitation_data if item is not None]
-        
-        # Create combined data structure with weather data by date
-        weather_data = {}
-        
-        # Add temperature data
-        for item in temperature_data:
-            if item["date"] not in weather_data:
-                weather_data[item["date"]] = {}
-            weather_data[item["date"]]["temperature_celsius"] = item["temperature_celsius"]
-        
-        # Add precipitation data
-        for item in precipitation_data:
-            if item["date"] not in weather_data:
-                weather_data[item["date"]] = {}
-            weather_data[item["date"]]["precipitation_mm"] = item["precipitation_mm"]
-        
-        # Convert to array format
+        # Convert to array format, skipping bins with no data from either dataset
         weather_series = []
-        for date, data in weather_data.items():
-            entry = {"date": date}
-            entry.update(data)
-            weather_series.append(entry)
+        for feature in features:
+            properties = feature["properties"]
+            if properties.get("temperature_celsius") is None and properties.get("precipitation_mm") is None:
+                continue
+            weather_series.append({
+                "date": properties["date"],
+                "temperature_celsius": properties.get("temperature_celsius"),
+                "precipitation_mm": properties.get("precipitation_mm")
+            })
         
         # Sort by date
         weather_series.sort(key=lambda x: x["date"])
         
         return {
             "data": weather_series,
-            "count": len(weather_series)
+            "count": len(weather_series),
+            "resolution": resolution
         }
     
     except Exception as e:
         logger.error(f"Error fetching weather data: {e}")
-        return {"error": str(e)}
+        return stage_error(e)
 
-def get_topography_data(region):
+def get_topography_data(region, area_m2):
     """
     Fetch topographical data (elevation, slope, aspect) for a region.
     
     Args:
         region (ee.Geometry): The region of interest
+        area_m2 (float): Area of the region, used to plan the reduction scale
         
     Returns:
         dict: Dictionary containing topographical data
@@ -429,78 +2363,54 @@ def get_topography_data(region):
         # Calculate slope and aspect
         terrain = ee.Terrain.products(elevation)
         
-        # Get statistics for the region
-        elevation_stats = elevation.reduceRegion(
-            reducer=ee.Reducer.minMaxMean(),
-            geometry=region,
-            scale=30,  # SRTM resolution
-            maxPixels=1e9
-        ).getInfo()
-        
-        slope_stats = terrain.select('slope').reduceRegion(
-            reducer=ee.Reducer.minMaxMean(),
-            geometry=region,
-            scale=30,
-            maxPixels=1e9
-        ).getInfo()
+        # SRTM resolution is 30 m; three bands are reduced together
+        reduction = plan_reduction(area_m2, 30, bands=3)
         
-        aspect_stats = terrain.select('aspect').reduceRegion(
+        # Get elevation, slope and aspect statistics for the region in one multi-band reduction
+        terrain_stats = terrain.select(['elevation', 'slope', 'aspect']).reduceRegion(
             reducer=ee.Reducer.minMaxMean(),
             geometry=region,
-            scale=30,
-            maxPixels=1e9
+            **reduce_region_args(reduction)
         ).getInfo()
         
-        # Create tile URL for elevation
-        elevation_vis_params = {
-            'min': 0,
-            'max': 3000,
-            'palette': ['006633', 'E5FFCC', '662A00', 'D8D8D8', 'F5F5F5']
-        }
-        
-        elevation_map_id = elevation.getMapId(elevation_vis_params)
-        elevation_tile_url = elevation_map_id['tile_fetcher'].url_format
-        
-        # Create tile URL for slope
-        slope_vis_params = {
-            'min': 0,
-            'max': 60,
-            'palette': ['f7fcb9', 'addd8e', '31a354']
-        }
-        
-        slope_map_id = terrain.select('slope').getMapId(slope_vis_params)
-        slope_tile_url = slope_map_id['tile_fetcher'].url_format
+        # Tile URLs for the static SRTM layers don't depend on the region, so they are shared across requests
+        elevation_tile_url, elevation_expires_at = get_static_tile_url("srtm_elevation", lambda: elevation, ELEVATION_VIS_PARAMS)
+        slope_tile_url, slope_expires_at = get_static_tile_url("srtm_slope", lambda: terrain.select('slope'), SLOPE_VIS_PARAMS)
         
         return {
             "elevation": {
-                "min_meters": elevation_stats.get('elevation_min'),
-                "max_meters": elevation_stats.get('elevation_max'),
-                "mean_meters": elevation_stats.get('elevation_mean'),
-                "tile_url": elevation_tile_url
+                "min_meters": terrain_stats.get('elevation_min'),
+                "max_meters": terrain_stats.get('elevation_max'),
+                "mean_meters": terrain_stats.get('elevation_mean'),
+                "tile_url": elevation_tile_url,
+                "tile_expires_at": elevation_expires_at
             },
             "slope": {
-                "min_degrees": slope_stats.get('slope_min'),
-                "max_degrees": slope_stats.get('slope_max'),
-                "mean_degrees": slope_stats.get('slope_mean'),
-                "tile_url": slope_tile_url
+                "min_degrees": terrain_stats.get('slope_min'),
+                "max_degrees": terrain_stats.get('slope_max'),
+                "mean_degrees": terrain_stats.get('slope_mean'),
+                "tile_url": slope_tile_url,
+                "tile_expires_at": slope_expires_at
             },
             "aspect": {
-                "min_degrees": aspect_stats.get('aspect_min'),
-                "max_degrees": aspect_stats.get('aspect_max'),
-                "mean_degrees": aspect_stats.get('aspect_mean')
-            }
+                "min_degrees": terrain_stats.get('aspect_min'),
+                "max_degrees": terrain_stats.get('aspect_max'),
+                "mean_degrees": terrain_stats.get('aspect_mean')
+            },
+            "reduction": reduction
         }
     
     except Exception as e:
         logger.error(f"Error fetching topography data: {e}")
-        return {"error": str(e)}
+        return stage_error(e)
 
-def get_landcover_data(region, year=2021):
+def get_landcover_data(region, area_m2, year=2021):
     """
     Fetch land cover data (land cover classes, vegetation statistics) for a region.
     
     Args:
         region (ee.Geometry): The region of interest
+        area_m2 (float): Area of the region, used to plan the reduction scales
         year (int): Year to use for land cover data
         
     Returns:
@@ -523,13 +2433,43 @@ def get_landcover_data(region, year=2021):
         # Calculate area and percentage of each land cover class
         area_image = ee.Image.pixelArea().divide(10000)  # Convert to hectares
         
+        # WorldCover is 10 m and MODIS VCF 250 m; pixel areas are summed, so a
+        # coarser scale still gives the right hectares
+        landcover_reduction = plan_reduction(area_m2, 10, bands=2)
+        vegetation_reduction = plan_reduction(area_m2, 250, bands=3)
+        
+        # Sum pixel areas grouped by WorldCover class in a single pass, so the cost
+        # doesn't grow with the number of classes
+        class_areas = area_image.addBands(worldcover).reduceRegion(
+            reducer=ee.Reducer.sum().group(groupField=1, groupName='class'),
+            geometry=region,
+            **reduce_region_args(landcover_reduction)
+        ).get('groups')
+        
         # Get total area
         total_area = area_image.reduceRegion(
             reducer=ee.Reducer.sum(),
             geometry=region,
-            scale=10,  # WorldCover resolution
-            maxPixels=1e9
-        ).get('area').getInfo()
+            **reduce_region_args(landcover_reduction)
+        ).get('area')
+        
+        # Get vegetation statistics
+        veg_stats = modis_vcf.reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=region,
+            **reduce_region_args(vegetation_reduction)
+        )
+        
+        # Fetch class areas, total area and vegetation statistics in one round trip
+        stats = ee.Dictionary({
+            "class_areas": class_areas,
+            "total_area": total_area,
+            "vegetation": veg_stats
+        }).getInfo()
+        
+        total_area = stats.get("total_area") or 0
+        veg_stats = stats.get("vegetation") or {}
+        area_by_class = {int(group["class"]): group["sum"] for group in stats.get("class_areas") or []}
         
         # Define land cover classes for ESA WorldCover
         worldcover_classes = {
@@ -546,107 +2486,274 @@ def get_landcover_data(region, year=2021):
             100: "Moss and lichen"
         }
         
-        # Calculate area for each land cover class
+        # Calculate area and percentage for each land cover class
         landcover_stats = {}
         for class_value, class_name in worldcover_classes.items():
-            class_mask = worldcover.eq(class_value)
-            class_area = area_image.updateMask(class_mask).reduceRegion(
-                reducer=ee.Reducer.sum(),
-                geometry=region,
-                scale=10,
-                maxPixels=1e9
-            ).get('area')
-            
-            # Get the area value, handling None
-            area_value = 0 if class_area is None else class_area.getInfo()
+            area_value = area_by_class.get(class_value, 0)
             
             # Calculate percentage
-            percentage = 0 if total_area == 0 else (area_value / total_area) * 100;
+            percentage = 0 if total_area == 0 else (area_value / total_area) * 100
             
             landcover_stats[class_name] = {
                 "area_hectares": area_value,
                 "percentage": percentage
             }
         
-        # Get vegetation statistics
-        veg_stats = modis_vcf.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=region,
-            scale=250,  # MODIS VCF resolution
-            maxPixels=1e9
-        ).getInfo()
-        
-        # Create tile URL for land cover
-        worldcover_vis_params = {
-            'min': 0,
-            'max': 100,
-            'palette': [
-                '006400', '29C012', '77A112', 'FFFF4C', 'FFCCCC',
-                'FF0000', '800000', '0000FF', '0067A5', '00A580', 'A5E194'
-            ]
-        }
-        
-        landcover_map_id = worldcover.getMapId(worldcover_vis_params)
-        landcover_tile_url = landcover_map_id['tile_fetcher'].url_format
+        # Create tile URL for land cover (WorldCover is static, so the URL is shared across requests)
+        landcover_tile_url, landcover_expires_at = get_static_tile_url("esa_worldcover", lambda: worldcover, WORLDCOVER_VIS_PARAMS)
         
         return {
             "land_cover": {
                 "classes": landcover_stats,
                 "dominant_class": max(landcover_stats.items(), key=lambda x: x[1]["percentage"])[0],
-                "tile_url": landcover_tile_url
+                "tile_url": landcover_tile_url,
+                "tile_expires_at": landcover_expires_at
             },
             "vegetation": {
                 "tree_cover_percent": veg_stats.get('Percent_Tree_Cover'),
                 "non_tree_vegetation_percent": veg_stats.get('Percent_NonTree_Vegetation'),
                 "non_vegetated_percent": veg_stats.get('Percent_NonVegetated')
+            },
+            "reduction": {
+                "land_cover": landcover_reduction,
+                "vegetation": vegetation_reduction
             }
         }
     
     except Exception as e:
         logger.error(f"Error fetching climate data: {e}")
-        return {"error": str(e)}
+        return stage_error(e)
+
+# Uploads larger than this are processed in streaming mode automatically
+STREAMING_THRESHOLD_BYTES = int(os.environ.get("STREAMING_THRESHOLD_BYTES", 64 * 1024 * 1024))
+
+# Directory for spooled uploads and streamed output (system temp directory if unset)
+RASTER_SPOOL_DIR = os.environ.get("RASTER_SPOOL_DIR")
 
 @app.post("/api/process-ndvi")
-async def process_ndvi_image(file: UploadFile = File(...)):
+async def process_ndvi_image(file: UploadFile = File(...), palette: str = "RdYlGn", legend: bool = False, streaming: bool = False):
     """
     Process a raw NDVI image (red channel) and return a colormapped version.
     The input should be a single-channel image where the red channel contains NDVI values (0-255).
+    
+    Colors come from a precomputed lookup table, so the output keeps the input resolution.
+    `palette` is a palette name ("RdYlGn", "ndvi", "greens") or comma-separated hex colors,
+    and `legend=true` appends an NDVI color bar.
+    
+    With `streaming=true` (automatic for large uploads) the upload is spooled to disk and
+    processed in strips from a memory-mapped array, so memory stays bounded for
+    multi-gigapixel TIFFs. Float rasters are read as NDVI in -1 to 1.
     """
+    # NumPy, Pillow and tifffile are only loaded once a raster endpoint is used
+    from PIL import UnidentifiedImageError
+    from colormap import colorize_ndvi_image, get_lut
+    from raster import MissingDependencyError, colorize_ndvi_file, spool_upload
+    
+    try:
+        lut = get_lut(palette)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid palette: {str(e)}")
+    
+    upload_size = getattr(file, "size", None) or 0
+    if streaming and legend:
+        raise HTTPException(status_code=400, detail="The legend is not available in streaming mode")
+    
+    if streaming or (upload_size > STREAMING_THRESHOLD_BYTES and not legend):
+        try:
+            input_path = await spool_upload(file, RASTER_SPOOL_DIR)
+            try:
+                output_path = await run_in_threadpool(colorize_ndvi_file, input_path, lut, RASTER_SPOOL_DIR)
+            finally:
+                os.remove(input_path)
+            
+            # Stream the PNG from disk and delete it once it has been sent
+            return FileResponse(output_path, media_type="image/png", background=BackgroundTask(os.remove, output_path))
+        
+        except MissingDependencyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except (ValueError, UnidentifiedImageError) as e:
+            # Unsupported formats and raster layouts
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logging.error(f"Error processing NDVI raster: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
     try:
         # Read the uploaded image
         contents = await file.read()
-        img = Image.open(io.BytesIO(contents))
         
-        # Convert to numpy array and extract red channel (NDVI data)
-        img_array = np.array(img)
-        if len(img_array.shape) == 3:
-            ndvi_raw = img_array[:, :, 0]  # Red channel
-        else:
-            ndvi_raw = img_array
-        
-        # Normalize NDVI values from 0-255 to -1 to 1 range
-        ndvi_normalized = (ndvi_raw.astype(float) / 255.0) * 2 - 1
-        
-        # Create a colormap
-        plt.ioff()  # Turn off interactive mode
-        fig = plt.figure(figsize=(10, 10))
-        plt.imshow(ndvi_normalized, cmap='RdYlGn', vmin=-1, vmax=1)
-        plt.colorbar(label='NDVI')
-        plt.axis('off')
-        
-        # Save the colormapped image to a byte stream
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0)
-        plt.close(fig)
-        buf.seek(0)
+        # Color it off the event loop so concurrent uploads don't block other requests
+        buf = await run_in_threadpool(colorize_ndvi_image, contents, lut, legend)
         
         # Return the processed image as a streaming response
         return StreamingResponse(buf, media_type="image/png")
         
+    except UnidentifiedImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.error(f"Error processing NDVI image: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Root directory of the local raster tile pyramids and their rendered tile cache
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "tiles"))
+
+@app.post("/local-tiles/")
+async def ingest_local_tiles(
+    request: Request,
+    file: UploadFile = File(...),
+    palette: str = Form("RdYlGn"),
+    west: Optional[float] = Form(None),
+    south: Optional[float] = Form(None),
+    east: Optional[float] = Form(None),
+    north: Optional[float] = Form(None)
+):
+    """
+    Ingest a raw NDVI raster (same input as /api/process-ndvi) and build its XYZ tile pyramid.
+    
+    Bounds (EPSG:4326 degrees) are read from GeoTIFF tags when the form fields are omitted.
+    """
+    from raster import MissingDependencyError, spool_upload
+    from tile_pyramid import ingest_raster
+    
+    bounds = (west, south, east, north)
+    if any(value is None for value in bounds):
+        if any(value is not None for value in bounds):
+            raise HTTPException(status_code=400, detail="Provide all of west, south, east and north, or none of them")
+        bounds = None
+    
+    input_path = await spool_upload(file, RASTER_SPOOL_DIR)
+    try:
+        meta = await run_in_threadpool(ingest_raster, input_path, TILE_CACHE_DIR, bounds, palette)
+    except MissingDependencyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error building tile pyramid: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.remove(input_path)
+    
+    return {
+        **meta,
+        "url": f"{str(request.base_url).rstrip('/')}/local-tiles/{meta['raster_id']}/{{z}}/{{x}}/{{y}}.png"
+    }
+
+@app.get("/local-tiles/{raster_id}")
+def get_local_tiles_info(raster_id: str):
+    from tile_pyramid import load_meta
+    
+    try:
+        return load_meta(TILE_CACHE_DIR, raster_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Raster not found")
+
+@app.delete("/local-tiles/{raster_id}")
+def delete_local_tiles(raster_id: str):
+    from tile_pyramid import delete_raster
+    
+    try:
+        delete_raster(TILE_CACHE_DIR, raster_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Raster not found")
+    return {"deleted": raster_id}
+
+@app.get("/local-tiles/{raster_id}/{z}/{x}/{y}.png")
+def get_local_tile(raster_id: str, z: int, x: int, y: int, request: Request):
+    """
+    Serve one XYZ tile of an ingested raster from the on-disk tile cache.
+    """
+    from tile_pyramid import get_tile, load_meta, tile_etag
+    
+    # A deleted or unknown raster is a 404 even for a client holding its ETag
+    try:
+        load_meta(TILE_CACHE_DIR, raster_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Raster not found")
+    
+    etag = tile_etag(raster_id, z, x, y)
+    headers = {
+        "ETag": etag,
+        # Tiles never change for a raster ID
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        data = get_tile(TILE_CACHE_DIR, raster_id, z, x, y)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Raster not found")
+    
+    if data is None:
+        raise HTTPException(status_code=404, detail="Tile outside raster")
+    
+    return Response(content=data, media_type="image/png", headers=headers)
+
+def compute_zonal_stats(input_path, polygon, red_band, nir_band, bounds, nodata, percentiles, histogram_bins):
+    from zonal import BandRaster, zonal_ndvi_stats
+    
+    with BandRaster(input_path, red_band, nir_band, bounds, nodata) as raster:
+        stats = zonal_ndvi_stats(raster, polygon, percentiles, histogram_bins)
+        stats["raster"] = {
+            "width": raster.width,
+            "height": raster.height,
+            "bounds": list(raster.bounds) if raster.bounds else None
+        }
+        return stats
+
+@app.post("/zonal-stats/")
+async def local_zonal_stats(
+    file: UploadFile = File(...),
+    polygon: Optional[str] = Form(None),
+    red_band: Optional[str] = Form(None),
+    nir_band: Optional[str] = Form(None),
+    west: Optional[float] = Form(None),
+    south: Optional[float] = Form(None),
+    east: Optional[float] = Form(None),
+    north: Optional[float] = Form(None),
+    nodata: Optional[float] = Form(None),
+    percentiles: str = Form("10,25,50,75,90"),
+    histogram_bins: int = Form(20)
+):
+    """
+    Compute NDVI statistics of a field from local red and NIR bands, without Earth Engine.
+    
+    The upload is a multi-band TIFF, a .npy array or a .npz archive. `red_band` and
+    `nir_band` are band indices (default 0 and 1), or array names for a .npz archive
+    with separate bands (default "red" and "nir"). `polygon` is a GeoJSON Polygon or
+    MultiPolygon in the raster's coordinates; without it the whole raster is used.
+    Bounds are read from GeoTIFF tags when the form fields are omitted.
+    """
+    bounds = (west, south, east, north)
+    if any(value is None for value in bounds):
+        if any(value is not None for value in bounds):
+            raise HTTPException(status_code=400, detail="Provide all of west, south, east and north, or none of them")
+        bounds = None
+    
+    try:
+        geometry = json.loads(polygon) if polygon else None
+        percentile_values = tuple(float(value) for value in percentiles.split(",") if value.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid polygon or percentiles: {str(e)}")
+    
+    from raster import MissingDependencyError, spool_upload
+    
+    input_path = await spool_upload(file, RASTER_SPOOL_DIR)
+    try:
+        return await run_in_threadpool(
+            compute_zonal_stats, input_path, geometry, red_band, nir_band, bounds, nodata, percentile_values, histogram_bins
+        )
+    except MissingDependencyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error computing zonal statistics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.remove(input_path)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
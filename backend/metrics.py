@@ -0,0 +1,275 @@
+"""
+Request instrumentation for the TensorFarm NDVI API.
+
+Counters, gauges and histograms are kept in process and rendered in the
+Prometheus text exposition format for GET /metrics. Per-request timings are
+collected in a RequestTimings object carried in a context variable, which is
+copied into the stage threads, and can be returned as a Server-Timing header.
+
+Earth Engine round trips are counted by wrapping ee.data.computeValue (behind
+every getInfo()) and ee.data.getMapId, so every call is measured without
+touching the call sites. Calls are labelled with the stage that made them.
+"""
+
+import bisect
+import contextvars
+import functools
+import math
+import threading
+import time
+
+# Latency buckets in seconds; Earth Engine calls range from sub-second to minutes
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Payload size buckets in bytes (1 KB to 64 MB)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """
+    Base class for a metric family with a fixed set of label names.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """
+    Gauge whose value is read from a callback when the metrics are rendered.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name, description, read):
+        super().__init__(name, description)
+        self.read = read
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        try:
+            value = self.read()
+        except Exception:
+            return lines
+        if value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names + ("le",), key + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_requests = registry.register(Counter(
+    "tensorfarm_http_requests_total", "HTTP requests by route, method and status code",
+    ("method", "route", "status")
+))
+http_request_seconds = registry.register(Histogram(
+    "tensorfarm_http_request_duration_seconds", "Time until the response headers are sent",
+    ("method", "route")
+))
+http_response_bytes = registry.register(Histogram(
+    "tensorfarm_http_response_size_bytes", "Response body size for responses with a known length",
+    ("method", "route"), buckets=SIZE_BUCKETS
+))
+stage_seconds = registry.register(Histogram(
+    "tensorfarm_stage_duration_seconds", "Wall time of each pipeline stage",
+    ("stage", "outcome")
+))
+stage_payload_bytes = registry.register(Histogram(
+    "tensorfarm_stage_payload_size_bytes", "Serialized size of each stage's result",
+    ("stage",), buckets=SIZE_BUCKETS
+))
+ee_requests = registry.register(Counter(
+    "tensorfarm_ee_requests_total", "Earth Engine round trips by call, calling stage and outcome",
+    ("call", "stage", "outcome")
+))
+ee_request_seconds = registry.register(Histogram(
+    "tensorfarm_ee_request_duration_seconds", "Latency of Earth Engine round trips",
+    ("call", "stage")
+))
+ee_queue_wait_seconds = registry.register(Histogram(
+    "tensorfarm_ee_queue_wait_seconds", "Time Earth Engine round trips waited for a scheduler slot"
+))
+ee_throttled = registry.register(Counter(
+    "tensorfarm_ee_throttled_total", "Earth Engine round trips rejected with a rate limit or quota error",
+    ("call",)
+))
+ee_retries = registry.register(Counter(
+    "tensorfarm_ee_retries_total", "Earth Engine round trips retried after backing off, by the error retried",
+    ("call", "reason")
+))
+ee_rejections = registry.register(Counter(
+    "tensorfarm_ee_rejections_total", "Earth Engine round trips given up on (queue timeout or retries exhausted)",
+    ("reason",)
+))
+coalesced_calls = registry.register(Counter(
+    "tensorfarm_singleflight_calls_total", "Computations run (leader) or shared with an identical in-flight one (follower)",
+    ("flight", "role")
+))
+cache_lookups = registry.register(Counter(
+    "tensorfarm_cache_lookups_total", "Cache lookups by cache and result",
+    ("cache", "result")
+))
+
+class RequestTimings:
+    """
+    Durations recorded while serving one request, for the Server-Timing header.
+    """
+
+    def __init__(self):
+        self._entries = {}  # name -> [total seconds, count]
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            entry = self._entries.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, total_seconds=None):
+        with self._lock:
+            entries = list(self._entries.items())
+        parts = []
+        for name, (seconds, count) in entries:
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        if total_seconds is not None:
+            parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+current_timings = contextvars.ContextVar("current_timings", default=None)
+current_stage = contextvars.ContextVar("current_stage", default="none")
+
+def record_timing(name, seconds):
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+def instrument_ee_call(call, fn):
+    """
+    Wrap an Earth Engine API function so each call is counted and timed.
+
+    Args:
+        call (str): Metric label for the call, e.g. "getInfo"
+        fn (callable): The function to wrap
+
+    Returns:
+        callable: The instrumented function
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stage = current_stage.get()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            ee_requests.inc(call=call, stage=stage, outcome=outcome)
+            ee_request_seconds.observe(elapsed, call=call, stage=stage)
+            record_timing(f"ee_{call}", elapsed)
+
+    wrapper.instrumented = True
+    return wrapper
+
+def instrument_earth_engine(ee_module):
+    """
+    Instrument getInfo() and getMapId round trips of the ee package (idempotent).
+    """
+    for attribute, call in (("computeValue", "getInfo"), ("getMapId", "getMapId")):
+        fn = getattr(ee_module.data, attribute)
+        if not getattr(fn, "instrumented", False):
+            setattr(ee_module.data, attribute, instrument_ee_call(call, fn))
@@ -0,0 +1,283 @@
+"""
+Bounded-memory processing of large NDVI rasters.
+
+Uploads are spooled to disk, opened as memory-mapped arrays and colored in
+horizontal strips, and the PNG output is written strip by strip. Peak memory
+depends on the strip size, not on the size of the raster.
+
+Supported inputs:
+  - TIFF / BigTIFF (multi-band, contiguous or planar) through the optional
+    tifffile package. Uncompressed files are mapped directly; compressed files
+    are decoded once into a temporary memory-mapped file.
+  - NumPy .npy arrays, and .npz archives (members are decompressed in memory)
+  - Anything else Pillow can open (decoded in memory, so meant for small images)
+"""
+
+import logging
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from colormap import PNG_COMPRESS_LEVEL, apply_lut, to_ndvi_bytes
+
+try:
+    import tifffile
+except ImportError:  # Optional: only needed for TIFF inputs
+    tifffile = None
+
+logger = logging.getLogger(__name__)
+
+class MissingDependencyError(RuntimeError):
+    """
+    Raised when an input needs an optional package that isn't installed (a server configuration problem).
+    """
+
+# Upload chunk size when spooling to disk
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Pixels processed per strip; bounds the working memory of a strip to a few tens of MB
+STRIP_PIXELS = 4 * 1024 * 1024
+
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+NPY_MAGIC = b"\x93NUMPY"
+NPZ_MAGIC = b"PK\x03\x04"
+
+async def spool_upload(upload_file, directory=None):
+    """
+    Copy an upload to a temporary file in chunks without holding it in memory.
+
+    Args:
+        upload_file (UploadFile): The uploaded file
+        directory (str): Directory for the temporary file (system default if None)
+
+    Returns:
+        str: Path of the spooled file; the caller removes it
+    """
+    fd, path = tempfile.mkstemp(prefix="ndvi-upload-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload_file.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def select_band(array, axes, band=0):
+    """
+    Get a 2-D (rows, columns) view of one band of an array without copying.
+
+    Args:
+        array (np.ndarray): Image array, possibly memory-mapped
+        axes (str): Axis labels, e.g. "YX", "YXS" (interleaved) or "SYX" (planar)
+        band (int): Band index along the sample axis
+
+    Returns:
+        np.ndarray: View of the band with shape (height, width)
+    """
+    if "Y" not in axes or "X" not in axes:
+        raise ValueError(f"Unsupported raster layout: {axes}")
+    band_count = band_count_of(array, axes)
+    if not 0 <= band < band_count:
+        raise ValueError(f"Band {band} out of range, the raster has {band_count} band(s)")
+    index = tuple(slice(None) if axis in "YX" else (band if i == _sample_axis(axes) else 0) for i, axis in enumerate(axes))
+    view = array[index]
+    return view if axes.index("Y") < axes.index("X") else view.T
+
+def first_band(array, axes):
+    """
+    Get a 2-D (rows, columns) view of the first band of an array without copying.
+    """
+    return select_band(array, axes, 0)
+
+def _sample_axis(axes):
+    # The band axis is the first axis that isn't a row or column axis
+    return next((i for i, axis in enumerate(axes) if axis not in "YX"), None)
+
+def band_count_of(array, axes):
+    sample_axis = _sample_axis(axes)
+    return 1 if sample_axis is None else array.shape[sample_axis]
+
+def array_axes(array):
+    """
+    Guess the axis labels of a 2-D or 3-D NumPy array.
+    """
+    if array.ndim == 2:
+        return "YX"
+    if array.ndim == 3:
+        # Small trailing dimension means interleaved bands, otherwise planar
+        return "YXS" if array.shape[-1] <= 16 else "SYX"
+    raise ValueError(f"Unsupported array shape: {array.shape}")
+
+def open_raster_array(path, temp_paths):
+    """
+    Open a TIFF or .npy raster as a (preferably memory-mapped) array.
+
+    Args:
+        path (str): Raster file
+        temp_paths (list): Temporary files created while decoding are appended here; the caller removes them
+
+    Returns:
+        tuple: (array, axes, georeference) where georeference holds the GeoTIFF tags
+               (pixel scale, tiepoint, nodata) or is None
+    """
+    with open(path, "rb") as f:
+        magic = f.read(8)
+
+    if magic.startswith(NPY_MAGIC):
+        array = np.load(path, mmap_mode="r")
+        return array, array_axes(array), None
+
+    if magic[:4] in TIFF_MAGIC:
+        if tifffile is None:
+            raise MissingDependencyError("TIFF input requires the 'tifffile' package")
+        georeference = None
+        with tifffile.TiffFile(path) as tif:
+            axes = tif.series[0].axes
+            tags = tif.pages[0].tags
+            if "ModelPixelScaleTag" in tags and "ModelTiepointTag" in tags:
+                nodata = tags["GDAL_NODATA"].value if "GDAL_NODATA" in tags else None
+                georeference = (tags["ModelPixelScaleTag"].value, tags["ModelTiepointTag"].value, nodata)
+        try:
+            # Uncompressed, contiguous data can be mapped straight from the upload
+            array = tifffile.memmap(path, mode="r")
+        except ValueError:
+            # Compressed data is decoded once into a temporary memory-mapped file
+            fd, decoded_path = tempfile.mkstemp(prefix="ndvi-decoded-", dir=os.path.dirname(path))
+            os.close(fd)
+            temp_paths.append(decoded_path)
+            array = tifffile.imread(path, out=decoded_path)
+        return array, axes, georeference
+
+    raise ValueError("Unsupported raster format, expected TIFF or .npy")
+
+def geotiff_bounds(pixel_scale, tiepoint, width, height):
+    """
+    Get (west, south, east, north) of a raster from its GeoTIFF pixel scale and tiepoint.
+    """
+    # The tiepoint ties raster position (i, j) to model position (x, y)
+    scale_x, scale_y = pixel_scale[0], pixel_scale[1]
+    west = tiepoint[3] - tiepoint[0] * scale_x
+    north = tiepoint[4] + tiepoint[1] * scale_y
+    return (west, north - height * scale_y, west + width * scale_x, north)
+
+class NdviRaster:
+    """
+    Read access to the NDVI band (red channel / first band) of a raster on disk.
+
+    Attributes:
+        width (int): Raster width in pixels
+        height (int): Raster height in pixels
+        bounds (tuple): (west, south, east, north) from GeoTIFF tags, or None
+    """
+
+    def __init__(self, path):
+        self._temp_paths = []
+        self._georeference = None
+        self.band = self._open(path)
+        self.height, self.width = self.band.shape
+        self.bounds = geotiff_bounds(*self._georeference[:2], self.width, self.height) if self._georeference else None
+
+    def _open(self, path):
+        with open(path, "rb") as f:
+            magic = f.read(8)
+
+        if magic.startswith(NPY_MAGIC) or magic[:4] in TIFF_MAGIC:
+            array, axes, self._georeference = open_raster_array(path, self._temp_paths)
+            return first_band(array, axes)
+
+        # Other formats are decoded in memory by Pillow
+        img = Image.open(path)
+        img_array = np.asarray(img)
+        return img_array[:, :, 0] if img_array.ndim == 3 else img_array
+
+    def strips(self, rows_per_strip=None):
+        """
+        Iterate over the NDVI band in horizontal strips.
+
+        Yields:
+            tuple: (first row, 2-D array of the strip's rows)
+        """
+        if rows_per_strip is None:
+            rows_per_strip = max(1, STRIP_PIXELS // max(1, self.width))
+        for y in range(0, self.height, rows_per_strip):
+            yield y, np.asarray(self.band[y:y + rows_per_strip])
+
+    def close(self):
+        self.band = None
+        for path in self._temp_paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove temporary raster {path}: {e}")
+        self._temp_paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _write_png_chunk(f, chunk_type, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+def write_png_strips(path, width, height, rgb_strips):
+    """
+    Write an RGB PNG incrementally from strips of rows.
+
+    Args:
+        path (str): Output file path
+        width (int): Image width
+        height (int): Image height
+        rgb_strips (iterable): (rows, width, 3) uint8 arrays, top to bottom
+    """
+    compressor = zlib.compressobj(PNG_COMPRESS_LEVEL)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        # 8-bit RGB, no interlacing
+        _write_png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+        for strip in rgb_strips:
+            rows = strip.shape[0]
+            # Every PNG row starts with a filter type byte (0 = none)
+            scanlines = np.zeros((rows, width * 3 + 1), dtype=np.uint8)
+            scanlines[:, 1:] = strip.reshape(rows, width * 3)
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                _write_png_chunk(f, b"IDAT", data)
+
+        _write_png_chunk(f, b"IDAT", compressor.flush())
+        _write_png_chunk(f, b"IEND", b"")
+
+def colorize_ndvi_file(input_path, lut, directory=None):
+    """
+    Color a raw NDVI raster on disk strip by strip into a PNG file.
+
+    Args:
+        input_path (str): Spooled upload (TIFF, .npy or any Pillow format)
+        lut (np.ndarray): (256, 3) uint8 lookup table
+        directory (str): Directory for the output file (system default if None)
+
+    Returns:
+        str: Path of the PNG output; the caller removes it
+    """
+    fd, output_path = tempfile.mkstemp(prefix="ndvi-colored-", suffix=".png", dir=directory)
+    os.close(fd)
+    try:
+        with NdviRaster(input_path) as raster:
+            strips = (apply_lut(to_ndvi_bytes(rows), lut) for _, rows in raster.strips())
+            write_png_strips(output_path, raster.width, raster.height, strips)
+    except Exception:
+        os.remove(output_path)
+        raise
+    return output_path
@@ -0,0 +1,107 @@
+"""
+Reduction scale planning for Earth Engine region reductions.
+
+The cost of a reduceRegion grows with the number of pixels it touches, which
+is the polygon area divided by the square of the scale. Reducing every polygon
+at a fixed scale makes small plots coarse and large ranches slow (or fail with
+"too many pixels"). The planner reduces at the sensor's native resolution while
+that stays within a pixel budget, and coarsens the scale in multiples of the
+native resolution beyond it, so the work per reduction stays roughly constant.
+"""
+
+import math
+import os
+
+# Pixels a single reduction may touch before the scale is coarsened
+PIXEL_BUDGET = int(float(os.environ.get("REDUCTION_PIXEL_BUDGET", 1e7)))
+
+# Budget for per-image reductions (time series), which are repeated once per scene
+SERIES_PIXEL_BUDGET = int(float(os.environ.get("SERIES_PIXEL_BUDGET", 2e6)))
+
+# maxPixels is set this far above the estimate; the estimate counts the polygon, EE counts its footprint
+MAX_PIXELS_HEADROOM = 4
+
+# (pixels, tileScale): larger reductions are split into smaller tiles to avoid EE memory errors
+TILE_SCALE_STEPS = ((1e6, 1), (4e6, 2), (16e6, 4))
+MAX_TILE_SCALE = 8
+
+EARTH_RADIUS_METERS = 6378137.0
+
+def ring_area_m2(ring):
+    """
+    Get the geodesic area of a [lng, lat] ring on a spherical Earth.
+
+    Args:
+        ring (list): List of [lng, lat] positions
+
+    Returns:
+        float: Area in square meters
+    """
+    if len(ring) < 3:
+        return 0.0
+    total = 0.0
+    for (lng1, lat1), (lng2, lat2) in zip(ring, ring[1:] + ring[:1]):
+        total += math.radians(lng2 - lng1) * (2 + math.sin(math.radians(lat1)) + math.sin(math.radians(lat2)))
+    return abs(total) * EARTH_RADIUS_METERS ** 2 / 2
+
+def polygon_area_m2(geometry):
+    """
+    Get the area of a GeoJSON Polygon or MultiPolygon from its outer rings.
+
+    Holes are ignored, matching the regions the API reduces over.
+
+    Args:
+        geometry (dict): GeoJSON Polygon or MultiPolygon
+
+    Returns:
+        float: Area in square meters
+    """
+    coordinates = geometry.get("coordinates") or []
+    if geometry.get("type") == "MultiPolygon":
+        return sum(ring_area_m2([point[:2] for point in polygon[0]]) for polygon in coordinates if polygon)
+    return ring_area_m2([point[:2] for point in coordinates[0]]) if coordinates else 0.0
+
+def plan_reduction(area_m2, native_scale, pixel_budget=None, bands=1):
+    """
+    Choose the scale, tileScale and bestEffort for reducing a region.
+
+    Args:
+        area_m2 (float): Area of the region in square meters
+        native_scale (float): Resolution of the data in meters
+        pixel_budget (int): Pixels the reduction may touch (PIXEL_BUDGET if None)
+        bands (int): Bands reduced together; more bands need smaller tiles
+
+    Returns:
+        dict: scale (meters), tile_scale, best_effort, max_pixels and the estimates behind them
+    """
+    pixel_budget = pixel_budget or PIXEL_BUDGET
+
+    # Coarsen in whole multiples of the native resolution so pixels aggregate cleanly
+    factor = max(1, math.ceil(math.sqrt(area_m2 / pixel_budget) / native_scale))
+    scale = native_scale * factor
+    estimated_pixels = int(math.ceil(area_m2 / scale ** 2))
+
+    work = estimated_pixels * bands
+    tile_scale = next((tile_scale for limit, tile_scale in TILE_SCALE_STEPS if work <= limit), MAX_TILE_SCALE)
+
+    return {
+        "scale": scale,
+        "native_scale": native_scale,
+        "tile_scale": tile_scale,
+        # A coarsened plan is an estimate, so let Earth Engine coarsen further rather than fail
+        "best_effort": factor > 1,
+        "max_pixels": int(max(pixel_budget, estimated_pixels) * MAX_PIXELS_HEADROOM),
+        "estimated_pixels": estimated_pixels,
+        "area_hectares": round(area_m2 / 10000, 2)
+    }
+
+def reduce_region_args(plan):
+    """
+    Get the reduceRegion keyword arguments for a plan.
+    """
+    return {
+        "scale": plan["scale"],
+        "tileScale": plan["tile_scale"],
+        "bestEffort": plan["best_effort"],
+        "maxPixels": plan["max_pixels"]
+    }
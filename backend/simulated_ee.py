@@ -0,0 +1,1152 @@
+"""
+Simulated Earth Engine client for offline benchmarks and development.
+
+Implements the part of the ee API the backend uses, evaluated locally with
+NumPy. Objects are lazy like real ee objects: building collections and
+expressions is free, and the work happens in getInfo() and getMapId(), which
+go through data.computeValue and data.getMapId like the real client. Each of
+those round trips sleeps for a configurable latency, so round-trip counts and
+their cost show up in the metrics and benchmarks as they would against the
+service.
+
+Datasets are synthetic. Every band is a function of longitude, latitude and
+acquisition date, built from a seeded NumPy texture, with a growing season,
+per-sensor revisit intervals and random cloud cover; Sentinel-2 passes come as
+overlapping granules, so some fields get several images per day. Values are stable for a
+given seed but don't resemble any real place. Regions are evaluated on a grid
+at the requested scale (at most MAX_GRID_SIDE pixels across), with the polygon
+rasterized at pixel centres.
+"""
+
+import hashlib
+import math
+import random
+import threading
+import time
+import uuid
+import warnings
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+from zonal import polygon_rings, rasterize_rings
+
+# Largest grid side a region is evaluated on; larger regions are evaluated coarser, like bestEffort
+MAX_GRID_SIDE = 256
+
+METERS_PER_DEGREE = 111320.0
+
+# Scale used by reductions that don't specify one
+DEFAULT_SCALE = 100
+
+TEXTURE_SIZE = 64
+
+# Size of the texture's patches, roughly a field
+TEXTURE_CELL_DEGREES = 0.004
+
+TILE_URL_BASE = "https://simulated-earthengine.local/v1/maps"
+
+EPOCH = datetime(1970, 1, 1)
+
+class EEException(Exception):
+    """
+    Error raised by the simulated client, like ee.EEException.
+    """
+
+# Lazy values
+
+class _Node:
+    """
+    Base class of the simulated ee objects: a memoized computation run on first evaluation.
+    """
+
+    def __init__(self, client, thunk):
+        self._client = client
+        self._thunk = thunk
+        self._lock = threading.Lock()
+        self._evaluated = False
+        self._result = None
+
+    def _evaluate(self):
+        with self._lock:
+            if not self._evaluated:
+                self._result = self._thunk()
+                self._evaluated = True
+        return self._result
+
+    def _info(self):
+        return _resolve(self._evaluate())
+
+    def getInfo(self):
+        return self._client.data.computeValue(self)
+
+def _value(x):
+    """
+    Evaluate x until it's no longer a simulated ee object.
+    """
+    while isinstance(x, _Node):
+        x = x._evaluate()
+    return x
+
+def _resolve(x):
+    """
+    Turn a value into what getInfo() returns: plain JSON-like Python values.
+    """
+    if isinstance(x, _Node):
+        return x._info()
+    if isinstance(x, dict):
+        return {key: _resolve(value) for key, value in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_resolve(value) for value in x]
+    if isinstance(x, datetime):
+        return {"type": "Date", "value": _millis(x)}
+    if isinstance(x, np.generic):
+        x = x.item()
+    if isinstance(x, float) and not math.isfinite(x):
+        return None
+    return x
+
+def _millis(moment):
+    return int((moment - EPOCH).total_seconds() * 1000)
+
+def _to_datetime(value):
+    value = _value(value)
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return EPOCH + timedelta(milliseconds=value)
+    if isinstance(value, str):
+        for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%SZ", "%Y-%m"):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+    raise EEException(f"Unable to convert {value!r} to a date")
+
+def _add_months(moment, months):
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    days_in_month = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return moment.replace(year=year, month=month, day=min(moment.day, days_in_month))
+
+def _wrap(client, value):
+    # Elements handed to user functions behave like ee objects
+    if isinstance(value, _Node):
+        return value
+    if isinstance(value, datetime):
+        return Date(client, lambda: value)
+    if isinstance(value, (int, float)):
+        return Number(client, lambda: value)
+    return ComputedObject(client, lambda: value)
+
+class ComputedObject(_Node):
+    pass
+
+class Number(_Node):
+    def _binary(self, other, op):
+        return Number(self._client, lambda: op(_value(self), _value(other)))
+
+    def add(self, other):
+        return self._binary(other, lambda a, b: a + b)
+
+    def subtract(self, other):
+        return self._binary(other, lambda a, b: a - b)
+
+    def multiply(self, other):
+        return self._binary(other, lambda a, b: a * b)
+
+    def divide(self, other):
+        return self._binary(other, lambda a, b: a / b)
+
+    def ceil(self):
+        return Number(self._client, lambda: math.ceil(_value(self)))
+
+    def floor(self):
+        return Number(self._client, lambda: math.floor(_value(self)))
+
+    def round(self):
+        return Number(self._client, lambda: round(_value(self)))
+
+class String(_Node):
+    pass
+
+class Date(_Node):
+    # Joda-style tokens used with Date.format
+    FORMAT_TOKENS = (("YYYY", "%Y"), ("yyyy", "%Y"), ("MM", "%m"), ("dd", "%d"), ("HH", "%H"), ("mm", "%M"), ("ss", "%S"))
+
+    def format(self, pattern=None):
+        def formatted():
+            strftime_pattern = pattern or "yyyy-MM-dd'T'HH:mm:ss"
+            for token, directive in self.FORMAT_TOKENS:
+                strftime_pattern = strftime_pattern.replace(token, directive)
+            return _value(self).strftime(strftime_pattern.replace("'", ""))
+        return String(self._client, formatted)
+
+    def advance(self, delta, unit):
+        def advanced():
+            moment, amount = _value(self), _value(delta)
+            if unit == "year":
+                return _add_months(moment, int(amount) * 12)
+            if unit == "month":
+                return _add_months(moment, int(amount))
+            seconds = {"week": 7 * 86400, "day": 86400, "hour": 3600, "minute": 60, "second": 1}[unit]
+            return moment + timedelta(seconds=amount * seconds)
+        return Date(self._client, advanced)
+
+    def difference(self, start, unit):
+        def difference():
+            end_moment, start_moment = _value(self), _to_datetime(start)
+            if unit in ("month", "year"):
+                months = (end_moment.year - start_moment.year) * 12 + end_moment.month - start_moment.month
+                months += (end_moment.day - start_moment.day) / 31
+                return months / 12 if unit == "year" else months
+            seconds = {"week": 7 * 86400, "day": 86400, "hour": 3600, "minute": 60, "second": 1}[unit]
+            return (end_moment - start_moment).total_seconds() / seconds
+        return Number(self._client, difference)
+
+    def millis(self):
+        return Number(self._client, lambda: _millis(_value(self)))
+
+class List(_Node):
+    def map(self, fn):
+        return List(self._client, lambda: [fn(_wrap(self._client, element)) for element in _value(self)])
+
+    def size(self):
+        return Number(self._client, lambda: len(_value(self)))
+
+    def get(self, index):
+        return ComputedObject(self._client, lambda: _value(self)[_value(index)])
+
+    def distinct(self):
+        return List(self._client, lambda: list(OrderedDict.fromkeys(_value(element) for element in _value(self))))
+
+class Dictionary(_Node):
+    def get(self, key, default=None):
+        return ComputedObject(self._client, lambda: _value(self).get(_value(key), default))
+
+    def keys(self):
+        return List(self._client, lambda: list(_value(self).keys()))
+
+    def values(self):
+        return List(self._client, lambda: list(_value(self).values()))
+
+class Geometry(_Node):
+    def _info(self):
+        return _value(self)
+
+# Filters and reducers
+
+class Filter:
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+def _property(properties, name):
+    return _value(properties.get(name))
+
+class _FilterFactory:
+    def lt(self, name, value):
+        return Filter(lambda p: _property(p, name) is not None and _property(p, name) < value)
+
+    def gt(self, name, value):
+        return Filter(lambda p: _property(p, name) is not None and _property(p, name) > value)
+
+    def eq(self, name, value):
+        return Filter(lambda p: _property(p, name) == value)
+
+    def notNull(self, names):
+        return Filter(lambda p: all(_property(p, name) is not None for name in names))
+
+    def calendarRange(self, start, end=None, field="day_of_year"):
+        end = start if end is None else end
+
+        def in_range(p):
+            moment = _to_datetime(_property(p, "system:time_start"))
+            value = {"year": moment.year, "month": moment.month, "day_of_year": moment.timetuple().tm_yday}[field]
+            return start <= value <= end if start <= end else value >= start or value <= end
+        return Filter(in_range)
+
+def _mean(values):
+    return float(values.mean()) if values.size else None
+
+def _sum(values):
+    return float(values.sum())
+
+def _min(values):
+    return float(values.min()) if values.size else None
+
+def _max(values):
+    return float(values.max()) if values.size else None
+
+def _median(values):
+    return float(np.median(values)) if values.size else None
+
+class Reducer:
+    """
+    A reducer: named outputs computed from an array of pixel values, optionally grouped by a band.
+    """
+
+    def __init__(self, outputs, group=None):
+        self.outputs = outputs
+        self.grouping = group
+
+    def combine(self, reducer2, outputPrefix="", sharedInputs=False):
+        return Reducer(self.outputs + [(outputPrefix + name, fn) for name, fn in reducer2.outputs])
+
+    def group(self, groupField=0, groupName="group"):
+        return Reducer(self.outputs, group=(groupField, groupName))
+
+    def reduce(self, band_names, band_values, region_keys=False):
+        """
+        Reduce the unmasked pixels of every band.
+
+        Args:
+            band_names (list): Band names
+            band_values (list): 1-D arrays of each band's pixels in the region, NaN where masked
+            region_keys (bool): Name single-band outputs after the reducer, like reduceRegions
+
+        Returns:
+            dict: Output name -> value
+        """
+        if self.grouping is not None:
+            group_field, group_name = self.grouping
+            value_band = next(i for i in range(len(band_names)) if i != group_field)
+            values, classes = band_values[value_band], band_values[group_field]
+            valid = ~np.isnan(values) & ~np.isnan(classes)
+            groups = []
+            for group_value in np.unique(classes[valid]):
+                selected = values[valid & (classes == group_value)]
+                group = {group_name: int(group_value) if float(group_value).is_integer() else float(group_value)}
+                group.update({name: fn(selected) for name, fn in self.outputs})
+                groups.append(group)
+            return {"groups": groups}
+
+        result = {}
+        for band_name, values in zip(band_names, band_values):
+            values = values[~np.isnan(values)]
+            for output_name, fn in self.outputs:
+                if region_keys and len(band_names) == 1:
+                    key = output_name
+                elif len(self.outputs) == 1:
+                    key = band_name
+                else:
+                    key = f"{band_name}_{output_name}"
+                result[key] = fn(values)
+        return result
+
+class _ReducerFactory:
+    def mean(self):
+        return Reducer([("mean", _mean)])
+
+    def sum(self):
+        return Reducer([("sum", _sum)])
+
+    def min(self):
+        return Reducer([("min", _min)])
+
+    def max(self):
+        return Reducer([("max", _max)])
+
+    def median(self):
+        return Reducer([("median", _median)])
+
+    def minMax(self):
+        return Reducer([("min", _min), ("max", _max)])
+
+    def minMaxMean(self):
+        return Reducer([("min", _min), ("max", _max), ("mean", _mean)])
+
+    def count(self):
+        return Reducer([("count", lambda values: int(values.size))])
+
+# Regions
+
+class _Grid:
+    """
+    Pixel centres covering a region's bounding box at a scale, and the region's mask.
+    """
+
+    def __init__(self, geometry, scale):
+        if not geometry:
+            raise EEException("A region geometry is required")
+        rings = polygon_rings(geometry)
+        points = np.concatenate([ring for polygon in rings for ring in polygon])
+        west, south = points.min(axis=0)
+        east, north = points.max(axis=0)
+        cos_lat = max(0.01, math.cos(math.radians((south + north) / 2)))
+
+        step_y = scale / METERS_PER_DEGREE
+        step_x = step_y / cos_lat
+        columns = max(1, math.ceil((east - west) / step_x))
+        rows = max(1, math.ceil((north - south) / step_y))
+        factor = max(columns, rows) / MAX_GRID_SIDE
+        if factor > 1:
+            step_x, step_y = step_x * factor, step_y * factor
+            columns, rows = max(1, math.ceil((east - west) / step_x)), max(1, math.ceil((north - south) / step_y))
+
+        xs = west + (np.arange(columns) + 0.5) * step_x
+        ys = north - (np.arange(rows) + 0.5) * step_y
+        self.lons, self.lats = np.meshgrid(xs, ys)
+        self.pixel_height = step_y * METERS_PER_DEGREE
+        self.pixel_width = step_x * METERS_PER_DEGREE * np.cos(np.radians(self.lats))
+
+        self.mask = np.zeros((rows, columns), dtype=bool)
+        for polygon in rings:
+            self.mask |= rasterize_rings(polygon, xs, ys)
+        if not self.mask.any():
+            # Regions smaller than a pixel still get the pixel they fall in
+            self.mask[rows // 2, columns // 2] = True
+
+def _geometry_json(geometry):
+    geometry = _value(geometry)
+    if isinstance(geometry, dict) and geometry.get("type") == "Feature":
+        geometry = geometry.get("geometry")
+    return geometry
+
+# Images
+
+class _ImageData:
+    def __init__(self, bands, properties):
+        self.bands = bands  # name -> fn(grid) returning a float array, NaN where masked
+        self.properties = properties
+
+def _const(value):
+    return lambda grid: np.full(grid.lons.shape, float(value))
+
+def _band_list(selectors):
+    names = []
+    for selector in selectors:
+        names.extend(selector if isinstance(selector, (list, tuple)) else [selector])
+    return [_value(name) for name in names]
+
+class Image(_Node):
+    def _derive(self, build):
+        return Image(self._client, lambda: build(_value(self)))
+
+    def _info(self):
+        data = _value(self)
+        return {"type": "Image", "bands": [{"id": name} for name in data.bands], "properties": _resolve(data.properties)}
+
+    def select(self, *selectors):
+        def selected(data):
+            names = _band_list(selectors)
+            missing = [name for name in names if name not in data.bands]
+            if missing:
+                raise EEException(f"Image.select: Pattern '{missing[0]}' did not match any bands.")
+            return _ImageData(OrderedDict((name, data.bands[name]) for name in names), data.properties)
+        return self._derive(selected)
+
+    def rename(self, *names):
+        def renamed(data):
+            new_names = _band_list(names)
+            if len(new_names) != len(data.bands):
+                raise EEException(f"Image.rename: Expected {len(data.bands)} band names, got {len(new_names)}")
+            return _ImageData(OrderedDict(zip(new_names, data.bands.values())), data.properties)
+        return self._derive(renamed)
+
+    def addBands(self, srcImg, names=None, overwrite=False):
+        def added(data):
+            bands = OrderedDict(data.bands)
+            for name, fn in _value(srcImg).bands.items():
+                if name not in bands or overwrite:
+                    bands[name] = fn
+            return _ImageData(bands, data.properties)
+        return self._derive(added)
+
+    def set(self, *args):
+        def with_properties(data):
+            updates = _value(args[0]) if len(args) == 1 else {args[0]: args[1]}
+            return _ImageData(data.bands, {**data.properties, **updates})
+        return self._derive(with_properties)
+
+    def get(self, name):
+        return ComputedObject(self._client, lambda: _value(self).properties.get(name))
+
+    def _binary(self, other, op):
+        def combined(data):
+            if isinstance(other, Image):
+                other_fns = list(_value(other).bands.values())
+            else:
+                other_fns = [_const(_value(other))]
+            if len(other_fns) == 1:
+                other_fns = other_fns * len(data.bands)
+            bands = OrderedDict()
+            for (name, fn), other_fn in zip(data.bands.items(), other_fns):
+                bands[name] = lambda grid, fn=fn, other_fn=other_fn: op(fn(grid), other_fn(grid))
+            return _ImageData(bands, {})
+        return self._derive(combined)
+
+    def add(self, other):
+        return self._binary(other, np.add)
+
+    def subtract(self, other):
+        return self._binary(other, np.subtract)
+
+    def multiply(self, other):
+        return self._binary(other, np.multiply)
+
+    def divide(self, other):
+        def divide(a, b):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(b != 0, a / b, np.nan)
+        return self._binary(other, divide)
+
+    def lt(self, other):
+        return self._binary(other, lambda a, b: np.where(np.isnan(a), np.nan, (a < b).astype(float)))
+
+    def gt(self, other):
+        return self._binary(other, lambda a, b: np.where(np.isnan(a), np.nan, (a > b).astype(float)))
+
+    def normalizedDifference(self, bandNames=None):
+        def difference(data):
+            first, second = _band_list([bandNames]) if bandNames else list(data.bands)[:2]
+
+            def nd(grid, a=data.bands[first], b=data.bands[second]):
+                a, b = a(grid), b(grid)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    return np.where(a + b != 0, (a - b) / (a + b), np.nan)
+            return _ImageData(OrderedDict(nd=nd), {})
+        return self._derive(difference)
+
+    def toFloat(self):
+        return self
+
+    def clip(self, geometry):
+        return self
+
+    def updateMask(self, mask):
+        def masked(data):
+            mask_fn = next(iter(_value(mask).bands.values())) if isinstance(mask, Image) else _const(_value(mask))
+
+            def apply(grid, fn, mask_fn=mask_fn):
+                mask_values = mask_fn(grid)
+                return np.where((mask_values != 0) & ~np.isnan(mask_values), fn(grid), np.nan)
+            return _ImageData(
+                OrderedDict((name, lambda grid, fn=fn: apply(grid, fn)) for name, fn in data.bands.items()),
+                data.properties
+            )
+        return self._derive(masked)
+
+    def unmask(self, value=0):
+        def unmasked(data):
+            return _ImageData(
+                OrderedDict((name, lambda grid, fn=fn: np.nan_to_num(fn(grid), nan=float(value))) for name, fn in data.bands.items()),
+                data.properties
+            )
+        return self._derive(unmasked)
+
+    def _reduce(self, reducer, geometry, scale, region_keys=False):
+        data = _value(self)
+        grid = _Grid(_geometry_json(geometry), float(_value(scale) or DEFAULT_SCALE))
+        band_values = [np.asarray(fn(grid), dtype=np.float64)[grid.mask] for fn in data.bands.values()]
+        return reducer.reduce(list(data.bands), band_values, region_keys)
+
+    def reduceRegion(self, reducer, geometry=None, scale=None, crs=None, crsTransform=None, bestEffort=False, maxPixels=None, tileScale=1):
+        return Dictionary(self._client, lambda: self._reduce(reducer, geometry, scale))
+
+    def reduceRegions(self, collection, reducer, scale=None, crs=None, crsTransform=None, tileScale=1):
+        def reduce_features():
+            features = []
+            for feature in _value(collection):
+                feature_data = _value(feature)
+                values = self._reduce(reducer, feature_data.geometry, scale, region_keys=True)
+                features.append(Feature(self._client, lambda feature_data=feature_data, values=values: _FeatureData(
+                    feature_data.geometry, {**feature_data.properties, **values}
+                )))
+            return features
+        return Collection(self._client, reduce_features, kind="FeatureCollection")
+
+    def getMapId(self, vis_params=None):
+        request = dict(vis_params or {})
+        request["image"] = self
+        response = self._client.data.getMapId(request)
+        response["image"] = self
+        return response
+
+class _ImageFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, args=None):
+        if isinstance(args, Image):
+            return args
+        if isinstance(args, str):
+            return Image(self._client, lambda: self._client.datasets.static_image(args))
+        if args is None:
+            return Image(self._client, lambda: _ImageData(OrderedDict(), {}))
+        return self.constant(args)
+
+    def constant(self, value):
+        return Image(self._client, lambda: _ImageData(OrderedDict(constant=_const(_value(value))), {}))
+
+    def pixelArea(self):
+        return Image(self._client, lambda: _ImageData(
+            OrderedDict(area=lambda grid: grid.pixel_width * grid.pixel_height), {}
+        ))
+
+class _TerrainFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def products(self, input):
+        def with_terrain(data):
+            elevation = next(iter(data.bands.values()))
+
+            def gradients(grid):
+                values = elevation(grid)
+                if min(values.shape) < 2:
+                    return np.zeros_like(values), np.zeros_like(values)
+                d_north, d_east = np.gradient(values, grid.pixel_height, axis=0), np.gradient(values, axis=1) / grid.pixel_width
+                # Rows run north to south, so the row gradient points south
+                return -d_north, d_east
+
+            def slope(grid):
+                d_north, d_east = gradients(grid)
+                return np.degrees(np.arctan(np.hypot(d_north, d_east)))
+
+            def aspect(grid):
+                d_north, d_east = gradients(grid)
+                # Downslope direction, clockwise from north
+                return np.degrees(np.arctan2(-d_east, -d_north)) % 360
+
+            def hillshade(grid):
+                return 255 * np.cos(np.radians(slope(grid)))
+
+            bands = OrderedDict(data.bands)
+            bands.update(slope=slope, aspect=aspect, hillshade=hillshade)
+            return _ImageData(bands, data.properties)
+        return Image(self._client, lambda: with_terrain(_value(input)))
+
+# Features and collections
+
+class _FeatureData:
+    def __init__(self, geometry, properties):
+        self.geometry = geometry
+        self.properties = properties
+
+class Feature(_Node):
+    def _info(self):
+        data = _value(self)
+        return {"type": "Feature", "geometry": _resolve(data.geometry), "properties": _resolve(data.properties)}
+
+    def get(self, name):
+        return ComputedObject(self._client, lambda: _value(self).properties.get(name))
+
+    def set(self, *args):
+        def with_properties():
+            data = _value(self)
+            updates = _value(args[0]) if len(args) == 1 else {args[0]: args[1]}
+            return _FeatureData(data.geometry, {**data.properties, **updates})
+        return Feature(self._client, with_properties)
+
+    def geometry(self):
+        return Geometry(self._client, lambda: _geometry_json(_value(self).geometry))
+
+def _properties(element):
+    return _value(element).properties
+
+class Collection(_Node):
+    """
+    An image or feature collection: a lazily computed list of Image or Feature objects.
+
+    Collections loaded from a dataset keep their date range separate, so filterDate
+    narrows what the dataset generates instead of filtering generated scenes.
+    """
+
+    def __init__(self, client, thunk, kind="ImageCollection", source=None):
+        super().__init__(client, thunk)
+        self._kind = kind
+        self._source = source  # (dataset name, [(start, end), ...]) until the collection is transformed
+
+    def _derive(self, build, kind=None):
+        return Collection(self._client, lambda: build(_value(self)), kind=kind or self._kind)
+
+    def _info(self):
+        return {"type": self._kind, "features": [_resolve(element) for element in _value(self)]}
+
+    def filterDate(self, start, end=None):
+        end = Date(self._client, lambda: _to_datetime(start) + timedelta(milliseconds=1)) if end is None else end
+        if self._source is not None:
+            name, ranges = self._source
+            ranges = ranges + [(start, end)]
+            return Collection(self._client, lambda: self._client.datasets.images(name, ranges), self._kind, (name, ranges))
+
+        def in_range(elements):
+            start_moment, end_moment = _to_datetime(start), _to_datetime(end)
+            return [
+                element for element in elements
+                if start_moment <= _to_datetime(_properties(element)["system:time_start"]) < end_moment
+            ]
+        return self._derive(in_range)
+
+    def filterBounds(self, geometry):
+        # Synthetic datasets cover the whole globe
+        return self
+
+    def filter(self, filter):
+        return self._derive(lambda elements: [element for element in elements if filter.predicate(_properties(element))])
+
+    def map(self, algorithm):
+        return self._derive(lambda elements: [algorithm(element) for element in elements])
+
+    def select(self, *selectors):
+        return self.map(lambda image: image.select(*selectors))
+
+    def merge(self, collection2):
+        return Collection(self._client, lambda: list(_value(self)) + list(_value(collection2)), self._kind)
+
+    def flatten(self):
+        return self._derive(
+            lambda collections: [element for collection in collections for element in _value(collection)],
+            kind="FeatureCollection"
+        )
+
+    def limit(self, maximum, property=None, ascending=True):
+        return self.sort(property, ascending).limit(maximum) if property else self._derive(lambda elements: elements[:maximum])
+
+    def sort(self, property, ascending=True):
+        return self._derive(lambda elements: sorted(
+            elements, key=lambda element: _property(_properties(element), property), reverse=not ascending
+        ))
+
+    def size(self):
+        return Number(self._client, lambda: len(_value(self)))
+
+    def first(self):
+        def first_element():
+            elements = _value(self)
+            return _value(elements[0]) if elements else _ImageData(OrderedDict(), {})
+        return Image(self._client, first_element)
+
+    def aggregate_array(self, property):
+        return List(self._client, lambda: [_property(_properties(element), property) for element in _value(self)])
+
+    def geometry(self):
+        def union():
+            polygons = []
+            for element in _value(self):
+                geometry = _geometry_json(_value(element).geometry) or {}
+                if geometry.get("type") == "Polygon":
+                    polygons.append(geometry["coordinates"])
+                elif geometry.get("type") == "MultiPolygon":
+                    polygons.extend(geometry["coordinates"])
+            return {"type": "MultiPolygon", "coordinates": polygons}
+        return Geometry(self._client, union)
+
+    def _composite(self, reduce):
+        def composite():
+            images = [_value(image) for image in _value(self)]
+            names = list(OrderedDict.fromkeys(name for image in images for name in image.bands))
+            bands = OrderedDict()
+            for name in names:
+                fns = [image.bands[name] for image in images if name in image.bands]
+
+                def band(grid, fns=fns):
+                    stack = np.stack([np.broadcast_to(fn(grid), grid.lons.shape) for fn in fns])
+                    with warnings.catch_warnings():
+                        # All-masked pixels stay masked
+                        warnings.simplefilter("ignore", RuntimeWarning)
+                        values = reduce(stack)
+                    return np.where(np.isnan(stack).all(axis=0), np.nan, values)
+                bands[name] = band
+            return _ImageData(bands, {})
+        return Image(self._client, composite)
+
+    def median(self):
+        return self._composite(lambda stack: np.nanmedian(stack, axis=0))
+
+    def mean(self):
+        return self._composite(lambda stack: np.nanmean(stack, axis=0))
+
+    def sum(self):
+        return self._composite(lambda stack: np.nansum(stack, axis=0))
+
+    def min(self):
+        return self._composite(lambda stack: np.nanmin(stack, axis=0))
+
+    def max(self):
+        return self._composite(lambda stack: np.nanmax(stack, axis=0))
+
+    def mosaic(self):
+        # The last image on top, like Earth Engine
+        def top(stack):
+            result = stack[0].copy()
+            for layer in stack[1:]:
+                result = np.where(np.isnan(layer), result, layer)
+            return result
+        return self._composite(top)
+
+class _ImageCollectionFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, args=None):
+        if isinstance(args, Collection):
+            return args
+        if isinstance(args, str):
+            return Collection(self._client, lambda: self._client.datasets.images(args, []), source=(args, []))
+        return Collection(self._client, lambda: [_ImageFactory(self._client)(image) for image in _value(args or [])])
+
+    def fromImages(self, images):
+        return self(images)
+
+class _FeatureCollectionFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, args=None, opt_column=None):
+        if isinstance(args, Collection):
+            return Collection(self._client, lambda: _value(args), kind="FeatureCollection")
+        if isinstance(args, Feature):
+            args = [args]
+        return Collection(self._client, lambda: list(_value(args or [])), kind="FeatureCollection")
+
+class _FeatureFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, geom=None, opt_properties=None):
+        return Feature(self._client, lambda: _FeatureData(geom, dict(_value(opt_properties) or {})))
+
+class _GeometryFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, geo_json, opt_proj=None, opt_geodesic=None):
+        return geo_json if isinstance(geo_json, Geometry) else Geometry(self._client, lambda: _geometry_json(geo_json))
+
+    def Polygon(self, coords, proj=None, geodesic=None):
+        coords = _value(coords)
+        # A single ring of [lng, lat] positions or a list of rings
+        rings = [coords] if coords and isinstance(coords[0][0], (int, float)) else coords
+        return Geometry(self._client, lambda: {"type": "Polygon", "coordinates": rings})
+
+    def Point(self, coords, proj=None):
+        return Geometry(self._client, lambda: {"type": "Point", "coordinates": list(coords)})
+
+class _DateFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, date, tz=None):
+        return date if isinstance(date, Date) else Date(self._client, lambda: _to_datetime(date))
+
+class _NumberFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, number):
+        return number if isinstance(number, Number) else Number(self._client, lambda: _value(number))
+
+class _ListFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, items):
+        return List(self._client, lambda: list(_value(items)))
+
+    def sequence(self, start, end=None, step=None, count=None):
+        def sequence():
+            first, last, increment = _value(start), _value(end), _value(step) or 1
+            if count is not None:
+                return [first + increment * i for i in range(int(_value(count)))]
+            values = []
+            value = first
+            while value <= last:
+                values.append(value)
+                value += increment
+            return values
+        return List(self._client, sequence)
+
+class _DictionaryFactory:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, opt_dict=None):
+        return Dictionary(self._client, lambda: dict(_value(opt_dict) or {}))
+
+# Synthetic datasets
+
+def _unit_hash(*parts):
+    """
+    Deterministic pseudo-random number in [0, 1) from its arguments.
+    """
+    digest = hashlib.sha1("/".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+# Optical sensors: first acquisition, revisit days, red/NIR bands, scaling, cloud property and granules per pass
+OPTICAL_SENSORS = {
+    "COPERNICUS/S2_SR": {
+        "start": datetime(2017, 3, 28), "revisit_days": 5, "red": "B4", "nir": "B8",
+        "scale": 0.0001, "offset": 0.0, "cloud": "CLOUDY_PIXEL_PERCENTAGE", "index": "{:%Y%m%dT103021_%Y%m%dT103021}_{}",
+        "granules": ("T31UFU", "T31UGU")
+    },
+    "COPERNICUS/S2_SR_HARMONIZED": {
+        "start": datetime(2017, 3, 28), "revisit_days": 5, "red": "B4", "nir": "B8",
+        "scale": 0.0001, "offset": 0.0, "cloud": "CLOUDY_PIXEL_PERCENTAGE", "index": "{:%Y%m%dT103021_%Y%m%dT103021}_{}",
+        "granules": ("T31UFU", "T31UGU")
+    },
+    "LANDSAT/LC08/C02/T1_L2": {
+        "start": datetime(2013, 4, 11), "revisit_days": 16, "red": "SR_B4", "nir": "SR_B5",
+        "scale": 0.0000275, "offset": -0.2, "cloud": "CLOUD_COVER", "index": "LC08_198024_{:%Y%m%d}"
+    },
+    "LANDSAT/LC09/C02/T1_L2": {
+        "start": datetime(2021, 10, 31), "revisit_days": 16, "red": "SR_B4", "nir": "SR_B5",
+        "scale": 0.0000275, "offset": -0.2, "cloud": "CLOUD_COVER", "index": "LC09_198024_{:%Y%m%d}"
+    }
+}
+
+# Sentinel-2 passes are split into granules (tiles): each covers an equal band of
+# every degree of longitude, overlapping its neighbours by this much, so fields
+# near a band edge are seen by two images of the same day
+GRANULE_OVERLAP_DEGREES = 0.05
+
+WORLDCOVER_CLASSES = (10, 20, 30, 40, 40, 40, 50, 60, 80, 90)
+MODIS_LAND_COVER_CLASSES = (1, 4, 5, 8, 9, 10, 12, 12, 14, 16)
+
+class SyntheticDatasets:
+    """
+    Procedurally generated Earth Engine datasets, sampled from a seeded NumPy texture.
+    """
+
+    def __init__(self, client, seed=0):
+        self._client = client
+        self.seed = seed
+        self.texture = np.random.default_rng(seed).random((TEXTURE_SIZE, TEXTURE_SIZE))
+        self.collections = {
+            **{name: self._optical(name, spec) for name, spec in OPTICAL_SENSORS.items()},
+            "ECMWF/ERA5/DAILY": (datetime(1979, 1, 2), "day", self._era5),
+            "UCSB-CHG/CHIRPS/DAILY": (datetime(1981, 1, 1), "day", self._chirps),
+            "MODIS/061/MCD12Q1": (datetime(2001, 1, 1), "year", self._modis_land_cover),
+            "MODIS/061/MOD44B": (datetime(2000, 3, 5), "year", self._modis_vcf),
+            "ESA/WorldCover/v200": (datetime(2021, 1, 1), "once", self._worldcover)
+        }
+
+    def sample(self, lons, lats, salt=0, cell=TEXTURE_CELL_DEGREES):
+        rows = np.floor(lats / cell).astype(np.int64) + salt * 17
+        columns = np.floor(lons / cell).astype(np.int64) + salt * 29
+        return self.texture[rows % TEXTURE_SIZE, columns % TEXTURE_SIZE]
+
+    def season(self, lats, moment, amplitude=1.0):
+        # Peaks in late July in the northern hemisphere and in late January in the southern one
+        phase = 2 * math.pi * (moment.timetuple().tm_yday - 110) / 365.25
+        return amplitude * math.sin(phase) * np.where(lats < 0, -1.0, 1.0)
+
+    def images(self, name, ranges):
+        """
+        Get the images of a collection acquired within every one of the date ranges.
+        """
+        if name not in self.collections:
+            raise EEException(f"ImageCollection.load: ImageCollection asset '{name}' not found (does not exist or caller does not have access).")
+        first, step, make = self.collections[name]
+        start, end = first, datetime.now(timezone.utc).replace(tzinfo=None)
+        for range_start, range_end in ranges:
+            start, end = max(start, _to_datetime(range_start)), min(end, _to_datetime(range_end))
+
+        moments = []
+        if step == "once":
+            moments = [first] if start <= first < end else []
+        elif step == "year":
+            moments = [first.replace(year=year) for year in range(start.year, end.year + 1) if start <= first.replace(year=year) < end]
+        else:
+            step_days = 1 if step == "day" else step
+            skipped = max(0, math.ceil((start - first).total_seconds() / (step_days * 86400)))
+            moment = first + timedelta(days=skipped * step_days)
+            while moment < end:
+                moments.append(moment)
+                moment += timedelta(days=step_days)
+
+        granules = OPTICAL_SENSORS.get(name, {}).get("granules")
+        if granules:
+            return [
+                Image(self._client, lambda moment=moment, granule=granule: make(moment, granule))
+                for moment in moments for granule in granules
+            ]
+        return [Image(self._client, lambda moment=moment: make(moment)) for moment in moments]
+
+    def _optical(self, name, spec):
+        granules = spec.get("granules") or (None,)
+
+        def scene(moment, granule=None):
+            cloud_cover = round(100 * _unit_hash(self.seed, name, moment) ** 2, 2)
+            noise_salt = int(_unit_hash(self.seed, name, moment, "noise") * 1000)
+
+            def ndvi(grid):
+                base = 0.3 + 0.45 * self.sample(grid.lons, grid.lats, salt=1)
+                noise = 0.06 * (self.sample(grid.lons, grid.lats, salt=noise_salt) - 0.5)
+                return np.clip(base + self.season(grid.lats, moment, 0.25) + noise, -0.2, 0.95)
+
+            def reflectance(grid):
+                value = ndvi(grid)
+                red = 0.04 + 0.1 * (1 - value) / 1.2
+                return red, red * (1 + value) / (1 - value)
+
+            def to_digital_numbers(reflectance_value):
+                return (reflectance_value - spec["offset"]) / spec["scale"]
+
+            def footprint(values, grid):
+                if granule is None:
+                    return values
+                position, width = granules.index(granule), 1 / len(granules)
+                offset = grid.lons % 1
+                covered = (offset >= position * width - GRANULE_OVERLAP_DEGREES) & (offset < (position + 1) * width + GRANULE_OVERLAP_DEGREES)
+                return np.where(covered, values, np.nan)
+
+            bands = OrderedDict()
+            bands[spec["red"]] = lambda grid: footprint(to_digital_numbers(reflectance(grid)[0]), grid)
+            bands[spec["nir"]] = lambda grid: footprint(to_digital_numbers(reflectance(grid)[1]), grid)
+            return _ImageData(bands, {
+                "system:index": spec["index"].format(moment, granule),
+                "system:time_start": _millis(moment),
+                spec["cloud"]: cloud_cover
+            })
+        return spec["start"], spec["revisit_days"], scene
+
+    def _daily_properties(self, moment):
+        return {"system:index": moment.strftime("%Y%m%d"), "system:time_start": _millis(moment)}
+
+    def _era5(self, moment):
+        day_anomaly = 6 * (_unit_hash(self.seed, "era5", moment) - 0.5)
+
+        def temperature(grid):
+            latitude_effect = 30 * np.cos(np.radians(grid.lats)) - 15
+            return 273.15 + latitude_effect + self.season(grid.lats, moment, 10) + day_anomaly
+        return _ImageData(OrderedDict(mean_2m_air_temperature=temperature), self._daily_properties(moment))
+
+    def _chirps(self, moment):
+        chance = _unit_hash(self.seed, "chirps", moment)
+        amount = 0.0 if chance > 0.3 else 25 * (chance / 0.3) ** 2
+
+        def precipitation(grid):
+            return amount * (0.8 + 0.4 * self.sample(grid.lons, grid.lats, salt=2, cell=0.05))
+        return _ImageData(OrderedDict(precipitation=precipitation), self._daily_properties(moment))
+
+    def _classes(self, grid, classes, salt):
+        index = np.minimum((self.sample(grid.lons, grid.lats, salt=salt) * len(classes)).astype(np.int64), len(classes) - 1)
+        return np.asarray(classes, dtype=np.float64)[index]
+
+    def _modis_land_cover(self, moment):
+        return _ImageData(
+            OrderedDict(LC_Type1=lambda grid: self._classes(grid, MODIS_LAND_COVER_CLASSES, 3)),
+            {"system:index": moment.strftime("%Y_%m_%d"), "system:time_start": _millis(moment)}
+        )
+
+    def _modis_vcf(self, moment):
+        def tree(grid):
+            return np.round(70 * self.sample(grid.lons, grid.lats, salt=4))
+
+        def non_vegetated(grid):
+            return np.round(20 * self.sample(grid.lons, grid.lats, salt=5))
+
+        def non_tree(grid):
+            return 100 - tree(grid) - non_vegetated(grid)
+
+        return _ImageData(
+            OrderedDict(Percent_Tree_Cover=tree, Percent_NonTree_Vegetation=non_tree, Percent_NonVegetated=non_vegetated),
+            {"system:index": moment.strftime("%Y_%m_%d"), "system:time_start": _millis(moment)}
+        )
+
+    def _worldcover(self, moment):
+        return _ImageData(
+            OrderedDict(Map=lambda grid: self._classes(grid, WORLDCOVER_CLASSES, 6)),
+            {"system:index": "ESA_WorldCover_10m_2021_v200", "system:time_start": _millis(moment)}
+        )
+
+    def static_image(self, name):
+        if name == "USGS/SRTMGL1_003":
+            def elevation(grid):
+                lons, lats = np.radians(grid.lons), np.radians(grid.lats)
+                return 250 + 180 * np.sin(lons * 400) * np.cos(lats * 350) + 40 * np.sin(lons * 2300 + lats * 1700)
+            return _ImageData(OrderedDict(elevation=elevation), {"system:index": "SRTMGL1_003"})
+        raise EEException(f"Image.load: Image asset '{name}' not found (does not exist or caller does not have access).")
+
+# Client
+
+class _Data:
+    """
+    The round trips of the simulated client, like ee.data.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def computeValue(self, obj):
+        self._client._round_trip("getInfo")
+        return _resolve(obj)
+
+    def getMapId(self, params):
+        self._client._round_trip("getMapId")
+        map_id = f"projects/simulated/maps/{uuid.uuid4().hex}"
+        return {
+            "mapid": map_id,
+            "token": "",
+            "tile_fetcher": SimpleNamespace(url_format=f"{TILE_URL_BASE}/{map_id}/tiles/{{z}}/{{x}}/{{y}}")
+        }
+
+class SimulatedEarthEngine:
+    """
+    Stand-in for the ee module backed by synthetic data.
+
+    Args:
+        latency_seconds (float): Time every round trip (getInfo, getMapId, Initialize) takes
+        jitter (float): Relative random variation of the latency, e.g. 0.2 for +/-20%
+        seed (int): Seed of the synthetic datasets
+        max_concurrent (int): Round trips served at once; more are rejected with a
+            "Too Many Requests" error like Earth Engine's concurrency quota. Unlimited if None
+    """
+
+    EEException = EEException
+
+    def __init__(self, latency_seconds=0.05, jitter=0.2, seed=0, max_concurrent=None):
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+        self.seed = seed
+        self.max_concurrent = max_concurrent
+        self._active = 0
+        self.datasets = SyntheticDatasets(self, seed)
+        self._random = random.Random(seed)
+        self._round_trips = {}
+        self._lock = threading.Lock()
+
+        self.data = _Data(self)
+        self.Image = _ImageFactory(self)
+        self.ImageCollection = _ImageCollectionFactory(self)
+        self.Feature = _FeatureFactory(self)
+        self.FeatureCollection = _FeatureCollectionFactory(self)
+        self.Geometry = _GeometryFactory(self)
+        self.Date = _DateFactory(self)
+        self.Number = _NumberFactory(self)
+        self.List = _ListFactory(self)
+        self.Dictionary = _DictionaryFactory(self)
+        self.Filter = _FilterFactory()
+        self.Reducer = _ReducerFactory()
+        self.Terrain = _TerrainFactory(self)
+
+    def _sleep(self):
+        with self._lock:
+            factor = 1 + self.jitter * (2 * self._random.random() - 1)
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds * factor)
+
+    def _round_trip(self, call):
+        with self._lock:
+            self._round_trips[call] = self._round_trips.get(call, 0) + 1
+            if self.max_concurrent is not None and self._active >= self.max_concurrent:
+                raise EEException("Too Many Requests: Request was rejected because the request rate or concurrency limit was exceeded.")
+            self._active += 1
+        try:
+            self._sleep()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def Initialize(self, *args, **kwargs):
+        self._sleep()
+
+    def round_trips(self):
+        """
+        Get the number of round trips made so far by call ("getInfo", "getMapId").
+        """
+        with self._lock:
+            return dict(self._round_trips)
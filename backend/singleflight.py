@@ -0,0 +1,103 @@
+"""
+Single-flight coalescing of identical concurrent computations.
+
+When several callers ask for the same key at the same time, only the first
+(the leader) runs the computation; the others (followers) wait for it and get
+the same result, or the same exception. Nothing is kept once the computation
+finishes; caching finished results is the result cache's job.
+
+Computations can report progress. Every caller, including followers that join
+late, receives every progress event, so streaming clients that piggyback on
+another request still see stages arrive one by one.
+"""
+
+import logging
+import threading
+
+from metrics import coalesced_calls
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.progress = []  # Every progress event so far, replayed to late joiners
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def publish(self, *event):
+        with self.lock:
+            self.progress.append(event)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(*event)
+            except Exception as e:
+                logger.warning(f"Progress listener failed: {e}")
+
+    def listen(self, listener):
+        with self.lock:
+            replay = list(self.progress)
+            self.listeners.append(listener)
+        for event in replay:
+            listener(*event)
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time and shares its outcome.
+
+    Args:
+        name (str): Label for metrics and logs
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, on_progress=None):
+        """
+        Run fn, or wait for the identical computation already running.
+
+        Args:
+            key: Hashable identity of the computation
+            fn (callable): fn(publish) computing the result; publish(*event) reports progress
+            on_progress (callable): Optional, called with every progress event
+
+        Returns:
+            The computation's result (the leader's exception is raised to every caller)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        coalesced_calls.inc(flight=self.name, role="leader" if leader else "follower")
+        if on_progress is not None:
+            flight.listen(on_progress)
+
+        if not leader:
+            logger.info(f"Joining in-flight {self.name} computation")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(flight.publish)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            # Later callers start a fresh computation (or hit the result cache)
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
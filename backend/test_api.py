@@ -0,0 +1,158 @@
+"""
+Request validation of the API, against the simulated Earth Engine.
+"""
+
+import pytest
+
+FIELD = [[5.0, 52.0], [5.01, 52.0], [5.01, 52.01], [5.0, 52.01], [5.0, 52.0]]
+
+def polygon(*rings):
+    return {"type": "Polygon", "coordinates": list(rings)}
+
+BAD_POLYGONS = [
+    {"type": "Point", "coordinates": [1, 2]},
+    {"type": "Polygon"},
+    polygon(),
+    polygon([[1, 2], [3, 4]] * 2, 5),
+    polygon([["a", "b"], ["c", "d"], ["e", "f"], ["a", "b"]]),
+    polygon([[True, False]] * 4),
+    polygon([[5.0, 52.0], [5.01, 52.0], [5.0, 52.0]]),
+    polygon(FIELD, [[5.001, 52.001], [5.002, 52.001], [5.001, 52.001]]),
+]
+
+@pytest.mark.parametrize("bad_polygon", BAD_POLYGONS)
+@pytest.mark.parametrize("path, body", [
+    ("/ndvi-tiles/", {}),
+    ("/ndvi-tiles/?stream=true", {}),
+    ("/ndvi-tiles/date/", {"date": "2024-05-01"}),
+    ("/ndvi-anomaly/", {"start_date": "2024-05-01", "end_date": "2024-06-01"}),
+])
+def test_malformed_polygons_are_rejected(client, path, body, bad_polygon):
+    response = client.post(path, json={"polygon": bad_polygon, **body})
+    assert response.status_code == 400, response.text
+
+def test_non_finite_coordinates_are_rejected(client):
+    # JSON can't carry NaN, but Python's json module and some clients send it anyway
+    response = client.post(
+        "/ndvi-tiles/",
+        content='{"polygon": {"type": "Polygon", "coordinates": [[[NaN, 1], [2, 1], [2, 2], [NaN, 1]]]}}',
+        headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code in (400, 422)
+
+def test_valid_polygon_is_accepted(client):
+    response = client.post("/ndvi-tiles/", json={"polygon": polygon(FIELD), "start_date": "2024-3-1", "end_date": "2024-04-01"})
+    assert response.status_code == 200
+    assert response.json()["ndvi_tiles"]["start_date"] == "2024-03-01"
+
+def feature_collection(*features):
+    return {"type": "FeatureCollection", "features": list(features)}
+
+def feature(geometry, field_id="a"):
+    return {"type": "Feature", "properties": {"id": field_id}, "geometry": geometry}
+
+@pytest.mark.parametrize("body", [
+    {"fields": feature_collection(None)},
+    {"fields": feature_collection("field")},
+    {"fields": feature_collection({"type": "Feature", "properties": 5, "geometry": polygon(FIELD)})},
+    {"fields": feature_collection(feature({"type": "Polygon"}))},
+    {"fields": feature_collection(feature({"type": "MultiPolygon", "coordinates": [[[["a", "b"]] * 4]]}))},
+    {"fields": feature_collection(feature({"type": "Point", "coordinates": [1, 2]}))},
+    {"fields": {"type": "FeatureCollection", "features": "none"}},
+    {"fields": {"type": "MultiPolygon"}},
+    {"fields": feature_collection(feature(polygon(FIELD))), "start_date": "garbage"},
+    {"fields": feature_collection(feature(polygon(FIELD))), "start_date": "2024-06-01", "end_date": "2024-05-01"},
+])
+def test_malformed_batches_are_rejected(client, body):
+    response = client.post("/ndvi-tiles/batch/", json=body)
+    assert response.status_code == 400, response.text
+
+def test_batch_accepts_polygons_and_multipolygons(client):
+    response = client.post("/ndvi-tiles/batch/", json={
+        "fields": feature_collection(
+            feature(polygon(FIELD), "a"),
+            feature({"type": "MultiPolygon", "coordinates": [[FIELD]]}, "b")
+        ),
+        "start_date": "2024-4-1",
+        "end_date": "2024-05-01"
+    })
+    assert response.status_code == 200, response.text
+    assert set(response.json()["fields"]) == {"a", "b"}
+
+def test_cached_responses_expire_with_their_static_tile_urls(api, client):
+    body = {
+        "polygon": polygon([[6.0, 51.0], [6.01, 51.0], [6.01, 51.01], [6.0, 51.01], [6.0, 51.0]]),
+        "include_topography": True,
+        "include_landcover": True
+    }
+    # The static layers' URLs were minted long ago and expire in a minute
+    with api.static_tile_cache_lock:
+        for name in ("srtm_elevation", "srtm_slope", "esa_worldcover"):
+            api.static_tile_cache[name] = (f"https://tiles.test/{name}/{{z}}/{{x}}/{{y}}", api.time.time() + 60)
+    response = client.post("/ndvi-tiles/", json=body).json()
+    assert response["topography"]["elevation"]["tile_expires_at"] == pytest.approx(api.time.time() + 60, abs=5)
+
+    key = api.polygon_cache_key(body["polygon"], api.result_cache_params(api.PolygonData(**body)))
+    expires_at = api.result_cache.backend._entries[key][1]
+    assert expires_at == pytest.approx(response["landcover"]["land_cover"]["tile_expires_at"], abs=1)
+
+@pytest.mark.parametrize("day, unit, expected", [
+    ("2024-01-15", "month", "2024-01-01"),
+    ("2024-03-01", "month", "2024-03-01"),
+    ("2024-01-15", "week", "2024-01-15"),
+    ("2024-01-21", "week", "2024-01-15"),
+    ("2025-01-01", "week", "2024-12-30"),
+])
+def test_calendar_bin_start(api, day, unit, expected):
+    assert api.calendar_bin_start(day, unit) == expected
+
+@pytest.mark.parametrize("aggregation, starts", [
+    ("monthly", {"2024-01-01", "2024-02-01"}),
+    ("weekly", {"2024-01-15", "2024-01-22", "2024-01-29", "2024-02-05", "2024-02-12", "2024-02-19", "2024-02-26"}),
+])
+def test_aggregated_bins_follow_the_calendar(client, aggregation, starts):
+    response = client.post("/ndvi-tiles/", json={
+        "polygon": polygon([[7.0, 50.0], [7.01, 50.0], [7.01, 50.01], [7.0, 50.01], [7.0, 50.0]]),
+        "start_date": "2024-01-17",
+        "end_date": "2024-03-01",
+        "time_series": True,
+        "aggregation": aggregation
+    })
+    points = response.json()["time_series"]["data"]
+    assert points and {point["date"] for point in points} <= starts
+    assert all(point["end_date"] <= "2024-03-01" for point in points)
+
+def test_anomaly_accepts_unpadded_dates_and_shares_tiles_across_windings(api, client):
+    ring = [[8.0, 49.0], [8.01, 49.0], [8.01, 49.01], [8.0, 49.01], [8.0, 49.0]]
+    first = client.post("/ndvi-anomaly/", json={"polygon": polygon(ring), "start_date": "2024-5-1", "end_date": "2024-07-01"})
+    assert first.status_code == 200, first.text
+    assert first.json()["anomaly_tiles"]["start_date"] == "2024-05-01"
+    assert first.json()["anomaly_tiles"]["url"]
+
+    # The same field, reversed and starting at another vertex, past the result cache
+    api.result_cache.clear()
+    redrawn = [[8.01, 49.01], [8.01, 49.0], [8.0, 49.0], [8.0, 49.01], [8.01, 49.01]]
+    second = client.post("/ndvi-anomaly/", json={"polygon": polygon(redrawn), "start_date": "2024-05-01", "end_date": "2024-07-01"})
+    assert second.status_code == 200, second.text
+    assert second.json()["anomaly_tiles"]["url"] == first.json()["anomaly_tiles"]["url"]
+
+def test_streaming_ndvi_rejects_unsupported_rasters(client):
+    response = client.post(
+        "/api/process-ndvi?streaming=true",
+        files={"file": ("field.bin", b"not a raster at all", "application/octet-stream")}
+    )
+    assert response.status_code == 400, response.text
+
+def test_streaming_ndvi_without_tifffile_is_unavailable(client, monkeypatch):
+    import raster
+
+    monkeypatch.setattr(raster, "tifffile", None)
+    response = client.post(
+        "/api/process-ndvi?streaming=true",
+        files={"file": ("field.tif", b"II*\x00" + b"\x00" * 64, "image/tiff")}
+    )
+    assert response.status_code == 503, response.text
+
+def test_ndvi_rejects_undecodable_images(client):
+    response = client.post("/api/process-ndvi", files={"file": ("field.png", b"not an image", "image/png")})
+    assert response.status_code == 400, response.text
@@ -0,0 +1,21 @@
+"""
+Round trips per request of the benchmark scenarios, checked against benchmark_baseline.json.
+"""
+
+import pytest
+
+from benchmark import DEFAULT_CONCURRENCY, SCENARIOS, baseline_regression, load_baseline, run_scenario, warm_up
+
+@pytest.fixture(scope="module")
+def warmed_client(client):
+    warm_up(client)
+    return client
+
+@pytest.mark.parametrize("name", sorted(SCENARIOS))
+def test_round_trips_within_baseline(api, warmed_client, name):
+    baseline = load_baseline()
+    assert name in baseline, f"{name} has no baseline; run python benchmark.py --update-baseline"
+
+    result = run_scenario(warmed_client, api.ee, name, count=3, concurrency=DEFAULT_CONCURRENCY)
+    assert result["failures"] == []
+    assert baseline_regression(name, result, baseline) is None
@@ -0,0 +1,48 @@
+"""
+Tests for the polygon cache key normalization.
+"""
+
+import pytest
+
+from cache import normalize_ring, polygon_cache_key
+
+# A closed, counter-clockwise L-shaped field
+RING = [[0.0, 0.0], [2.0, 0.0], [2.0, 1.0], [1.0, 1.0], [1.0, 2.0], [0.0, 2.0], [0.0, 0.0]]
+
+def polygon(ring):
+    return {"type": "Polygon", "coordinates": [ring]}
+
+def rotated(ring, steps):
+    open_ring = ring[:-1]
+    shifted = open_ring[steps:] + open_ring[:steps]
+    return shifted + [shifted[0]]
+
+def test_rotated_ring_has_the_same_key():
+    key = polygon_cache_key(polygon(RING), {"a": 1})
+    for steps in range(1, len(RING) - 1):
+        assert polygon_cache_key(polygon(rotated(RING, steps)), {"a": 1}) == key
+
+def test_reversed_ring_has_the_same_key():
+    assert polygon_cache_key(polygon(RING[::-1]), {}) == polygon_cache_key(polygon(RING), {})
+
+def test_rounding_noise_and_repeated_vertices_are_ignored():
+    noisy = [[x + 1e-9, y - 1e-9] for x, y in RING]
+    noisy.insert(2, list(noisy[1]))
+    assert polygon_cache_key(polygon(noisy), {}) == polygon_cache_key(polygon(RING), {})
+
+def test_normalized_ring_is_closed_counter_clockwise_from_smallest_vertex():
+    normalized = normalize_ring(rotated(RING[::-1], 3))
+    assert normalized == RING
+
+def test_different_params_or_shapes_have_different_keys():
+    key = polygon_cache_key(polygon(RING), {"a": 1})
+    assert polygon_cache_key(polygon(RING), {"a": 2}) != key
+    assert polygon_cache_key(polygon([[0, 0], [1, 0], [1, 1], [0, 0]]), {"a": 1}) != key
+
+def test_param_order_does_not_matter():
+    assert polygon_cache_key(polygon(RING), {"a": 1, "b": 2}) == polygon_cache_key(polygon(RING), {"b": 2, "a": 1})
+
+@pytest.mark.parametrize("coordinates", [[1, 2], "rings", [[[0, 0], [1, 0]], 5]])
+def test_non_list_rings_are_rejected(coordinates):
+    with pytest.raises(ValueError):
+        polygon_cache_key({"type": "Point", "coordinates": coordinates}, {})
@@ -0,0 +1,60 @@
+"""
+Tests for the per-field NDVI climatology.
+"""
+
+import math
+
+import pytest
+
+import climatology
+from climatology import ClimatologyStore, build_climatology, climatology_at, day_of_year, z_score
+
+def observations(points):
+    return [{"date": day, "ndvi": ndvi} for day, ndvi in points]
+
+def test_day_of_year_ignores_leap_days():
+    assert day_of_year("2023-01-01") == 1
+    assert day_of_year("2024-03-01") == day_of_year("2023-03-01") == 60
+    assert day_of_year("2024-02-29") == day_of_year("2024-02-28") == 59
+    assert day_of_year("2024-12-31") == 365
+
+def test_mean_and_std_pool_the_window_across_years():
+    baseline = build_climatology(observations([
+        ("2020-06-10", 0.6), ("2021-06-15", 0.7), ("2022-06-20", 0.8), ("2022-09-01", 0.2)
+    ]), window_days=5)
+    mean, std, count = climatology_at(baseline, "2024-06-15")
+    assert count == 3
+    assert mean == pytest.approx(0.7)
+    assert std == pytest.approx(0.1)
+    assert z_score(0.9, mean, std) == pytest.approx(2.0)
+    assert z_score(0.5, mean, std) == pytest.approx(-2.0)
+
+def test_window_wraps_around_the_turn_of_the_year():
+    baseline = build_climatology(observations([
+        ("2020-12-29", 0.3), ("2021-12-31", 0.3), ("2022-01-02", 0.5)
+    ]), window_days=3)
+    mean, _, count = climatology_at(baseline, "2024-01-01")
+    assert count == 3
+    assert mean == pytest.approx(0.3666667)
+
+def test_days_without_enough_observations_have_no_baseline():
+    baseline = build_climatology(observations([("2020-06-10", 0.6), ("2021-06-15", 0.7)]), window_days=5)
+    mean, std, count = climatology_at(baseline, "2024-06-15")
+    assert (mean, std, count) == (None, None, 2)
+    assert z_score(0.5, mean, std) is None
+
+def test_std_has_a_floor():
+    baseline = build_climatology(observations([("2020-06-15", 0.5), ("2021-06-15", 0.5), ("2022-06-15", 0.5)]))
+    _, std, _ = climatology_at(baseline, "2024-06-15")
+    assert std == climatology.MIN_BASELINE_STD
+    assert math.isfinite(z_score(0.6, 0.5, std))
+
+def test_store_round_trip(tmp_path):
+    store = ClimatologyStore(str(tmp_path / "climatology.sqlite3"))
+    baseline = build_climatology(observations([("2020-06-15", 0.5)]))
+    assert store.get("f", "sentinel-2", "v1") is None
+    store.put("f", "sentinel-2", "v1", baseline)
+    stored = store.get("f", "sentinel-2", "v1")
+    assert stored["count"] == baseline["count"]
+    assert store.get("f", "landsat-8", "v1") is None
+    assert store.stats() == {"climatologies": 1}
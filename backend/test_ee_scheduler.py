@@ -0,0 +1,107 @@
+"""
+Tests for the Earth Engine round-trip scheduler.
+"""
+
+import time
+
+import pytest
+
+from ee_scheduler import EarthEngineBusyError, EarthEngineScheduler, classify_error
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def scheduler(**kwargs):
+    options = {"initial_limit": 8, "retry_base_seconds": 0, "retry_max_seconds": 0, "queue_timeout_seconds": 1}
+    return EarthEngineScheduler(**{**options, **kwargs})
+
+def failing(errors, result="ok"):
+    # A round trip that raises the given errors in turn, then succeeds
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+@pytest.mark.parametrize("error, expected", [
+    (StatusError(429), "throttled"),
+    (StatusError(503), "unavailable"),
+    (StatusError(400), None),
+    (Exception("Too Many Requests: Request was rejected"), "throttled"),
+    (Exception("<HttpError 429 when requesting https://earthengine.googleapis.com>"), "throttled"),
+    (Exception("<HttpError 503 when requesting https://earthengine.googleapis.com>"), "unavailable"),
+    (Exception("Service Unavailable"), "unavailable"),
+    (Exception("Image.load: Image asset 'users/farm/field_503' not found"), None),
+    (Exception("Collection query aborted after accumulating over 5000 elements; 1429 pixels"), None),
+    (Exception("Geometry.Polygon: invalid coordinate 45.0503"), None),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+def test_throttled_call_lowers_the_limit_and_is_retried():
+    s = scheduler()
+    fn, calls = failing([StatusError(429)])
+    assert s.call("getInfo", fn) == "ok"
+    assert len(calls) == 2
+    assert s.limit == 4
+    assert s.snapshot()["throttled"] == 1
+
+def test_successes_raise_the_limit_additively():
+    s = scheduler(initial_limit=2)
+    for _ in range(3):
+        s.call("getInfo", lambda: None)
+    # 2 -> 2.5 -> 2.9 -> 3.24
+    assert s.limit == 3
+
+def test_limit_stays_within_bounds():
+    s = scheduler(initial_limit=2, min_limit=2, max_limit=3, max_retries=10)
+    fn, _ = failing([StatusError(429)] * 5)
+    s.call("getInfo", fn)
+    assert s.limit == 2
+    for _ in range(20):
+        s.call("getInfo", lambda: None)
+    assert s.limit == 3
+
+def test_throttles_of_one_round_only_lower_the_limit_once():
+    s = scheduler()
+    s._acquire("a")
+    s._acquire("b")
+    started = time.monotonic()
+    s._release(started, "throttled")
+    s._release(started, "throttled")
+    assert s.limit == 4
+
+def test_other_errors_are_raised_without_retrying():
+    s = scheduler()
+    fn, calls = failing([ValueError("Image asset 'users/farm/field_503' not found")])
+    with pytest.raises(ValueError):
+        s.call("getInfo", fn)
+    assert len(calls) == 1
+    assert s.limit == 8
+    assert s.in_flight() == 0
+
+def test_exhausted_retries_raise_busy():
+    s = scheduler(max_retries=2)
+    fn, calls = failing([StatusError(503)] * 3)
+    with pytest.raises(EarthEngineBusyError):
+        s.call("getInfo", fn)
+    assert len(calls) == 3
+    assert s.in_flight() == 0
+
+def test_backoff_is_bounded_and_grows_exponentially():
+    s = scheduler(retry_base_seconds=1.0, retry_max_seconds=5.0)
+    for attempt, bound in enumerate((1, 2, 4, 5, 5)):
+        assert all(0 <= s.backoff_seconds(attempt) <= bound for _ in range(50))
+
+def test_calls_beyond_the_limit_time_out_in_the_queue():
+    s = scheduler(initial_limit=1, queue_timeout_seconds=0.05)
+    s._acquire("a")
+    with pytest.raises(EarthEngineBusyError):
+        s.call("getInfo", lambda: None)
+    assert s.queue_depth() == 0
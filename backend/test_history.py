@@ -0,0 +1,59 @@
+"""
+Tests for the per-field NDVI history coverage.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+import history
+from history import NdviHistoryStore
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Nothing in these tests is recent enough to be held back by the settle window
+    monkeypatch.setattr(history, "HISTORY_SETTLE_DAYS", 0)
+    return NdviHistoryStore(str(tmp_path / "history.sqlite3"))
+
+def observation(day, ndvi=0.5):
+    return {"image_id": f"img-{day}", "date": day, "ndvi": ndvi}
+
+def test_unknown_field_misses_the_whole_window(store):
+    assert store.missing_ranges("f", "s2", "2024-01-01", "2024-06-01") == [("2024-01-01", "2024-06-01")]
+
+def test_covered_window_misses_nothing(store):
+    store.add("f", "s2", [], [("2024-01-01", "2024-06-01")])
+    assert store.missing_ranges("f", "s2", "2024-02-01", "2024-05-01") == []
+
+def test_overlapping_window_misses_only_the_new_parts(store):
+    store.add("f", "s2", [], [("2024-03-01", "2024-06-01")])
+    assert store.missing_ranges("f", "s2", "2024-01-01", "2024-08-01") == [
+        ("2024-01-01", "2024-03-01"),
+        ("2024-06-01", "2024-08-01")
+    ]
+
+def test_disjoint_window_fetches_the_gap_to_stay_contiguous(store):
+    store.add("f", "s2", [], [("2024-01-01", "2024-02-01")])
+    assert store.missing_ranges("f", "s2", "2024-05-01", "2024-06-01") == [("2024-02-01", "2024-06-01")]
+    store.add("f", "s2", [], [("2024-02-01", "2024-06-01")])
+    assert store.coverage("f", "s2") == ("2024-01-01", "2024-06-01")
+
+def test_coverage_is_kept_per_sensor(store):
+    store.add("f", "s2", [], [("2024-01-01", "2024-06-01")])
+    assert store.missing_ranges("f", "l8", "2024-01-01", "2024-06-01") == [("2024-01-01", "2024-06-01")]
+
+def test_unpadded_dates_are_normalized(store):
+    store.add("f", "s2", [observation("2024-3-5"), observation("2024-10-02")], [("2024-3-1", "2024-11-01")])
+    assert store.coverage("f", "s2") == ("2024-03-01", "2024-11-01")
+    assert store.missing_ranges("f", "s2", "2024-3-5", "2024-11-01") == []
+    assert [o["date"] for o in store.observations("f", "s2", "2024-3-1", "2024-11-01")] == ["2024-03-05", "2024-10-02"]
+
+def test_invalid_dates_are_rejected(store):
+    with pytest.raises(ValueError):
+        store.missing_ranges("f", "s2", "2024-13-01", "2024-06-01")
+
+def test_recent_days_stay_uncovered(store, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_SETTLE_DAYS", 5)
+    today = date.today()
+    store.add("f", "s2", [], [("2024-01-01", (today + timedelta(days=1)).isoformat())])
+    assert store.coverage("f", "s2")[1] == (today - timedelta(days=5)).isoformat()
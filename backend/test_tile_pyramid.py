@@ -0,0 +1,58 @@
+"""
+Tests for the local raster tile pyramid.
+"""
+
+import numpy as np
+import pytest
+
+import tile_pyramid
+from tile_pyramid import delete_raster, get_tile, ingest_raster
+
+BOUNDS = (10.0, 45.0, 10.1, 45.1)
+
+@pytest.fixture
+def raster(tmp_path):
+    path = tmp_path / "ndvi.npy"
+    np.save(path, np.linspace(-1, 1, 600 * 600, dtype=np.float32).reshape(600, 600))
+    cache_dir = str(tmp_path / "tiles")
+    meta = ingest_raster(str(path), cache_dir, bounds=BOUNDS)
+    yield cache_dir, meta
+    tile_pyramid._level_arrays.clear()
+
+def tiles_at(meta, z):
+    # XYZ tiles covering the raster's bounds at zoom z
+    west, south, east, north = meta["bounds"]
+    n = 2 ** z
+    x = int((west + 180.0) / 360.0 * n)
+    lat = np.radians((north + south) / 2)
+    y = int((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n)
+    return x, y
+
+def test_pyramid_levels_shrink_to_one_tile(raster):
+    _, meta = raster
+    assert meta["levels"][0] == [600, 600]
+    assert max(meta["levels"][-1]) <= tile_pyramid.TILE_SIZE
+
+def test_tiles_render_and_are_cached(raster):
+    cache_dir, meta = raster
+    z = meta["max_zoom"] - 2
+    x, y = tiles_at(meta, z)
+    first = get_tile(cache_dir, meta["raster_id"], z, x, y)
+    assert first[:8] == b"\x89PNG\r\n\x1a\n"
+    assert get_tile(cache_dir, meta["raster_id"], z, x, y) == first
+    assert get_tile(cache_dir, meta["raster_id"], z, 0, 0) is None
+
+def test_open_levels_are_bounded(raster, monkeypatch):
+    cache_dir, meta = raster
+    monkeypatch.setattr(tile_pyramid, "MAX_OPEN_LEVELS", 1)
+    for z in range(meta["min_zoom"], meta["max_zoom"] + 1):
+        x, y = tiles_at(meta, z)
+        get_tile(cache_dir, meta["raster_id"], z, x, y)
+        assert len(tile_pyramid._level_arrays) <= 1
+
+def test_deleted_raster_is_unknown(raster):
+    cache_dir, meta = raster
+    delete_raster(cache_dir, meta["raster_id"])
+    assert not tile_pyramid._level_arrays
+    with pytest.raises(KeyError):
+        get_tile(cache_dir, meta["raster_id"], 0, 0, 0)
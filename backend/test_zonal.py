@@ -0,0 +1,86 @@
+"""
+Tests for offline zonal NDVI statistics.
+"""
+
+import numpy as np
+import pytest
+
+from zonal import BandRaster, ZonalAccumulator, polygon_rings, rasterize_rings, zonal_ndvi_stats
+
+# A concave (U-shaped) field with a square hole in its base, in pixel units
+OUTER = [[1.3, 1.2], [18.7, 1.4], [18.2, 17.6], [13.4, 17.9], [13.1, 6.8], [6.2, 7.3], [6.6, 17.2], [1.1, 16.8], [1.3, 1.2]]
+HOLE = [[8.3, 2.4], [11.6, 2.3], [11.8, 4.7], [8.2, 4.9], [8.3, 2.4]]
+
+def point_in_polygon(x, y, rings):
+    # Brute-force even-odd test with the rasterizer's conventions: half-open in y, crossings at or left of the point
+    inside = False
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            if (y1 <= y) != (y2 <= y) and x1 + (y - y1) * (x2 - x1) / (y2 - y1) <= x:
+                inside = not inside
+    return inside
+
+@pytest.mark.parametrize("rings", [[OUTER], [OUTER, HOLE], [OUTER[::-1], HOLE]])
+def test_rasterize_matches_point_in_polygon(rings):
+    xs = np.arange(20) + 0.5
+    ys = np.arange(20) + 0.5
+    mask = rasterize_rings([np.asarray(ring, dtype=np.float64) for ring in rings], xs, ys)
+    expected = np.array([[point_in_polygon(x, y, rings) for x in xs] for y in ys])
+    np.testing.assert_array_equal(mask, expected)
+    # The notch of the U (and the hole, if there is one) is outside
+    assert not mask[10, 9]
+    assert mask[3, 9] == (len(rings) == 1)
+    assert mask[10, 3] and mask[10, 15]
+
+def test_polygon_rings_accepts_features_and_multipolygons():
+    feature = {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [OUTER, HOLE]}}
+    assert [len(polygon) for polygon in polygon_rings(feature)] == [2]
+    multipolygon = {"type": "MultiPolygon", "coordinates": [[OUTER], [HOLE]]}
+    assert [len(polygon) for polygon in polygon_rings(multipolygon)] == [1, 1]
+    with pytest.raises(ValueError):
+        polygon_rings({"type": "Point", "coordinates": [1, 2]})
+
+def test_percentiles_match_numpy():
+    values = np.random.default_rng(0).uniform(-0.6, 0.9, 10000)
+    accumulator = ZonalAccumulator()
+    for block in np.array_split(values, 7):
+        accumulator.add(block)
+    for q in (0, 10, 25, 50, 75, 90, 100):
+        assert accumulator.percentile(q) == pytest.approx(np.percentile(values, q), abs=0.002)
+
+def test_percentiles_are_clamped_to_the_values():
+    accumulator = ZonalAccumulator()
+    accumulator.add(np.full(5, 0.42))
+    assert accumulator.percentile(0) == pytest.approx(0.42)
+    assert accumulator.percentile(100) == pytest.approx(0.42)
+    assert ZonalAccumulator().percentile(50) is None
+
+def test_histogram_counts_every_value():
+    accumulator = ZonalAccumulator(histogram_bins=4)
+    accumulator.add(np.array([-1.0, -0.2, 0.0, 0.7, 1.0]))
+    result = accumulator.result()
+    assert result["histogram"]["counts"] == [1, 1, 1, 2]
+    assert result["summary"] == {"min_ndvi": -1.0, "max_ndvi": 1.0, "mean_ndvi": pytest.approx(0.1)}
+
+@pytest.fixture
+def band_raster(tmp_path):
+    # NDVI rises from left to right; one nodata pixel
+    nir = np.tile(np.arange(1, 21, dtype=np.float32), (20, 1))
+    red = np.full((20, 20), 10, dtype=np.float32)
+    red[10, 3] = -9999
+    path = tmp_path / "bands.npy"
+    np.save(path, np.stack([red, nir]))
+    with BandRaster(str(path), bounds=(0, 0, 20, 20), nodata=-9999) as raster:
+        yield raster
+
+def test_zonal_stats_only_count_pixels_inside(band_raster):
+    # Raster rows run north to south, so flip the polygon's y into map coordinates
+    geometry = {"type": "Polygon", "coordinates": [[[x, 20 - y] for x, y in ring] for ring in (OUTER, HOLE)]}
+    result = zonal_ndvi_stats(band_raster, geometry)
+    expected = np.array([[point_in_polygon(x, y, [OUTER, HOLE]) for x in np.arange(20) + 0.5] for y in np.arange(20) + 0.5])
+    assert result["pixels"]["in_polygon"] == int(expected.sum())
+    assert result["pixels"]["valid"] == int(expected.sum()) - 1
+
+def test_strips_do_not_change_the_result(band_raster):
+    geometry = {"type": "Polygon", "coordinates": [[[x, 20 - y] for x, y in OUTER]]}
+    assert zonal_ndvi_stats(band_raster, geometry, rows_per_strip=1) == zonal_ndvi_stats(band_raster, geometry)
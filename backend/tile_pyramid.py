@@ -0,0 +1,294 @@
+"""
+XYZ tile pyramid for locally processed NDVI rasters.
+
+A raster is ingested once: its NDVI band is written to disk as a uint8 .npy
+array (level 0) and repeatedly downsampled 2x2 into coarser levels until it
+fits in one tile. Every level is memory-mapped when tiles are rendered, so a
+tile only touches the pixels it samples. Rendered tiles are cached as PNG files
+next to the pyramid.
+
+Rasters are assumed to be on a regular longitude/latitude grid (EPSG:4326);
+tiles are Web Mercator XYZ tiles as used by Leaflet.
+
+Layout of TILE_CACHE_DIR/<raster_id>/:
+  meta.json                 Bounds, size, palette and level shapes
+  level_<k>.npy             NDVI bytes downsampled by 2^k
+  tiles/<z>/<x>/<y>.png     Rendered tile cache
+"""
+
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from colormap import PNG_COMPRESS_LEVEL, apply_lut, get_lut, to_ndvi_bytes
+from raster import NdviRaster, STRIP_PIXELS
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+
+# Zoom levels beyond the raster's native resolution that are still served (upsampled)
+OVERZOOM_LEVELS = 2
+
+# Memory-mapped levels kept open, keyed by path, least recently used first. Each one holds a
+# mapping and a file descriptor, so only the most recently used MAX_OPEN_LEVELS stay open
+MAX_OPEN_LEVELS = int(os.environ.get("MAX_OPEN_LEVELS", 64))
+_level_arrays = OrderedDict()
+_level_arrays_lock = threading.Lock()
+
+def raster_dir(cache_dir, raster_id):
+    # Raster IDs are hex digests, so this can't escape the cache directory
+    if not raster_id or any(c not in "0123456789abcdef" for c in raster_id):
+        raise KeyError(raster_id)
+    return os.path.join(cache_dir, raster_id)
+
+def _downsample(source, dest_path):
+    """
+    Write a 2x2 mean-downsampled copy of a 2-D uint8 array to a .npy file, strip by strip.
+    """
+    height, width = source.shape
+    dest = np.lib.format.open_memmap(dest_path, mode="w+", dtype=np.uint8, shape=((height + 1) // 2, (width + 1) // 2))
+
+    # An even number of rows per strip keeps 2x2 blocks within one strip
+    rows_per_strip = max(2, (STRIP_PIXELS // max(1, width)) // 2 * 2)
+    for y in range(0, height, rows_per_strip):
+        block = np.asarray(source[y:y + rows_per_strip], dtype=np.uint16)
+        # Odd edges are padded by repeating the last row/column
+        if block.shape[0] % 2:
+            block = np.concatenate([block, block[-1:]], axis=0)
+        if block.shape[1] % 2:
+            block = np.concatenate([block, block[:, -1:]], axis=1)
+        mean = (block[0::2, 0::2] + block[1::2, 0::2] + block[0::2, 1::2] + block[1::2, 1::2] + 2) // 4
+        dest[y // 2:y // 2 + mean.shape[0]] = mean
+
+    dest.flush()
+    return dest
+
+def _native_zoom(bounds, width):
+    """
+    Get the zoom level whose tile pixels are closest to the raster's own pixel size.
+    """
+    degrees_per_pixel = (bounds[2] - bounds[0]) / width
+    return max(0, int(round(math.log2(360.0 / (TILE_SIZE * degrees_per_pixel)))))
+
+def ingest_raster(input_path, cache_dir, bounds=None, palette="RdYlGn"):
+    """
+    Build the tile pyramid for a raw NDVI raster.
+
+    Rasters with identical content, bounds and palette share one pyramid, so
+    re-ingesting a raster is free.
+
+    Args:
+        input_path (str): Raster file (TIFF, .npy or any Pillow format)
+        cache_dir (str): Root directory of the tile cache
+        bounds (tuple): (west, south, east, north) in degrees; read from GeoTIFF tags if None
+        palette (str): Palette name or comma-separated hex colors
+
+    Returns:
+        dict: Raster metadata, including its raster_id
+    """
+    # Validates the palette before doing any work
+    get_lut(palette)
+
+    digest = hashlib.sha256()
+    with open(input_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    with NdviRaster(input_path) as raster:
+        bounds = tuple(float(v) for v in (bounds or raster.bounds or ()))
+        if len(bounds) != 4:
+            raise ValueError("Raster bounds are required (west, south, east, north) for rasters without GeoTIFF georeferencing")
+        west, south, east, north = bounds
+        if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+            raise ValueError("Bounds must be longitude/latitude degrees (EPSG:4326) with west < east and south < north")
+
+        digest.update(json.dumps({"bounds": bounds, "palette": palette}).encode("utf-8"))
+        raster_id = digest.hexdigest()[:32]
+        directory = raster_dir(cache_dir, raster_id)
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                return json.load(f)
+
+        # Build into a temporary directory so readers never see a half-built pyramid
+        building_dir = f"{directory}.building-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(building_dir, exist_ok=True)
+        try:
+            level = np.lib.format.open_memmap(
+                os.path.join(building_dir, "level_0.npy"), mode="w+", dtype=np.uint8, shape=(raster.height, raster.width)
+            )
+            for y, rows in raster.strips():
+                level[y:y + rows.shape[0]] = to_ndvi_bytes(rows)
+            level.flush()
+
+            level_shapes = [list(level.shape)]
+            while max(level.shape) > TILE_SIZE:
+                level = _downsample(level, os.path.join(building_dir, f"level_{len(level_shapes)}.npy"))
+                level_shapes.append(list(level.shape))
+            del level
+
+            native_zoom = _native_zoom(bounds, raster.width)
+            meta = {
+                "raster_id": raster_id,
+                "bounds": list(bounds),
+                "width": raster.width,
+                "height": raster.height,
+                "palette": palette,
+                "levels": level_shapes,
+                # Zoom at which the coarsest level fills about one tile (lower zooms still work)
+                "min_zoom": max(0, native_zoom - len(level_shapes) + 1),
+                "max_zoom": native_zoom + OVERZOOM_LEVELS
+            }
+            with open(os.path.join(building_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+
+            try:
+                os.rename(building_dir, directory)
+            except OSError:
+                # Another worker finished the same pyramid first
+                shutil.rmtree(building_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(building_dir, ignore_errors=True)
+            raise
+
+    logger.info(f"Built tile pyramid {raster_id} with {len(level_shapes)} levels")
+    return meta
+
+def load_meta(cache_dir, raster_id):
+    """
+    Get the metadata of an ingested raster.
+
+    Raises:
+        KeyError: If the raster does not exist
+    """
+    meta_path = os.path.join(raster_dir(cache_dir, raster_id), "meta.json")
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise KeyError(raster_id)
+
+def delete_raster(cache_dir, raster_id):
+    """
+    Remove an ingested raster, its pyramid and its cached tiles.
+
+    Raises:
+        KeyError: If the raster does not exist
+    """
+    directory = raster_dir(cache_dir, raster_id)
+    if not os.path.isdir(directory):
+        raise KeyError(raster_id)
+
+    with _level_arrays_lock:
+        for path in [path for path in _level_arrays if path.startswith(directory + os.sep)]:
+            del _level_arrays[path]
+    shutil.rmtree(directory, ignore_errors=True)
+
+def _open_level(directory, index):
+    path = os.path.join(directory, f"level_{index}.npy")
+    with _level_arrays_lock:
+        array = _level_arrays.get(path)
+        if array is not None:
+            _level_arrays.move_to_end(path)
+            return array
+
+        array = np.load(path, mmap_mode="r")
+        _level_arrays[path] = array
+        # Closing a mapping explicitly would crash renders still reading it. Dropping the cache's
+        # reference closes the mapping and its file descriptor once the last of them finishes
+        while len(_level_arrays) > MAX_OPEN_LEVELS:
+            _level_arrays.popitem(last=False)
+        return array
+
+def tile_etag(raster_id, z, x, y):
+    # Pyramids are immutable for a given raster ID, so the tile address identifies its content
+    return '"' + hashlib.sha1(f"{raster_id}/{z}/{x}/{y}".encode("utf-8")).hexdigest() + '"'
+
+def render_tile(meta, directory, z, x, y):
+    """
+    Render one XYZ tile from the pyramid level closest to the tile's resolution.
+
+    Returns:
+        bytes: PNG data, or None if the tile doesn't overlap the raster
+    """
+    west, south, east, north = meta["bounds"]
+    tiles_per_axis = 2 ** z
+
+    # Longitude and latitude of every pixel centre in the tile
+    pixel = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = (x + pixel) / tiles_per_axis * 360.0 - 180.0
+    mercator_y = math.pi * (1 - 2 * (y + pixel) / tiles_per_axis)
+    lats = np.degrees(np.arctan(np.sinh(mercator_y)))
+
+    inside_cols = (lons >= west) & (lons < east)
+    inside_rows = (lats <= north) & (lats > south)
+    if not inside_cols.any() or not inside_rows.any():
+        return None
+
+    # Use the coarsest level that still has at least one pixel per tile pixel
+    tile_degrees_per_pixel = 360.0 / (tiles_per_axis * TILE_SIZE)
+    level_index = 0
+    for index, (_, level_width) in enumerate(meta["levels"]):
+        if (east - west) / level_width <= tile_degrees_per_pixel:
+            level_index = index
+    level = _open_level(directory, level_index)
+    level_height, level_width = level.shape
+
+    cols = np.clip(((lons - west) / (east - west) * level_width).astype(np.int64), 0, level_width - 1)
+    rows = np.clip(((north - lats) / (north - south) * level_height).astype(np.int64), 0, level_height - 1)
+
+    # Nearest-neighbour sampling reads only the rows and columns the tile needs
+    ndvi_bytes = np.asarray(level[rows[:, np.newaxis], cols[np.newaxis, :]])
+
+    rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[..., :3] = apply_lut(ndvi_bytes, get_lut(meta["palette"]))
+    rgba[..., 3] = (inside_rows[:, np.newaxis] & inside_cols[np.newaxis, :]) * 255
+
+    buf = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return buf.getvalue()
+
+def get_tile(cache_dir, raster_id, z, x, y):
+    """
+    Get a tile from the on-disk tile cache, rendering and caching it on a miss.
+
+    Returns:
+        bytes: PNG data, or None if the tile is outside the raster or its zoom range
+
+    Raises:
+        KeyError: If the raster does not exist
+    """
+    meta = load_meta(cache_dir, raster_id)
+    if not (0 <= z <= meta["max_zoom"]) or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+
+    directory = raster_dir(cache_dir, raster_id)
+    tile_path = os.path.join(directory, "tiles", str(z), str(x), f"{y}.png")
+    try:
+        with open(tile_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    data = render_tile(meta, directory, z, x, y)
+    if data is None:
+        return None
+
+    # Write atomically so concurrent requests never read a partial tile
+    os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+    temp_path = f"{tile_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, tile_path)
+    return data
@@ -0,0 +1,363 @@
+"""
+Offline zonal NDVI statistics for local multispectral rasters.
+
+Red and near-infrared bands are read from a multi-band TIFF, a .npy array or
+a .npz archive, without Earth Engine. The field polygon is rasterized to a
+pixel mask with a scanline fill, and NDVI is computed and reduced in
+horizontal strips of the polygon's bounding window, so memory stays bounded
+and pixels outside the field are never read.
+
+Statistics are accumulated per strip: count, sum, min and max exactly, and
+percentiles from a fine histogram (PERCENTILE_RESOLUTION wide bins) so they
+don't need every value in memory at once.
+
+Pixel centres are tested against the polygon, whose coordinates must be in the
+raster's coordinate system (EPSG:4326 degrees for bounds passed by hand).
+"""
+
+import logging
+import os
+
+import numpy as np
+
+from raster import (
+    NPY_MAGIC, NPZ_MAGIC, STRIP_PIXELS, TIFF_MAGIC,
+    array_axes, band_count_of, geotiff_bounds, open_raster_array, select_band
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_HISTOGRAM_BINS = 20
+
+# Percentiles are read from a histogram of NDVI in bins of this width
+PERCENTILE_RESOLUTION = 0.001
+_FINE_BINS = int(round(2 / PERCENTILE_RESOLUTION))
+
+class BandRaster:
+    """
+    Read access to the red and NIR bands of a raster on disk.
+
+    Args:
+        path (str): Raster file (TIFF, .npy or .npz)
+        red_band: Band index (stacked arrays) or array name (.npz) of the red band
+        nir_band: Band index or array name of the near-infrared band
+        bounds (tuple): (west, south, east, north); read from GeoTIFF tags if None
+        nodata (float): Pixel value to ignore; read from the GDAL_NODATA tag if None
+
+    Attributes:
+        red (np.ndarray): 2-D view of the red band
+        nir (np.ndarray): 2-D view of the NIR band
+        width (int): Raster width in pixels
+        height (int): Raster height in pixels
+        bounds (tuple): (west, south, east, north), or None if unknown
+    """
+
+    def __init__(self, path, red_band=None, nir_band=None, bounds=None, nodata=None):
+        self._temp_paths = []
+        georeference = None
+
+        with open(path, "rb") as f:
+            magic = f.read(8)
+
+        if magic.startswith(NPZ_MAGIC):
+            self.red, self.nir = self._open_npz(path, red_band, nir_band)
+        elif magic.startswith(NPY_MAGIC) or magic[:4] in TIFF_MAGIC:
+            array, axes, georeference = open_raster_array(path, self._temp_paths)
+            red_band, nir_band = _band_index(red_band, 0), _band_index(nir_band, 1)
+            if band_count_of(array, axes) < 2:
+                raise ValueError("The raster needs at least a red and a NIR band")
+            self.red, self.nir = select_band(array, axes, red_band), select_band(array, axes, nir_band)
+        else:
+            raise ValueError("Unsupported raster format, expected a TIFF, .npy or .npz file")
+
+        if self.red.shape != self.nir.shape:
+            raise ValueError(f"Red and NIR bands differ in shape: {self.red.shape} and {self.nir.shape}")
+        self.height, self.width = self.red.shape
+
+        if bounds is None and georeference is not None:
+            bounds = geotiff_bounds(georeference[0], georeference[1], self.width, self.height)
+        self.bounds = tuple(float(v) for v in bounds) if bounds is not None else None
+
+        if nodata is None and georeference is not None and georeference[2] not in (None, ""):
+            nodata = float(str(georeference[2]).strip("\x00 "))
+        self.nodata = nodata
+
+    def _open_npz(self, path, red_band, nir_band):
+        # Members of a zip archive can't be memory-mapped, so they are loaded on access
+        archive = np.load(path)
+        names = list(archive.files)
+        if len(names) == 1:
+            # A single stacked array behaves like a .npy file
+            array = archive[names[0]]
+            axes = array_axes(array)
+            return select_band(array, axes, _band_index(red_band, 0)), select_band(array, axes, _band_index(nir_band, 1))
+
+        # Otherwise the bands are separate arrays, named "red" and "nir" unless given
+        red_name = str(red_band) if red_band not in (None, "") else "red"
+        nir_name = str(nir_band) if nir_band not in (None, "") else "nir"
+        missing = [name for name in (red_name, nir_name) if name not in names]
+        if missing:
+            raise ValueError(f"Array(s) {', '.join(missing)} not found in the .npz archive (it contains {', '.join(names)})")
+        return archive[red_name], archive[nir_name]
+
+    def close(self):
+        self.red = self.nir = None
+        for path in self._temp_paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove temporary raster {path}: {e}")
+        self._temp_paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _band_index(band, default):
+    if band is None or band == "":
+        return default
+    try:
+        return int(band)
+    except (TypeError, ValueError):
+        raise ValueError(f"Band must be an index for stacked rasters, got {band!r}")
+
+def polygon_rings(geometry):
+    """
+    Get the rings of a GeoJSON Polygon or MultiPolygon, grouped per polygon.
+
+    Returns:
+        list: One list of (n, 2) float arrays (outer ring, then holes) per polygon
+    """
+    if geometry.get("type") == "Feature":
+        geometry = geometry.get("geometry") or {}
+    geometry_type = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+    if geometry_type == "Polygon":
+        polygons = [coordinates]
+    elif geometry_type == "MultiPolygon":
+        polygons = coordinates
+    else:
+        raise ValueError(f"Expected a Polygon or MultiPolygon, got {geometry_type}")
+
+    rings = []
+    for polygon in polygons:
+        polygon_rings = [np.asarray([point[:2] for point in ring], dtype=np.float64) for ring in polygon if len(ring) >= 3]
+        if polygon_rings:
+            rings.append(polygon_rings)
+    if not rings:
+        raise ValueError("The polygon has no rings")
+    return rings
+
+def rasterize_rings(rings, xs, ys):
+    """
+    Rasterize one polygon (outer ring and holes) onto a grid of pixel centres.
+
+    Uses an even-odd scanline fill: for every row, the x positions where the
+    row's centre line crosses an edge are sorted, and the pixels between each
+    pair of crossings are inside.
+
+    Args:
+        rings (list): (n, 2) arrays of [x, y] positions
+        xs (np.ndarray): x of every column's pixel centre, increasing
+        ys (np.ndarray): y of every row's pixel centre
+
+    Returns:
+        np.ndarray: Boolean mask of shape (len(ys), len(xs))
+    """
+    starts = np.concatenate([ring for ring in rings])
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    x1, y1, x2, y2 = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+
+    # Half-open test so a vertex shared by two edges is only crossed once
+    y = ys[:, np.newaxis]
+    crosses = (y1 <= y) != (y2 <= y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    crossing_x = np.where(crosses, crossing_x, np.inf)
+    if crossing_x.shape[1] % 2:
+        # Rows cross an even number of edges; pad so crossings always pair up
+        crossing_x = np.pad(crossing_x, ((0, 0), (0, 1)), constant_values=np.inf)
+    crossing_x = np.sort(crossing_x, axis=1)
+
+    # Column of the first pixel centre at or right of each crossing; pairs of crossings fill [enter, leave)
+    columns = np.searchsorted(xs, crossing_x.ravel()).reshape(crossing_x.shape)
+    columns = np.where(np.isfinite(crossing_x), columns, len(xs))
+    enter, leave = columns[:, 0::2], columns[:, 1::2]
+
+    # Mark +1 where a span starts and -1 where it ends, then a running sum fills the spans
+    edges = np.zeros((len(ys), len(xs) + 1), dtype=np.int32)
+    rows = np.broadcast_to(np.arange(len(ys))[:, np.newaxis], enter.shape)
+    np.add.at(edges, (rows, enter), 1)
+    np.add.at(edges, (rows, leave), -1)
+    return np.cumsum(edges[:, :-1], axis=1) > 0
+
+def polygon_window(rings, bounds, width, height):
+    """
+    Get the pixel window (row_start, row_stop, col_start, col_stop) covering the polygons, or None.
+    """
+    west, south, east, north = bounds
+    points = np.concatenate([ring for polygon in rings for ring in polygon])
+    min_x, min_y = points.min(axis=0)
+    max_x, max_y = points.max(axis=0)
+
+    pixel_width, pixel_height = (east - west) / width, (north - south) / height
+    col_start = max(0, int(np.floor((min_x - west) / pixel_width)))
+    col_stop = min(width, int(np.ceil((max_x - west) / pixel_width)))
+    row_start = max(0, int(np.floor((north - max_y) / pixel_height)))
+    row_stop = min(height, int(np.ceil((north - min_y) / pixel_height)))
+    if col_start >= col_stop or row_start >= row_stop:
+        return None
+    return row_start, row_stop, col_start, col_stop
+
+def compute_ndvi(red, nir, nodata=None):
+    """
+    Compute NDVI of a block of red and NIR pixels.
+
+    Returns:
+        tuple: (ndvi as float32, boolean mask of pixels with a valid NDVI)
+    """
+    red = red.astype(np.float32)
+    nir = nir.astype(np.float32)
+    total = nir + red
+    valid = np.isfinite(total) & (total != 0)
+    if nodata is not None:
+        valid &= (red != nodata) & (nir != nodata)
+    ndvi = np.zeros_like(total)
+    np.divide(nir - red, total, out=ndvi, where=valid)
+    valid &= (ndvi >= -1) & (ndvi <= 1)
+    return ndvi, valid
+
+class ZonalAccumulator:
+    """
+    Running NDVI statistics over blocks of pixels.
+    """
+
+    def __init__(self, histogram_bins=DEFAULT_HISTOGRAM_BINS):
+        self.histogram_bins = histogram_bins
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.fine_counts = np.zeros(_FINE_BINS, dtype=np.int64)
+        self.counts = np.zeros(histogram_bins, dtype=np.int64)
+
+    def add(self, values):
+        if values.size == 0:
+            return
+        values = values.astype(np.float64)
+        self.count += values.size
+        self.total += float(values.sum())
+        self.total_squares += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        # NDVI of exactly 1 goes into the last bin
+        fine = np.minimum(((values + 1) / PERCENTILE_RESOLUTION).astype(np.int64), _FINE_BINS - 1)
+        self.fine_counts += np.bincount(fine, minlength=_FINE_BINS)
+        coarse = np.minimum(((values + 1) / 2 * self.histogram_bins).astype(np.int64), self.histogram_bins - 1)
+        self.counts += np.bincount(coarse, minlength=self.histogram_bins)
+
+    def percentile(self, q):
+        """
+        Get a percentile (0-100), interpolated within its histogram bin and clamped to min/max.
+        """
+        if not self.count:
+            return None
+        target = q / 100 * self.count
+        cumulative = np.cumsum(self.fine_counts)
+        index = int(np.searchsorted(cumulative, target, side="left"))
+        index = min(index, _FINE_BINS - 1)
+        below = cumulative[index - 1] if index > 0 else 0
+        in_bin = self.fine_counts[index]
+        fraction = (target - below) / in_bin if in_bin else 0.0
+        value = -1 + (index + fraction) * PERCENTILE_RESOLUTION
+        return float(min(max(value, self.min), self.max))
+
+    def result(self, percentiles=DEFAULT_PERCENTILES):
+        mean = self.total / self.count if self.count else None
+        variance = max(0.0, self.total_squares / self.count - mean ** 2) if self.count else None
+        return {
+            # Same shape as the time series summary
+            "summary": {
+                "min_ndvi": self.min if self.count else None,
+                "max_ndvi": self.max if self.count else None,
+                "mean_ndvi": mean
+            },
+            "std_ndvi": variance ** 0.5 if variance is not None else None,
+            "percentiles": {f"p{q:g}": self.percentile(q) for q in percentiles},
+            "histogram": {
+                "bin_edges": [round(-1 + 2 * i / self.histogram_bins, 6) for i in range(self.histogram_bins + 1)],
+                "counts": self.counts.tolist()
+            }
+        }
+
+def zonal_ndvi_stats(raster, geometry=None, percentiles=DEFAULT_PERCENTILES, histogram_bins=DEFAULT_HISTOGRAM_BINS, rows_per_strip=None):
+    """
+    Compute NDVI statistics of the raster pixels inside a polygon.
+
+    Args:
+        raster (BandRaster): Red and NIR bands
+        geometry (dict): GeoJSON Polygon or MultiPolygon in the raster's coordinates; the whole raster if None
+        percentiles (tuple): Percentiles to report (0-100)
+        histogram_bins (int): Number of equal-width histogram bins over NDVI -1 to 1
+        rows_per_strip (int): Rows processed at a time (from STRIP_PIXELS if None)
+
+    Returns:
+        dict: summary (min/max/mean NDVI), std, percentiles, histogram and pixel counts
+    """
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError("Percentiles must be between 0 and 100")
+    if not 1 <= histogram_bins <= 1000:
+        raise ValueError("histogram_bins must be between 1 and 1000")
+
+    accumulator = ZonalAccumulator(histogram_bins)
+    window = (0, raster.height, 0, raster.width)
+    rings = None
+
+    if geometry is not None:
+        if raster.bounds is None:
+            raise ValueError("Raster bounds are required (west, south, east, north) for rasters without GeoTIFF georeferencing")
+        rings = polygon_rings(geometry)
+        window = polygon_window(rings, raster.bounds, raster.width, raster.height)
+
+    pixels_in_polygon = 0
+    if window is not None:
+        row_start, row_stop, col_start, col_stop = window
+        if rings is not None:
+            west, south, east, north = raster.bounds
+            pixel_width, pixel_height = (east - west) / raster.width, (north - south) / raster.height
+            xs = west + (np.arange(col_start, col_stop) + 0.5) * pixel_width
+
+        if rows_per_strip is None:
+            rows_per_strip = max(1, STRIP_PIXELS // max(1, col_stop - col_start))
+        for y in range(row_start, row_stop, rows_per_strip):
+            strip_stop = min(y + rows_per_strip, row_stop)
+            ndvi, valid = compute_ndvi(
+                np.asarray(raster.red[y:strip_stop, col_start:col_stop]),
+                np.asarray(raster.nir[y:strip_stop, col_start:col_stop]),
+                raster.nodata
+            )
+            if rings is not None:
+                ys = north - (np.arange(y, strip_stop) + 0.5) * pixel_height
+                inside = np.zeros(ndvi.shape, dtype=bool)
+                for polygon in rings:
+                    inside |= rasterize_rings(polygon, xs, ys)
+                valid &= inside
+                pixels_in_polygon += int(inside.sum())
+            else:
+                pixels_in_polygon += ndvi.size
+            accumulator.add(ndvi[valid])
+
+    result = accumulator.result(percentiles)
+    result["pixels"] = {
+        "in_polygon": pixels_in_polygon,
+        "valid": accumulator.count
+    }
+    if raster.bounds is not None:
+        west, south, east, north = raster.bounds
+        result["pixel_size"] = [(east - west) / raster.width, (north - south) / raster.height]
+    return result
@@ -4,7 +4,9 @@ import { useState, useEffect, useMemo } from "react";
 import dynamic from "next/dynamic";
 import {
     createGeoJsonPolygon,
-    getNdviData,
+    getNdviDateTile,
+    streamNdviData,
+    ApiOptions,
     NdviDataResponse,
 } from "../services/api";
 import { Alert, AlertDescription } from "../components/ui/alert";
@@ -77,7 +79,7 @@ export default function GisInterface() {
             return {
                 date: item.date,
                 ndvi: item.ndvi,
-                url: item.url,
+                endDate: item.end_date,
                 temperature: weatherData?.temperature_celsius,
                 precipitation: weatherData?.precipitation_mm,
             };
@@ -114,6 +116,22 @@ export default function GisInterface() {
         setCurrentTimelineIndex(index);
     };
 
+    // Tile URLs for individual dates are only minted when a date is shown
+    const resolveTimelineTileUrl = async (data: TimelineData) => {
+        if (!selectedRegion || !ndviData) return undefined;
+
+        const tile = await getNdviDateTile(
+            createGeoJsonPolygon(selectedRegion.coordinates),
+            data.date,
+            {
+                satellite_source: ndviData.ndvi_tiles
+                    .satellite as ApiOptions["satellite_source"],
+            },
+            data.endDate
+        );
+        return tile.url;
+    };
+
     // Fetch data when a region is selected
     useEffect(() => {
         async function fetchData() {
@@ -129,14 +147,23 @@ export default function GisInterface() {
                 const geoJsonPolygon = createGeoJsonPolygon(
                     selectedRegion.coordinates
                 );
-                const response = await getNdviData(geoJsonPolygon, {
-                    start_date: startDate,
-                    end_date: endDate,
-                    time_series: true,
-                    include_weather: true,
-                    include_landcover: true,
-                    satellite_source: "sentinel-2",
-                });
+                // Show each section as it arrives; the composite comes first
+                const response = await streamNdviData(
+                    geoJsonPolygon,
+                    {
+                        start_date: startDate,
+                        end_date: endDate,
+                        time_series: true,
+                        include_weather: true,
+                        include_landcover: true,
+                        satellite_source: "sentinel-2",
+                    },
+                    (partial) => {
+                        if (!partial.ndvi_tiles) return;
+                        setNdviData(partial as NdviDataResponse);
+                        setLoading(false);
+                    }
+                );
                 setNdviData(response);
             } catch (err: unknown) {
                 setError(
@@ -205,6 +232,7 @@ export default function GisInterface() {
                         selectedRegion={selectedRegion}
                         timelineData={timelineData}
                         onTimelineChange={handleTimelineChange}
+                        resolveTileUrl={resolveTimelineTileUrl}
                         showTimeline={timelineData.length > 0}
                     />
                 </div>{" "}
@@ -27,6 +27,7 @@ type MapViewProps = {
     } | null;
     timelineData?: TimelineData[];
     onTimelineChange?: (data: TimelineData, index: number) => void;
+    resolveTileUrl?: (data: TimelineData) => Promise<string | undefined>;
     showTimeline?: boolean;
 };
 
@@ -37,6 +38,7 @@ export default function MapView({
     selectedRegion,
     timelineData = [],
     onTimelineChange,
+    resolveTileUrl,
     showTimeline = false,
 }: MapViewProps) {    const [currentNdviUrl, setCurrentNdviUrl] = useState<string | undefined>(
         ndviTileUrl
@@ -92,10 +94,41 @@ export default function MapView({
         }
     }, [pendingPolygon]);
 
+    // Tile URLs fetched for timeline dates, so revisiting a date is free
+    const resolvedTileUrlsRef = useRef<Map<string, string>>(new Map());
+    // The date most recently selected; responses for other dates arrive too late to show
+    const latestTimelineKeyRef = useRef<string | null>(null);
+
+    // URLs belong to the current region's timeline
+    useEffect(() => {
+        resolvedTileUrlsRef.current = new Map();
+        latestTimelineKeyRef.current = null;
+    }, [timelineData]);
+
     // Handle timeline changes
     const handleTimelineChange = (data: TimelineData, index: number) => {
         // Update the NDVI tile URL for the selected timestamp
-        setCurrentNdviUrl(data.url);
+        const timelineKey = `${data.date}/${data.endDate ?? ""}`;
+        latestTimelineKeyRef.current = timelineKey;
+        const resolvedUrl = data.url ?? resolvedTileUrlsRef.current.get(timelineKey);
+
+        if (resolvedUrl) {
+            setCurrentNdviUrl(resolvedUrl);
+        } else if (resolveTileUrl) {
+            const tileUrls = resolvedTileUrlsRef.current;
+            resolveTileUrl(data)
+                .then((url) => {
+                    if (!url) return;
+                    tileUrls.set(timelineKey, url);
+                    // Drop responses for dates the user has already scrubbed past
+                    if (latestTimelineKeyRef.current === timelineKey) {
+                        setCurrentNdviUrl(url);
+                    }
+                })
+                .catch((error) =>
+                    console.error("Error fetching NDVI tile for date:", error)
+                );
+        }
 
         // Notify parent component
         if (onTimelineChange) {
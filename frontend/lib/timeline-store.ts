@@ -3,7 +3,8 @@ import { create } from "zustand";
 export interface TimelineData {
     date: string;
     ndvi: number;
-    url: string;
+    url?: string; // Fetched lazily from /ndvi-tiles/date/ when the date is shown
+    endDate?: string; // End of the week or month of an aggregated point (exclusive)
     temperature?: number;
     precipitation?: number;
 }
@@ -8,15 +8,35 @@ export interface GeoJsonPolygon {
 }
 
 export interface ApiOptions {
-    satellite_source?: "sentinel-2" | "landsat-8" | "landsat-9";
+    satellite_source?: "sentinel-2" | "landsat-8" | "landsat-9" | "harmonized";
     start_date?: string;
     end_date?: string;
     time_series?: boolean;
+    aggregation?: "per-scene" | "weekly" | "monthly"; // One point per acquisition day, or a composite per week/month
     include_weather?: boolean;
+    weather_resolution?: "daily" | "weekly" | "monthly";
     include_topography?: boolean;
     include_landcover?: boolean;
 }
 
+export interface ReductionPlan {
+    scale: number; // meters
+    native_scale: number;
+    tile_scale: number;
+    best_effort: boolean;
+    max_pixels: number;
+    estimated_pixels: number;
+    area_hectares: number;
+}
+
+export interface CatalogCompositeStats {
+    image_count: number;
+    mean_ndvi: number | null;
+    min_ndvi: number | null;
+    max_ndvi: number | null;
+    scale: number;
+}
+
 export interface NdviDataResponse {
     ndvi_tiles: {
         url: string;
@@ -26,20 +46,33 @@ export interface NdviDataResponse {
         satellite: string;
         start_date: string;
         end_date: string;
+        catalog?: {
+            period: string;
+            stats: CatalogCompositeStats | null;
+            tile_expires_at: number;
+        };
     };
     time_series?: {
         data: {
             date: string;
             ndvi: number;
-            url: string;
+            end_date?: string; // Weekly/monthly aggregation: exclusive end of the period
+            image_count?: number; // Weekly/monthly aggregation: acquisition days composited
+            sensor?: "sentinel-2" | "landsat-8" | "landsat-9"; // Harmonized source, per-scene points
         }[];
         count: number;
+        aggregation?: "per-scene" | "weekly" | "monthly";
         timestamps: string[];
         summary: {
             min_ndvi: number | null;
             max_ndvi: number | null;
             mean_ndvi: number | null;
         };
+        reduction: ReductionPlan;
+        history?: {
+            fetched_ranges: [string, string][];
+            fetched_observations: number;
+        };
     };
     weather?: {
         data: {
@@ -48,6 +81,7 @@ export interface NdviDataResponse {
             precipitation_mm?: number;
         }[];
         count: number;
+        resolution: "daily" | "weekly" | "monthly";
     };
     topography?: {
         elevation: {
@@ -67,6 +101,7 @@ export interface NdviDataResponse {
             max_degrees: number;
             mean_degrees: number;
         };
+        reduction: ReductionPlan;
     };
     landcover?: {
         land_cover: {
@@ -82,6 +117,10 @@ export interface NdviDataResponse {
             non_tree_vegetation_percent: number;
             non_vegetated_percent: number;
         };
+        reduction: {
+            land_cover: ReductionPlan;
+            vegetation: ReductionPlan;
+        };
     };
 }
 
@@ -165,6 +204,125 @@ export async function getNdviData(
     }
 }
 
+/**
+ * Get NDVI and other data for a polygon, section by section as the API finishes each one
+ * @param {GeoJsonPolygon} polygon - GeoJSON polygon object
+ * @param {ApiOptions} options - Options for the API request
+ * @param {Function} onUpdate - Called with the response assembled so far after every section
+ * @returns {Promise<NdviDataResponse>} - The complete response
+ */
+export async function streamNdviData(
+    polygon: GeoJsonPolygon,
+    options: ApiOptions = {},
+    onUpdate?: (partial: Partial<NdviDataResponse>) => void
+): Promise<NdviDataResponse> {
+    const response = await fetch(`${API_BASE_URL}/ndvi-tiles/?stream=true`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+            polygon,
+            ...options,
+        }),
+    });
+
+    if (!response.ok || !response.body) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || `API error: ${response.status}`);
+    }
+
+    const result: any = {};
+    const timeSeriesPoints: { date: string; ndvi: number }[] = [];
+
+    const handleLine = (line: string) => {
+        const record = JSON.parse(line);
+        switch (record.type) {
+            case "error":
+                throw new Error(record.detail || `API error: ${record.status_code}`);
+            case "done":
+                return;
+            case "time_series_points":
+                timeSeriesPoints.push(...record.data);
+                result.time_series = {
+                    ...result.time_series,
+                    data: [...timeSeriesPoints],
+                };
+                break;
+            case "time_series":
+                result.time_series = {
+                    ...record.data,
+                    data: [...timeSeriesPoints],
+                };
+                break;
+            default:
+                result[record.type] = record.data;
+        }
+        onUpdate?.({ ...result });
+    };
+
+    // Records are newline-delimited JSON and may be split across chunks
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() ?? "";
+        lines.filter((line) => line.trim()).forEach(handleLine);
+    }
+    if (buffered.trim()) handleLine(buffered);
+
+    return result as NdviDataResponse;
+}
+
+export interface NdviDateTileResponse {
+    url: string;
+    attribution: string;
+    min: number;
+    max: number;
+    satellite: string;
+    date: string;
+    end_date: string;
+}
+
+/**
+ * Get the NDVI tile URL for a single time series date (minted on demand by the API)
+ * @param {GeoJsonPolygon} polygon - GeoJSON polygon object
+ * @param {string} date - Date to render (YYYY-MM-DD)
+ * @param {ApiOptions} options - Options for the API request (only satellite_source is used)
+ * @param {string} endDate - Optional exclusive end date, to render the median of a week or month
+ * @returns {Promise<NdviDateTileResponse>} - API response with the tile URL for that date
+ */
+export async function getNdviDateTile(
+    polygon: GeoJsonPolygon,
+    date: string,
+    options: ApiOptions = {},
+    endDate?: string
+): Promise<NdviDateTileResponse> {
+    const response = await fetch(`${API_BASE_URL}/ndvi-tiles/date/`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+            polygon,
+            satellite_source: options.satellite_source ?? "sentinel-2",
+            date,
+            end_date: endDate,
+        }),
+    });
+
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || `API error: ${response.status}`);
+    }
+
+    return await response.json();
+}
+
 /**
  * Convert a Leaflet polygon to GeoJSON format
  * @param {Array<[number, number]>} coordinates - Array of [lat, lng] coordinates